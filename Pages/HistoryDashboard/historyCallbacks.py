@@ -1,9 +1,261 @@
 from dash.dependencies import Input, Output, State
-from dash import html, dash_table
+from dash import html, dcc, dash_table
 import dash
 import dash_bootstrap_components as dbc
-from utils.db_utils import db_manager
+from Pages.PatientDetails.patientLayout import RADIO_OPTIONS
+from utils.db_utils import db_manager, TIMELINE_PAGE_SIZE
+from utils.db_backends import COHORT_DIMENSIONS, COHORT_AGE_BAND_WIDTH
+from utils.report_utils import build_report_archive
+from utils.similarity_utils import similarity_index
 from datetime import datetime
+import math
+import threading
+
+TREND_ICONS = {
+    'first': ('bi bi-flag', '#6b7280', 'First visit'),
+    'up': ('bi bi-arrow-up-right', '#ef4444', 'Risk increased'),
+    'down': ('bi bi-arrow-down-right', '#10b981', 'Risk decreased'),
+    'stable': ('bi bi-arrow-right', '#6b7280', 'Risk stable')
+}
+
+# Last dashboard this worker read from the database, served while the database is unreachable
+_last_dashboard = {}
+
+# Last cohort breakdowns, patients and timeline pages read, by their inputs, served the same way
+STALE_READS_LIMIT = 256
+_last_reads = {}
+_last_reads_lock = threading.Lock()
+
+
+def _format_change(value, unit="", precision=0):
+    """Format a change since the previous visit, or a dash for the first visit"""
+    if value is None:
+        return "—"
+    return f"{value:+.{precision}f}{unit}"
+
+
+def _create_timeline_display(timeline):
+    """Create the risk trend chart and visit table for one page of a patient's timeline"""
+    visits = timeline['visits']
+    if not visits:
+        return ""
+    
+    # Visits arrive newest first; plot them in time order
+    chronological = list(reversed(visits))
+    figure = {
+        'data': [{
+            'type': 'scatter',
+            'mode': 'lines+markers',
+            'x': [visit['assessment_date'] for visit in chronological],
+            'y': [visit['risk_probability'] for visit in chronological],
+            'line': {'color': '#4f46e5', 'width': 2},
+            'marker': {'size': 9, 'color': ['#ef4444' if visit['risk_level'] == 'High Risk' else '#10b981'
+                                            for visit in chronological]},
+            'hovertemplate': '%{x|%Y-%m-%d}: %{y:.1f}%<extra></extra>'
+        }],
+        'layout': {
+            'margin': {'l': 10, 'r': 10, 't': 10, 'b': 40},
+            'height': 240,
+            'yaxis': {'title': {'text': 'Risk probability (%)'}, 'range': [0, 100], 'automargin': True},
+            'shapes': [{'type': 'line', 'xref': 'paper', 'x0': 0, 'x1': 1, 'y0': 50, 'y1': 50,
+                        'line': {'color': '#9ca3af', 'dash': 'dash', 'width': 1}}],
+            'plot_bgcolor': 'rgba(0,0,0,0)',
+            'paper_bgcolor': 'rgba(0,0,0,0)'
+        }
+    }
+    
+    rows = []
+    for visit in visits:
+        icon, color, label = TREND_ICONS[visit['trend']]
+        days = visit['days_since_previous']
+        rows.append(html.Tr([
+            html.Td(visit['visit_number']),
+            html.Td(visit['assessment_date'].strftime('%Y-%m-%d') if isinstance(visit['assessment_date'], datetime) else str(visit['assessment_date'])),
+            html.Td(f"{visit['risk_probability']:.1f}%"),
+            html.Td([html.I(className=icon, style={'color': color}, title=label), " ",
+                     _format_change(visit['risk_change'], " pts", 1)]),
+            html.Td(_format_change(visit['risk_change_since_first'], " pts", 1)),
+            html.Td(f"{days:.0f} days" if days is not None else "—"),
+            html.Td(_format_change(visit['trestbps_change'])),
+            html.Td(_format_change(visit['chol_change'])),
+            html.Td(_format_change(visit['thalachh_change'])),
+            html.Td(_format_change(visit['oldpeak_change'], precision=1))
+        ]))
+    
+    return html.Div([
+        html.Hr(),
+        html.H5(f"Risk Timeline ({timeline['total_visits']} visits)", className="mb-3"),
+        dcc.Graph(figure=figure, config={'displayModeBar': False}),
+        dbc.Table([
+            html.Thead(html.Tr([html.Th(label) for label in [
+                "Visit", "Date", "Risk", "Change", "Since First", "Interval",
+                "Δ BP", "Δ Chol", "Δ Max HR", "Δ ST Dep."
+            ]])),
+            html.Tbody(rows)
+        ], size="sm", hover=True, responsive=True, className="mb-0", style={'fontSize': '0.85rem'})
+    ])
+
+
+def _create_similar_patients_display(similar):
+    """Create the table of the nearest past patients and their outcomes"""
+    if similar is None:
+        return html.Div([
+            html.Hr(),
+            html.P("Similar patients will be shown once the index has been built.",
+                   className="text-muted mb-0", style={'fontSize': '0.85rem'})
+        ])
+    if not similar:
+        return ""
+    
+    rows = []
+    for match in similar:
+        patient = match['patient']
+        if match['source'] == 'training':
+            who = html.Span("Training dataset", className="text-muted")
+            outcome = html.Span("Heart disease" if match['target'] == 1 else "No heart disease",
+                                style={'color': '#ef4444' if match['target'] == 1 else '#10b981'})
+        else:
+            who = f"{patient['patient_name']} ({patient['patient_id']})"
+            outcome = html.Span(f"{patient['risk_level']} ({patient['risk_probability']:.1f}%)",
+                                style={'color': '#ef4444' if patient['risk_level'] == 'High Risk' else '#10b981'})
+        rows.append(html.Tr([
+            html.Td(who),
+            html.Td(f"{patient['age']:.0f}"),
+            html.Td("Male" if patient['sex'] == 1 else "Female"),
+            html.Td(outcome),
+            html.Td(f"{match['distance']:.2f}")
+        ]))
+    
+    return html.Div([
+        html.Hr(),
+        html.H5("Similar Patients", className="mb-1"),
+        html.P("Nearest past patients across all 13 clinical inputs, as scaled for the model.",
+               className="text-muted mb-3", style={'fontSize': '0.85rem'}),
+        dbc.Table([
+            html.Thead(html.Tr([html.Th(label) for label in ["Patient", "Age", "Sex", "Outcome", "Distance"]])),
+            html.Tbody(rows)
+        ], size="sm", hover=True, responsive=True, className="mb-0", style={'fontSize': '0.85rem'})
+    ])
+
+
+def _cohort_value_label(dimension, value):
+    """Readable label for a value of a cohort cube dimension"""
+    if dimension == 'age_band':
+        return f"{value}-{value + COHORT_AGE_BAND_WIDTH - 1}"
+    if dimension in ('sex', 'cp'):
+        labels = {option['value']: option['label'] for option in RADIO_OPTIONS[dimension]}
+        return labels.get(value, str(value))
+    return str(value)
+
+
+def _create_cohort_figure(dimension, breakdown):
+    """Create the assessment count and mean risk chart for one cohort dimension"""
+    labels = [_cohort_value_label(dimension, row['value']) for row in breakdown]
+    values = [row['value'] for row in breakdown]
+    
+    return {
+        'data': [
+            {'type': 'bar', 'name': 'Assessments', 'x': labels, 'customdata': values,
+             'y': [row['assessment_count'] for row in breakdown],
+             'marker': {'color': '#818cf8'}},
+            {'type': 'scatter', 'mode': 'lines+markers', 'name': 'Mean Risk %', 'x': labels, 'yaxis': 'y2',
+             'customdata': values, 'y': [row['mean_risk_probability'] for row in breakdown],
+             'line': {'color': '#ef4444', 'width': 2}}
+        ],
+        'layout': {
+            'margin': {'l': 10, 'r': 10, 't': 10, 'b': 30},
+            'height': 260,
+            'xaxis': {'type': 'category'},
+            'yaxis': {'title': {'text': 'Assessments'}, 'automargin': True},
+            'yaxis2': {'title': {'text': 'Mean risk (%)'}, 'overlaying': 'y', 'side': 'right',
+                       'range': [0, 100], 'showgrid': False, 'automargin': True},
+            'legend': {'orientation': 'h', 'y': 1.15},
+            'plot_bgcolor': 'rgba(0,0,0,0)',
+            'paper_bgcolor': 'rgba(0,0,0,0)'
+        }
+    }
+
+
+def _create_trend_figure(daily_trend):
+    """Create the stacked daily assessment counts and mean risk chart from the daily rollup"""
+    counts = {'High Risk': {}, 'Low Risk': {}}
+    weighted_risk = {}
+    for row in daily_trend:
+        day = str(row['day'])
+        counts.setdefault(row['risk_level'], {})[day] = row['assessment_count']
+        total, risk_sum = weighted_risk.get(day, (0, 0.0))
+        weighted_risk[day] = (total + row['assessment_count'],
+                              risk_sum + row['mean_risk_probability'] * row['assessment_count'])
+    days = sorted(weighted_risk)
+    
+    return {
+        'data': [
+            {'type': 'bar', 'name': 'High Risk', 'x': days, 'y': [counts['High Risk'].get(day, 0) for day in days],
+             'marker': {'color': '#ef4444'}},
+            {'type': 'bar', 'name': 'Low Risk', 'x': days, 'y': [counts['Low Risk'].get(day, 0) for day in days],
+             'marker': {'color': '#10b981'}},
+            {'type': 'scatter', 'mode': 'lines', 'name': 'Mean Risk %', 'x': days, 'yaxis': 'y2',
+             'y': [weighted_risk[day][1] / weighted_risk[day][0] for day in days],
+             'line': {'color': '#4f46e5', 'width': 2}}
+        ],
+        'layout': {
+            'barmode': 'stack',
+            'margin': {'l': 10, 'r': 10, 't': 10, 'b': 30},
+            'height': 240,
+            'yaxis': {'title': {'text': 'Assessments'}, 'automargin': True},
+            'yaxis2': {'title': {'text': 'Mean risk (%)'}, 'overlaying': 'y', 'side': 'right',
+                       'range': [0, 100], 'showgrid': False, 'automargin': True},
+            'legend': {'orientation': 'h', 'y': 1.15},
+            'plot_bgcolor': 'rgba(0,0,0,0)',
+            'paper_bgcolor': 'rgba(0,0,0,0)'
+        }
+    }
+
+
+def _stale_text(read_at):
+    if read_at:
+        return f"Database unreachable - showing data as of {read_at:%H:%M:%S}."
+    return "Database unreachable - no data has been loaded yet."
+
+
+def _stale_dashboard():
+    """The last dashboard read from the database, with a notice that it is out of date"""
+    read_at = _last_dashboard.get('read_at')
+    notice = dbc.Alert([
+        html.I(className="bi bi-cloud-slash me-2"),
+        _stale_text(read_at),
+        " New assessments are still scored, and this view refreshes on its own once the database is back."
+    ], color="warning", className="mb-3")
+    
+    outputs = _last_dashboard.get('outputs')
+    if outputs is None:
+        outputs = (html.Div(), "-", "-", "-", _create_trend_figure([]))
+    return (*outputs, notice)
+
+
+def _read_or_last(key, read):
+    """Run read() and keep its result under key; while the circuit breaker is open, or if the read failed,
+    return the last result kept instead.
+    
+    Returns (result, stale, read_at): stale is True for a kept result (read at read_at) or, with no result kept,
+    for (None, True, None).
+    """
+    if db_manager.is_available():
+        # Counted for this thread only, so another request's failure cannot mark this read as failed
+        failures_before = db_manager.failure_count()
+        result = read()
+        if db_manager.failure_count() == failures_before:
+            with _last_reads_lock:
+                _last_reads.pop(key, None)
+                _last_reads[key] = (result, datetime.now())
+                if len(_last_reads) > STALE_READS_LIMIT:
+                    del _last_reads[next(iter(_last_reads))]
+            return result, False, None
+    
+    with _last_reads_lock:
+        result, read_at = _last_reads.get(key, (None, None))
+    return result, True, read_at
+
 
 def historyCallbacks(app):
     """Register callbacks for the history dashboard"""
@@ -13,6 +265,8 @@ def historyCallbacks(app):
         Output('total-assessments', 'children'),
         Output('high-risk-count', 'children'),
         Output('low-risk-count', 'children'),
+        Output('history-trend-graph', 'figure'),
+        Output('history-stale-notice', 'children'),
         Input('search-button', 'n_clicks'),
         Input('show-all-button', 'n_clicks'),
         Input('history-refresh-interval', 'n_intervals'),
@@ -23,21 +277,39 @@ def historyCallbacks(app):
     def update_history_table(search_clicks, show_all_clicks, n_intervals, prediction_data, search_term):
         """Update the history table based on search or show all"""
         
+        # Fail fast to the last dashboard read while the database circuit breaker is open; the counters and
+        # trend always come from the primary
+        if not db_manager.is_available():
+            return _stale_dashboard()
+        failures_before = db_manager.failure_count()
+        
+        # Reads may come from a replica, but never from one that has not yet applied this session's last save
+        min_position = (prediction_data or {}).get('write_position')
+        
         # Determine which button was clicked
         ctx = dash.callback_context
+        searching = False
         if ctx.triggered:
             button_id = ctx.triggered[0]['prop_id'].split('.')[0]
             if button_id == 'search-button' and search_term:
-                assessments = db_manager.search_patients(search_term)
+                assessments = db_manager.search_patients(search_term, min_position)
+                searching = True
             else:
-                assessments = db_manager.get_all_assessments()
+                assessments = db_manager.get_all_assessments(min_position)
         else:
-            assessments = db_manager.get_all_assessments()
+            assessments = db_manager.get_all_assessments(min_position)
         
-        # Calculate stats
-        total_count = len(assessments)
-        high_risk_count = sum(1 for a in assessments if a['risk_level'] == 'High Risk')
-        low_risk_count = sum(1 for a in assessments if a['risk_level'] == 'Low Risk')
+        # Calculate stats; overall counters come from the daily rollup rather than the raw rows
+        if searching:
+            high_risk_count = sum(1 for a in assessments if a['risk_level'] == 'High Risk')
+            low_risk_count = sum(1 for a in assessments if a['risk_level'] == 'Low Risk')
+            total_count = len(assessments)
+        else:
+            totals = db_manager.get_risk_level_totals()
+            high_risk_count = totals.get('High Risk', 0)
+            low_risk_count = totals.get('Low Risk', 0)
+            total_count = sum(totals.values())
+        trend_figure = _create_trend_figure(db_manager.get_daily_trend())
         
         # Create table if we have data
         if not assessments:
@@ -109,39 +381,104 @@ def historyCallbacks(app):
                 page_action='native'
             )
         
-        return table, str(total_count), str(high_risk_count), str(low_risk_count)
+        outputs = (table, str(total_count), str(high_risk_count), str(low_risk_count), trend_figure)
+        
+        # A read that failed part-way returned empty results, not the real dashboard
+        if db_manager.failure_count() != failures_before:
+            return _stale_dashboard()
+        if not searching:
+            _last_dashboard.update(outputs=outputs, read_at=datetime.now())
+        return (*outputs, None)
+    
+    @app.callback(
+        Output('cohort-graph', 'figure'),
+        Output('cohort-summary', 'children'),
+        Input('cohort-group-by', 'value'),
+        *[Input(f'cohort-filter-{dimension}', 'value') for dimension in COHORT_DIMENSIONS],
+        Input('history-refresh-interval', 'n_intervals'),
+        Input('prediction-store', 'data')
+    )
+    def update_cohort_drilldown(group_by, *args):
+        """Slice the cohort cube by the selected filters and group"""
+        filters = dict(zip(COHORT_DIMENSIONS, args))
+        
+        # Reads the pre-aggregated cube, never the patients table
+        key = ('cohort', group_by, tuple(tuple(filters[dimension] or ()) for dimension in COHORT_DIMENSIONS))
+        breakdown, stale, read_at = _read_or_last(key, lambda: db_manager.get_cohort_breakdown(group_by, filters))
+        if breakdown is None:
+            return _create_cohort_figure(group_by, []), _stale_text(read_at)
+        
+        total = sum(row['assessment_count'] for row in breakdown)
+        if not total:
+            summary = "No matching assessments"
+        else:
+            mean_risk = sum(row['mean_risk_probability'] * row['assessment_count'] for row in breakdown) / total
+            summary = f"{total} assessments, mean risk {mean_risk:.1f}%"
+        if stale:
+            summary = f"{summary} - {_stale_text(read_at)}"
+        return _create_cohort_figure(group_by, breakdown), summary
+    
+    @app.callback(
+        *[Output(f'cohort-filter-{dimension}', 'value') for dimension in COHORT_DIMENSIONS],
+        Output('cohort-group-by', 'value'),
+        Input('cohort-graph', 'clickData'),
+        State('cohort-group-by', 'value'),
+        *[State(f'cohort-filter-{dimension}', 'value') for dimension in COHORT_DIMENSIONS],
+        prevent_initial_call=True
+    )
+    def drill_into_cohort(click_data, group_by, *current_filters):
+        """Filter to the clicked group, then group by the next dimension not yet filtered"""
+        if not click_data or not click_data.get('points'):
+            raise dash.exceptions.PreventUpdate
+        
+        filters = dict(zip(COHORT_DIMENSIONS, current_filters))
+        filters[group_by] = [click_data['points'][0]['customdata']]
+        
+        next_group_by = next((dimension for dimension in COHORT_DIMENSIONS if not filters[dimension]), group_by)
+        return (*[filters[dimension] if dimension == group_by else dash.no_update for dimension in COHORT_DIMENSIONS],
+                next_group_by)
     
     @app.callback(
         Output('patient-detail-modal', 'is_open'),
         Output('patient-detail-modal-body', 'children'),
+        Output('timeline-patient-id', 'data'),
+        Output('timeline-pagination', 'active_page'),
         Input('history-table', 'selected_rows'),
         Input('close-detail-modal', 'n_clicks'),
         State('history-table', 'data'),
         State('patient-detail-modal', 'is_open'),
+        State('prediction-store', 'data'),
         prevent_initial_call=True
     )
-    def toggle_patient_detail_modal(selected_rows, close_clicks, table_data, is_open):
+    def toggle_patient_detail_modal(selected_rows, close_clicks, table_data, is_open, prediction_data):
         """Show detailed patient information in a modal"""
         
         ctx = dash.callback_context
         if not ctx.triggered:
-            return False, ""
+            return False, "", None, 1
         
         button_id = ctx.triggered[0]['prop_id'].split('.')[0]
         
         if button_id == 'close-detail-modal':
-            return False, ""
+            return False, "", None, 1
         
         if button_id == 'history-table' and selected_rows:
             # Get the selected patient's ID
             selected_patient_id = table_data[selected_rows[0]]['ID']
             
             # Fetch full patient details from database
-            patient = db_manager.get_patient_by_id(selected_patient_id)
+            patient, stale, read_at = _read_or_last(
+                ('patient', selected_patient_id),
+                lambda: db_manager.get_patient_by_id(selected_patient_id, (prediction_data or {}).get('write_position'))
+            )
+            
+            if not patient and stale:
+                return True, dbc.Alert(_stale_text(read_at), color="warning"), None, 1
             
             if patient:
                 # Create detailed view
                 detail_content = html.Div([
+                    *([dbc.Alert(_stale_text(read_at), color="warning", className="mb-3")] if stale else []),
                     dbc.Row([
                         dbc.Col([
                             html.H4(patient['patient_name'], className="mb-3"),
@@ -181,9 +518,75 @@ def historyCallbacks(app):
                             html.P([html.Strong("Major Vessels: "), str(patient['ca'])]),
                             html.P([html.Strong("Thalassemia: "), str(patient['thal'])]),
                         ], width=6)
-                    ])
+                    ]),
+                    _create_similar_patients_display(similarity_index.find_similar(patient))
                 ])
                 
-                return True, detail_content
+                return True, detail_content, selected_patient_id, 1
+        
+        return is_open, "", None, 1
+    
+    @app.callback(
+        Output('patient-timeline-container', 'children'),
+        Output('timeline-pagination', 'max_value'),
+        Output('timeline-pagination', 'style'),
+        Input('timeline-patient-id', 'data'),
+        Input('timeline-pagination', 'active_page'),
+        prevent_initial_call=True
+    )
+    def update_patient_timeline(patient_id, active_page):
+        """Show one page of the selected patient's assessment history"""
+        if not patient_id:
+            return "", 1, {'display': 'none'}
+        
+        page = active_page or 1
+        timeline, stale, read_at = _read_or_last(('timeline', patient_id, page),
+                                                 lambda: db_manager.get_patient_timeline(patient_id, page=page))
+        if timeline is None:
+            return dbc.Alert(_stale_text(read_at), color="warning", className="mt-3"), 1, {'display': 'none'}
+        
+        page_count = max(1, math.ceil(timeline['total_visits'] / TIMELINE_PAGE_SIZE))
+        pagination_style = {'display': 'flex'} if page_count > 1 else {'display': 'none'}
+        
+        display = _create_timeline_display(timeline)
+        if stale:
+            display = html.Div([dbc.Alert(_stale_text(read_at), color="warning", className="mt-3"), display])
+        return display, page_count, pagination_style
+    
+    @app.callback(
+        Output('report-export-status', 'children'),
+        Input('start-report-export', 'n_clicks'),
+        State('report-date-range', 'start_date'),
+        State('report-date-range', 'end_date'),
+        background=True,
+        running=[
+            (Output('start-report-export', 'disabled'), True, False),
+            (Output('cancel-report-export', 'disabled'), False, True)
+        ],
+        progress=[
+            Output('report-export-progress', 'value'),
+            Output('report-export-progress', 'label')
+        ],
+        cancel=[Input('cancel-report-export', 'n_clicks')],
+        prevent_initial_call=True
+    )
+    def export_reports(set_progress, n_clicks, start_date, end_date):
+        """Render all reports in the selected date range into a ZIP archive"""
+        if not start_date or not end_date:
+            return "Select a start and end date to export reports."
+        
+        def report_progress(completed, total):
+            percent = int(completed * 100 / total) if total else 100
+            set_progress((percent, f"{completed} / {total}"))
+        
+        try:
+            archive_id, report_count = build_report_archive(start_date, end_date,
+                                                            progress_callback=report_progress)
+        except Exception as e:
+            print(f"Error exporting bulk reports: {e}")
+            return f"Export failed: {e}"
         
-        return is_open, ""
\ No newline at end of file
+        return html.Span([
+            f"{report_count} reports ready. ",
+            html.A("Download ZIP", href=f"/reports/bulk/{archive_id}/download")
+        ])
@@ -1,5 +1,21 @@
 from dash import html, dcc
 import dash_bootstrap_components as dbc
+from Pages.PatientDetails.patientLayout import RADIO_OPTIONS
+
+# Age bands offered by the cohort drill-down, labelled by decade
+AGE_BAND_OPTIONS = [{'label': f"{band}-{band + 9}", 'value': band} for band in range(20, 90, 10)]
+
+RISK_LEVEL_OPTIONS = [
+    {'label': 'High Risk', 'value': 'High Risk'},
+    {'label': 'Low Risk', 'value': 'Low Risk'}
+]
+
+COHORT_GROUP_OPTIONS = [
+    {'label': 'Age Band', 'value': 'age_band'},
+    {'label': 'Sex', 'value': 'sex'},
+    {'label': 'Chest Pain', 'value': 'cp'},
+    {'label': 'Risk Level', 'value': 'risk_level'}
+]
 
 historyLayout = html.Div([
     # Header
@@ -11,6 +27,9 @@ historyLayout = html.Div([
         ], width=12)
     ]),
     
+    # Shown while the database is unreachable and the dashboard is out of date
+    html.Div(id="history-stale-notice"),
+    
     # Search Bar
     dbc.Row([
         dbc.Col([
@@ -74,8 +93,89 @@ historyLayout = html.Div([
             ], style={'borderRadius': '12px', 'boxShadow': '0 4px 6px rgba(0,0,0,0.1)'})
         ], width=4)
     ], className="mb-4"),
+
+    # Daily Assessment Trend
+    dbc.Card([
+        dbc.CardBody([
+            html.H6("Daily Assessments", className="mb-2 text-muted"),
+            dcc.Graph(id="history-trend-graph", config={'displayModeBar': False})
+        ])
+    ], className="mb-4", style={'borderRadius': '12px', 'boxShadow': '0 4px 6px rgba(0,0,0,0.1)'}),
+
+    # Cohort Drill-down
+    dbc.Card([
+        dbc.CardBody([
+            html.H6("Cohort Drill-down", className="mb-3 text-muted"),
+            dbc.Row([
+                dbc.Col([
+                    dcc.Dropdown(id="cohort-filter-age_band", options=AGE_BAND_OPTIONS, multi=True,
+                                 placeholder="All ages")
+                ], width=3),
+                dbc.Col([
+                    dcc.Dropdown(id="cohort-filter-sex", options=RADIO_OPTIONS['sex'], multi=True,
+                                 placeholder="All sexes")
+                ], width=3),
+                dbc.Col([
+                    dcc.Dropdown(id="cohort-filter-cp", options=RADIO_OPTIONS['cp'], multi=True,
+                                 placeholder="All chest pain types")
+                ], width=3),
+                dbc.Col([
+                    dcc.Dropdown(id="cohort-filter-risk_level", options=RISK_LEVEL_OPTIONS, multi=True,
+                                 placeholder="All risk levels")
+                ], width=3)
+            ], className="mb-3"),
+            dbc.Row([
+                dbc.Col([
+                    dbc.RadioItems(id="cohort-group-by", options=COHORT_GROUP_OPTIONS, value='age_band', inline=True)
+                ], width=8),
+                dbc.Col([
+                    html.Div(id="cohort-summary", className="text-muted text-end", style={'fontSize': '0.85rem'})
+                ], width=4)
+            ], className="align-items-center"),
+            dcc.Graph(id="cohort-graph", config={'displayModeBar': False}),
+            html.P("Click a bar to drill into it.", className="text-muted mb-0", style={'fontSize': '0.8rem'})
+        ])
+    ], className="mb-4", style={'borderRadius': '12px', 'boxShadow': '0 4px 6px rgba(0,0,0,0.1)'}),
     
-    
+    # Bulk Report Export
+    dbc.Card([
+        dbc.CardBody([
+            html.H6("Bulk Report Export", className="mb-3 text-muted"),
+            dbc.Row([
+                dbc.Col([
+                    dcc.DatePickerRange(
+                        id="report-date-range",
+                        display_format="YYYY-MM-DD",
+                        start_date_placeholder_text="From",
+                        end_date_placeholder_text="To"
+                    )
+                ], width=6),
+                dbc.Col([
+                    dbc.Button(
+                        "Export Reports",
+                        id="start-report-export",
+                        color="success",
+                        className="w-100",
+                        style={'borderRadius': '8px'}
+                    )
+                ], width=3),
+                dbc.Col([
+                    dbc.Button(
+                        "Cancel",
+                        id="cancel-report-export",
+                        color="secondary",
+                        className="w-100",
+                        disabled=True,
+                        style={'borderRadius': '8px'}
+                    )
+                ], width=3)
+            ], className="mb-3 align-items-center"),
+            dbc.Progress(id="report-export-progress", value=0, striped=True, animated=True,
+                         className="mb-2", style={'height': '18px'}),
+            html.Div(id="report-export-status", className="text-muted", style={'fontSize': '0.85rem'})
+        ])
+    ], className="mb-4", style={'borderRadius': '12px', 'boxShadow': '0 4px 6px rgba(0,0,0,0.1)'}),
+
     # Patient History Table
     dbc.Row([
         dbc.Col([
@@ -86,7 +186,13 @@ historyLayout = html.Div([
     # Modal for viewing detailed patient info
     dbc.Modal([
         dbc.ModalHeader(dbc.ModalTitle("Patient Details")),
-        dbc.ModalBody(id="patient-detail-modal-body"),
+        dbc.ModalBody([
+            html.Div(id="patient-detail-modal-body"),
+            html.Div(id="patient-timeline-container"),
+            dbc.Pagination(id="timeline-pagination", active_page=1, max_value=1, fully_expanded=False,
+                           className="justify-content-center mt-3", style={'display': 'none'}),
+            dcc.Store(id="timeline-patient-id")
+        ]),
         dbc.ModalFooter([
             dbc.Button("Close", id="close-detail-modal", className="ms-auto")
         ])
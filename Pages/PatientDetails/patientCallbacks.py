@@ -3,12 +3,16 @@ Patient Details Callbacks
 Handles patient input, validation, prediction, field preservation, and database storage.
 """
 
+import json
 from dash.dependencies import Input, Output, State
 from dash import html
 import dash_bootstrap_components as dbc
 from dash import no_update
 from utils.model_utils import predictor
-from utils.db_utils import db_manager
+from utils.db_utils import db_manager, make_idempotency_key
+from utils.submission_utils import FIELD_RANGES, submission_date
+from utils.cohort_utils import cohort_ranker
+from utils.similarity_utils import similarity_index
 
 # Field names for validation messages
 FIELD_NAMES = [
@@ -25,23 +29,6 @@ FIELD_IDS = [
     'patient-exang', 'patient-oldpeak', 'patient-slope', 'patient-ca', 'patient-thal'
 ]
 
-# Field ranges for validation
-FIELD_RANGES = {
-    'age': (1, 120),
-    'sex': (0, 1),
-    'cp': (0, 3),
-    'trestbps': (50, 250),
-    'chol': (30, 1000),
-    'fbs': (0, 1),
-    'restecg': (0, 2),
-    'thalachh': (40, 220),
-    'exang': (0, 1),
-    'oldpeak': (0, 6.2),
-    'slope': (0, 2),
-    'ca': (0, 4),
-    'thal': (0, 3)
-}
-
 # Field keys corresponding to FIELD_NAMES
 FIELD_KEYS = [
     'age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg',
@@ -98,6 +85,7 @@ def patientCallbacks(app):
         Output('patient-output', 'children'),
         Output('prediction-store', 'data'),
         Output('field-values-store', 'data'),
+        Output('submission-ack-store', 'data'),
         Output('patient-name', 'value'),
         Output('patient-id-input', 'value'),
         # Inline error outputs for each field
@@ -116,7 +104,7 @@ def patientCallbacks(app):
         Output('error-patient-slope', 'children'),
         Output('error-patient-ca', 'children'),
         Output('error-patient-thal', 'children'),
-        Input('patient-button', 'n_clicks'),
+        Input('submission-store', 'data'),
         State('patient-name', 'value'),
         State('patient-id-input', 'value'),
         State('patient-age', 'value'),
@@ -135,14 +123,18 @@ def patientCallbacks(app):
         State('prediction-store', 'data'),
         prevent_initial_call=True
     )
-    def predict_heart_disease(n_clicks, patient_name, patient_id, age, sex, cp, 
+    def predict_heart_disease(submission, patient_name, patient_id, age, sex, cp, 
                              trestbps, chol, fbs, restecg, thalachh, exang, 
                              oldpeak, slope, ca, thal, previous_data):
         """Handle prediction request with validation, duplicate check, and database storage."""
         
         print("=" * 50)
         print("PREDICTION CALLBACK TRIGGERED")
-        print(f"Button clicks: {n_clicks}")
+        print(f"Submission: {submission}")
+        
+        # The browser's outbox copy of this submission, dropped once it needs no retry
+        client_id = (submission or {}).get('client_id')
+        submitted_at = (submission or {}).get('submitted_at')
         
         # Initialize all error messages as empty
         error_messages = [""] * 15  # 15 fields total (2 patient info + 13 medical)
@@ -191,6 +183,7 @@ def patientCallbacks(app):
                 "",  # No main error message
                 previous_data,
                 field_values,
+                client_id,  # Invalid, so never worth retrying
                 no_update,  # Don't clear name
                 no_update,  # Don't clear ID
                 *error_messages  # Spread all error messages
@@ -213,6 +206,7 @@ def patientCallbacks(app):
                     ], color="warning"),
                     previous_data,
                     field_values,
+                    client_id,
                     no_update,  # Don't clear name
                     no_update,  # Don't clear ID
                     *[""] * 15  # Clear all error messages
@@ -222,6 +216,33 @@ def patientCallbacks(app):
         features = [age, sex, cp, trestbps, chol, fbs, restecg,
                    thalachh, exang, oldpeak, slope, ca, thal]
         
+        # Return the stored result for a repeat from another tab, a reload or a double post
+        idempotency_key = make_idempotency_key(patient_id, features)
+        submitted_date = submission_date(submitted_at)
+        stored_result = db_manager.get_submission(idempotency_key, submitted_date)
+        if stored_result:
+            print("Duplicate submission detected (already saved)")
+            return (
+                dbc.Alert([
+                    html.H5("Patient Already Diagnosed", className="alert-heading"),
+                    html.P("Patient already diagnosed and results are displayed below.")
+                ], color="warning"),
+                {
+                    'prediction': stored_result['prediction'],
+                    'risk_probability': stored_result['risk_probability'],
+                    'risk_level': stored_result['risk_level'],
+                    'model_version': stored_result['model_version'],
+                    'patient_data': current_submission,
+                    'patient_name': patient_name.strip(),
+                    'patient_id': patient_id.strip()
+                },
+                field_values,
+                client_id,
+                no_update,  # Don't clear name
+                no_update,  # Don't clear ID
+                *[""] * 15  # Clear all error messages
+            )
+        
         print(f"Making prediction with features: {features}")
         
         # Make prediction
@@ -236,6 +257,7 @@ def patientCallbacks(app):
                 ], color="danger"),
                 previous_data,
                 field_values,
+                no_update,  # Keep it queued for a retry
                 no_update,  # Don't clear name
                 no_update,  # Don't clear ID
                 *[""] * 15  # Clear all error messages
@@ -262,7 +284,7 @@ def patientCallbacks(app):
         
         # Save to database
         print("Attempting to save assessment to database...")
-        save_success = db_manager.save_patient_assessment(patient_data_for_db, result)
+        save_success = db_manager.save_patient_assessment(patient_data_for_db, result, idempotency_key, submitted_date)
         
         if not save_success:
             print("WARNING: Failed to save assessment to database")
@@ -272,30 +294,41 @@ def patientCallbacks(app):
                     html.H5("Prediction Complete (Database Warning)", className="alert-heading"),
                     html.P(f"Risk Level: {result['risk_level']}"),
                     html.P("Note: Assessment could not be saved to history database."),
+                    *([html.P("It is kept in this browser and will be saved automatically once the database "
+                              "is reachable.")] if client_id else []),
                     html.P("Scroll down to view detailed results...")
                 ], color="warning"),
                 {
                     'prediction': result['prediction'],
                     'risk_probability': result['risk_probability'],
                     'risk_level': result['risk_level'],
+                    'model_version': result.get('model_version'),
                     'patient_data': current_submission,
                     'patient_name': patient_name.strip(),
                     'patient_id': patient_id.strip()
                 },
                 field_values,
+                no_update,  # Keep it queued until it is saved
                 "",  # Clear patient name
                 "",  # Clear patient ID
                 *[""] * 15  # Clear all error messages
             )
         
-        # Store prediction results with patient info
+        # Rank later results against this assessment without waiting for the population refresh
+        cohort_ranker.record(dict(patient_data_for_db, risk_probability=result['risk_probability'] * 100))
+        # Likewise for similar-patient matches before the next index rebuild
+        similarity_index.add(patient_data_for_db, result)
+        
+        # Store prediction results with patient info; write_position lets this session's history reads see the save
         stored_data = {
             'prediction': result['prediction'],
             'risk_probability': result['risk_probability'],
             'risk_level': result['risk_level'],
+            'model_version': result.get('model_version'),
             'patient_data': current_submission,
             'patient_name': patient_name.strip(),
-            'patient_id': patient_id.strip()
+            'patient_id': patient_id.strip(),
+            'write_position': db_manager.write_position
         }
         
         print(f"Prediction complete: {stored_data['risk_level']}")
@@ -311,6 +344,7 @@ def patientCallbacks(app):
             ], color="success"),
             stored_data,
             field_values,
+            client_id,  # Saved, drop it from the outbox
             "",  # Clear patient name
             "",  # Clear patient ID
             *[""] * 15  # Clear all error messages
@@ -388,4 +422,59 @@ def patientCallbacks(app):
         Output('patient-button', 'n_clicks', allow_duplicate=True),
         Input('patient-button', 'n_clicks'),
         prevent_initial_call=True
-    )
\ No newline at end of file
+    )
+    
+    # Keep each valid submission in the browser's outbox (assets/submission_queue.js) until the server confirms
+    # it, so a request lost to a flaky connection is sent again in a batch instead of retyped
+    app.clientside_callback(
+        """
+        async function(n_clicks, patientName, patientId, ...values) {
+            const submission = { client_id: null, submitted_at: Date.now() };
+            const ranges = FIELD_RANGES;
+            const fields = {};
+            let valid = Boolean(patientName && patientName.trim() && patientId && patientId.trim());
+            ranges.forEach(function([field, min, max], i) {
+                const value = values[i];
+                fields[field] = value;
+                if (value === null || value === undefined || value < min || value > max) {
+                    valid = false;
+                }
+            });
+            
+            if (valid && window.ventroSubmissionQueue) {
+                try {
+                    submission.client_id = await window.ventroSubmissionQueue.enqueue(Object.assign({
+                        patient_name: patientName.trim(),
+                        patient_id: patientId.trim(),
+                        submitted_at: submission.submitted_at
+                    }, fields));
+                } catch (error) {
+                    // No IndexedDB (private browsing): submit without the outbox
+                    console.warn('Submission not queued:', error);
+                }
+            }
+            return submission;
+        }
+        """.replace('FIELD_RANGES', json.dumps([[key, *FIELD_RANGES[key]] for key in FIELD_KEYS])),
+        Output('submission-store', 'data'),
+        Input('patient-button', 'n_clicks'),
+        State('patient-name', 'value'),
+        State('patient-id-input', 'value'),
+        *[State(field_id, 'value') for field_id in FIELD_IDS],
+        prevent_initial_call=True
+    )
+    
+    # Drop a submission from the outbox once the prediction callback has saved it (or found it invalid)
+    app.clientside_callback(
+        """
+        function(clientId) {
+            if (clientId && window.ventroSubmissionQueue) {
+                window.ventroSubmissionQueue.acknowledge([clientId]);
+            }
+            return window.dash_clientside.no_update;
+        }
+        """,
+        Output('submission-ack-store', 'data', allow_duplicate=True),
+        Input('submission-ack-store', 'data'),
+        prevent_initial_call=True
+    )
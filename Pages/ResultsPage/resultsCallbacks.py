@@ -3,63 +3,192 @@ Results Page Callbacks
 Handles displaying prediction results and resetting assessments.
 """
 
-from dash.dependencies import Input, Output
-from dash import html
+from dash.dependencies import Input, Output, State
+from dash import html, dcc
 import dash_bootstrap_components as dbc
-from datetime import datetime
 import json
+from utils.report_utils import get_mapped_value, create_report_data
+from utils.model_utils import predictor, FEATURE_ORDER
+from utils.whatif_utils import WHATIF_FIELDS, sensitivity_curve, sensitivity_surface
+from utils.cohort_utils import cohort_ranker
+from Pages.PatientDetails.patientCallbacks import FIELD_NAMES, FIELD_KEYS, FIELD_RANGES
 
-# Value mapping functions for readable display
-VALUE_MAPPINGS = {
-    'sex': lambda v: "Male" if v == 1 else "Female",
-    'cp': {0: "Typical Angina", 1: "Atypical Angina", 2: "Non-anginal Pain", 3: "Asymptomatic"},
-    'fbs': lambda v: "Yes (> 120 mg/dl)" if v == 1 else "No (≤ 120 mg/dl)",
-    'restecg': {0: "Normal", 1: "ST-T Wave Abnormality", 2: "Left Ventricular Hypertrophy"},
-    'exang': lambda v: "Yes" if v == 1 else "No",
-    'slope': {0: "Upsloping", 1: "Flat", 2: "Downsloping"},
-    'thal': {0: "Normal", 1: "Fixed Defect", 2: "Reversible Defect", 3: "Reversible Defect (Type 3)"}
+# Number of features shown in the contributions chart
+TOP_CONTRIBUTIONS = 8
+
+# Labels and units for the measurements ranked against the cohorts
+COHORT_LABELS = {
+    'chol': ("Cholesterol", "mg/dl"),
+    'trestbps': ("Resting BP", "mm Hg"),
+    'thalachh': ("Max Heart Rate", "bpm"),
+    'oldpeak': ("ST Depression", ""),
+    'risk_probability': ("Risk Probability", "%")
 }
 
 
-def _get_mapped_value(field_name, value):
-    """Get human-readable value for a field."""
-    mapper = VALUE_MAPPINGS.get(field_name)
-    if mapper is None:
-        return str(value)
+def _format_percentile(percentile):
+    if percentile is None:
+        return "—"
+    rank = int(round(percentile))
+    suffix = 'th' if 10 <= rank % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(rank % 10, 'th')
+    return f"{rank}{suffix}"
+
+
+def _create_cohort_display(ranking):
+    """Create a table placing each key measurement within the training cohort and the clinic's patients."""
+    if not ranking:
+        return None
+    
+    training_size = max(row['training_size'] for row in ranking)
+    population_size = max(row['population_size'] for row in ranking)
+    rows = []
+    for row in ranking:
+        label, unit = COHORT_LABELS[row['field']]
+        value = f"{row['value']:.1f}" if row['field'] == 'risk_probability' else f"{row['value']}"
+        rows.append(html.Tr([
+            html.Td(label),
+            html.Td(f"{value} {unit}".strip()),
+            html.Td([
+                html.Span(_format_percentile(row['training_percentile']), className="fw-bold"),
+                dbc.Progress(value=row['training_percentile'] or 0, color="info", style={'height': '6px'})
+            ]),
+            html.Td([
+                html.Span(_format_percentile(row['population_percentile']), className="fw-bold"),
+                dbc.Progress(value=row['population_percentile'] or 0, color="primary", style={'height': '6px'})
+            ])
+        ]))
     
-    if callable(mapper):
-        return mapper(value)
-    else:
-        return mapper.get(value, "Unknown")
+    return html.Div([
+        html.H4("Cohort Comparison", className="mb-2 section-title"),
+        html.P("Percentile of each measurement: the share of patients with a lower value, counting ties as half.",
+               className="text-muted mb-3"),
+        dbc.Table([
+            html.Thead(html.Tr([
+                html.Th("Measurement"),
+                html.Th("Patient"),
+                html.Th(f"Training Cohort (n={training_size})"),
+                html.Th(f"Clinic Patients (n={population_size})")
+            ])),
+            html.Tbody(rows)
+        ], bordered=False, hover=True, size="sm", className="mb-0")
+    ], className="mb-4")
 
 
-def _create_report_data(patient, risk_percentage, risk_text):
-    """Create report data dictionary for export."""
-    return {
-        'patient_details': {
-            'Age': f"{patient['age']} years",
-            'Sex': _get_mapped_value('sex', patient['sex']),
-            'Chest Pain Type': _get_mapped_value('cp', patient['cp']),
-            'Resting Blood Pressure': f"{patient['trestbps']} mm Hg",
-            'Serum Cholesterol': f"{patient['chol']} mg/dl",
-            'Fasting Blood Sugar': _get_mapped_value('fbs', patient['fbs']),
-            'Resting ECG': _get_mapped_value('restecg', patient['restecg']),
-            'Maximum Heart Rate': f"{patient['thalachh']} bpm",
-            'Exercise Induced Angina': _get_mapped_value('exang', patient['exang']),
-            'ST Depression': f"{patient['oldpeak']}",
-            'Slope': _get_mapped_value('slope', patient['slope']),
-            'Number of Major Vessels': f"{patient['ca']}",
-            'Thalassemia': _get_mapped_value('thal', patient['thal'])
-        },
-        'risk_assessment': {
-            'Risk Probability': f"{risk_percentage:.1f}%",
-            'Risk Level': risk_text,
-            'Assessment Date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def _create_contributions_display(patient, explanation):
+    """Create a chart of the features that pushed this patient's risk up or down."""
+    field_labels = dict(zip(FIELD_KEYS, FIELD_NAMES))
+    contributions = sorted(explanation['contributions'].items(),
+                           key=lambda item: abs(item[1]), reverse=True)[:TOP_CONTRIBUTIONS]
+    # Plot smallest first so the largest contribution ends up on top
+    contributions.reverse()
+    
+    figure = {
+        'data': [{
+            'type': 'bar',
+            'orientation': 'h',
+            'x': [value * 100 for _, value in contributions],
+            'y': [f"{field_labels[key]} = {get_mapped_value(key, patient[key])}" for key, _ in contributions],
+            'marker': {'color': ['#ef4444' if value > 0 else '#10b981' for _, value in contributions]},
+            'hovertemplate': '%{x:+.1f} percentage points<extra></extra>'
+        }],
+        'layout': {
+            'margin': {'l': 10, 'r': 10, 't': 10, 'b': 40},
+            'height': 40 * len(contributions) + 60,
+            'xaxis': {'title': {'text': 'Change in risk probability (percentage points)'},
+                      'zeroline': True, 'zerolinecolor': '#9ca3af'},
+            'yaxis': {'automargin': True},
+            'plot_bgcolor': 'rgba(0,0,0,0)',
+            'paper_bgcolor': 'rgba(0,0,0,0)'
         }
     }
+    
+    return html.Div([
+        html.H4("Risk Factor Contributions", className="mb-2 section-title"),
+        html.P(f"How each input moved this patient's risk away from the average patient "
+               f"({explanation['expected_value'] * 100:.1f}%). Red bars increase risk, green bars decrease it.",
+               className="text-muted mb-3"),
+        dcc.Graph(figure=figure, config={'displayModeBar': False})
+    ], className="mb-4")
+
+
+def _create_whatif_panel():
+    """Create the what-if controls and graph for exploring modifiable factors."""
+    field_labels = dict(zip(FIELD_KEYS, FIELD_NAMES))
+    options = [{'label': field_labels[key], 'value': key} for key in WHATIF_FIELDS]
+    
+    return html.Div([
+        html.H4("What-If Analysis", className="mb-2 section-title"),
+        html.P("See how the risk would change if a modifiable factor moved across its range. "
+               "Pick a second factor to see both at once.", className="text-muted mb-3"),
+        dbc.Row([
+            dbc.Col([
+                dbc.Label("Factor", className="fw-bold mb-1", style={'fontSize': '0.85rem'}),
+                dcc.Dropdown(id="whatif-x-field", options=options, value=WHATIF_FIELDS[0], clearable=False)
+            ], width=6),
+            dbc.Col([
+                dbc.Label("Second factor (optional)", className="fw-bold mb-1", style={'fontSize': '0.85rem'}),
+                dcc.Dropdown(id="whatif-y-field", options=options, value=None, placeholder="None")
+            ], width=6)
+        ], className="mb-3"),
+        dcc.Graph(id="whatif-graph", config={'displayModeBar': False})
+    ], className="mb-4")
 
 
-def _create_results_display(patient, risk_percentage, risk_text, risk_color, risk_icon, report_data):
+def _create_whatif_figure(patient, x_field, y_field):
+    """Score a grid of perturbed inputs in one batch and plot the risk as a curve or heatmap."""
+    field_labels = dict(zip(FIELD_KEYS, FIELD_NAMES))
+    features = [patient[key] for key in FEATURE_ORDER]
+    layout = {
+        'margin': {'l': 10, 'r': 10, 't': 10, 'b': 40},
+        'height': 360,
+        'xaxis': {'title': {'text': field_labels[x_field]}},
+        'plot_bgcolor': 'rgba(0,0,0,0)',
+        'paper_bgcolor': 'rgba(0,0,0,0)',
+        'showlegend': False
+    }
+    current = {
+        'type': 'scatter', 'mode': 'markers',
+        'marker': {'size': 12, 'color': '#1a1d29', 'symbol': 'x'},
+        'hovertemplate': 'Current patient<extra></extra>'
+    }
+    
+    if not y_field or y_field == x_field:
+        curve = sensitivity_curve(features, x_field, FIELD_RANGES[x_field])
+        if curve is None:
+            return {'data': [], 'layout': layout}
+        layout['yaxis'] = {'title': {'text': 'Risk probability (%)'}, 'range': [0, 100], 'automargin': True}
+        layout['shapes'] = [{'type': 'line', 'xref': 'paper', 'x0': 0, 'x1': 1, 'y0': 50, 'y1': 50,
+                             'line': {'color': '#9ca3af', 'dash': 'dash', 'width': 1}}]
+        return {
+            'data': [
+                {'type': 'scatter', 'mode': 'lines', 'x': curve['x'],
+                 'y': [risk * 100 for risk in curve['risk']],
+                 'line': {'color': '#4f46e5', 'width': 3, 'shape': 'hv'},
+                 'hovertemplate': '%{x}: %{y:.1f}%<extra></extra>'},
+                dict(current, x=[patient[x_field]], y=[curve['current_risk'] * 100])
+            ],
+            'layout': layout
+        }
+    
+    surface = sensitivity_surface(features, x_field, FIELD_RANGES[x_field], y_field, FIELD_RANGES[y_field])
+    if surface is None:
+        return {'data': [], 'layout': layout}
+    layout['yaxis'] = {'title': {'text': field_labels[y_field]}, 'automargin': True}
+    return {
+        'data': [
+            {'type': 'heatmap', 'x': surface['x'], 'y': surface['y'],
+             'z': [[risk * 100 for risk in row] for row in surface['risk']],
+             'zmin': 0, 'zmax': 100, 'colorscale': [[0, '#10b981'], [0.5, '#fef3c7'], [1, '#ef4444']],
+             'colorbar': {'title': {'text': 'Risk %'}},
+             'hovertemplate': '%{x}, %{y}: %{z:.1f}%<extra></extra>'},
+            dict(current, x=[patient[x_field]], y=[patient[y_field]])
+        ],
+        'layout': layout
+    }
+
+
+def _create_results_display(patient, risk_percentage, risk_text, risk_color, risk_icon, report_data,
+                            explanation=None, cohort_ranking=None):
     """Create the results display HTML."""
     return html.Div([
         dbc.Card([
@@ -90,9 +219,9 @@ def _create_results_display(patient, risk_percentage, risk_text, risk_color, ris
                             dbc.CardBody([
                                 html.H6("Personal Information", className="mb-3 text-muted"),
                                 html.P([html.Strong("Age: "), f"{patient['age']} years"], className="mb-2"),
-                                html.P([html.Strong("Sex: "), _get_mapped_value('sex', patient['sex'])], className="mb-2"),
-                                html.P([html.Strong("Chest Pain Type: "), _get_mapped_value('cp', patient['cp'])], className="mb-2"),
-                                html.P([html.Strong("Fasting Blood Sugar: "), _get_mapped_value('fbs', patient['fbs'])], className="mb-0"),
+                                html.P([html.Strong("Sex: "), get_mapped_value('sex', patient['sex'])], className="mb-2"),
+                                html.P([html.Strong("Chest Pain Type: "), get_mapped_value('cp', patient['cp'])], className="mb-2"),
+                                html.P([html.Strong("Fasting Blood Sugar: "), get_mapped_value('fbs', patient['fbs'])], className="mb-0"),
                             ])
                         ], className="mb-3")
                     ], width=4),
@@ -111,16 +240,25 @@ def _create_results_display(patient, risk_percentage, risk_text, risk_color, ris
                         dbc.Card([
                             dbc.CardBody([
                                 html.H6("Medical Tests", className="mb-3 text-muted"),
-                                html.P([html.Strong("Resting ECG: "), _get_mapped_value('restecg', patient['restecg'])], className="mb-2"),
-                                html.P([html.Strong("Exercise Angina: "), _get_mapped_value('exang', patient['exang'])], className="mb-2"),
-                                html.P([html.Strong("Slope: "), _get_mapped_value('slope', patient['slope'])], className="mb-2"),
+                                html.P([html.Strong("Resting ECG: "), get_mapped_value('restecg', patient['restecg'])], className="mb-2"),
+                                html.P([html.Strong("Exercise Angina: "), get_mapped_value('exang', patient['exang'])], className="mb-2"),
+                                html.P([html.Strong("Slope: "), get_mapped_value('slope', patient['slope'])], className="mb-2"),
                                 html.P([html.Strong("Major Vessels: "), f"{patient['ca']}"], className="mb-2"),
-                                html.P([html.Strong("Thalassemia: "), _get_mapped_value('thal', patient['thal'])], className="mb-0"),
+                                html.P([html.Strong("Thalassemia: "), get_mapped_value('thal', patient['thal'])], className="mb-0"),
                             ])
                         ], className="mb-3")
                     ], width=4)
                 ], className="mb-4"),
                 
+                # Feature Contributions
+                _create_contributions_display(patient, explanation) if explanation else None,
+                
+                # Cohort Percentiles
+                _create_cohort_display(cohort_ranking),
+                
+                # What-If Analysis
+                _create_whatif_panel(),
+                
                 # Action Buttons
                 dbc.Row([
                     dbc.Col([
@@ -190,10 +328,28 @@ def resultsCallbacks(app):
             risk_text, risk_color, risk_icon = "Low Risk", "success", "✓"
         
         # Create report data
-        report_data = _create_report_data(patient, risk_percentage, risk_text)
+        report_data = create_report_data(patient, risk_percentage, risk_text)
+        
+        # Explain which inputs drove the score (cached per feature vector)
+        explanation = predictor.explain([patient[key] for key in FEATURE_ORDER])
+        
+        # Where the key measurements fall in the training cohort and the stored population
+        cohort_ranking = cohort_ranker.rank(dict(patient, risk_probability=risk_percentage))
         
         return _create_results_display(patient, risk_percentage, risk_text,
-                                      risk_color, risk_icon, report_data)
+                                      risk_color, risk_icon, report_data, explanation, cohort_ranking)
+    
+    @app.callback(
+        Output('whatif-graph', 'figure'),
+        Input('whatif-x-field', 'value'),
+        Input('whatif-y-field', 'value'),
+        State('prediction-store', 'data')
+    )
+    def update_whatif_graph(x_field, y_field, stored_data):
+        """Plot how the risk responds to the selected modifiable factors."""
+        if not stored_data or 'patient_data' not in stored_data or not x_field:
+            return {'data': [], 'layout': {}}
+        return _create_whatif_figure(stored_data['patient_data'], x_field, y_field)
     
     @app.callback(
         Output('prediction-store', 'data', allow_duplicate=True),
@@ -0,0 +1,225 @@
+// Durable outbox for patient form submissions. Each valid submission is kept in IndexedDB until the server
+// confirms it: normally the form's own callback does, and whatever it did not (a timeout, an offline tablet)
+// is posted in batches to /api/submissions/batch, retried with backoff until the connection returns.
+window.ventroSubmissionQueue = (function() {
+    const DB_NAME = 'ventro';
+    const STORE_NAME = 'submission-outbox';
+    const BATCH_PATH = '/api/submissions/batch';
+    // Until a response reports the server's SUBMISSION_BATCH_LIMIT
+    const DEFAULT_BATCH_SIZE = 50;
+    // A fresh submission is left to the form callback this long before it is sent in a batch
+    const CALLBACK_GRACE_MS = 30000;
+    // Submissions waiting longer than this are shown in the status badge
+    const STATUS_DELAY_MS = 5000;
+    const POLL_INTERVAL_MS = 15000;
+    const RETRY_BASE_MS = 2000;
+    const RETRY_MAX_MS = 300000;
+    
+    let databasePromise = null;
+    let batchSize = DEFAULT_BATCH_SIZE;
+    let retryDelay = 0;
+    let nextAttemptAt = 0;
+    let flushing = false;
+    
+    function openDatabase() {
+        if (!databasePromise) {
+            databasePromise = new Promise(function(resolve, reject) {
+                if (!window.indexedDB) {
+                    reject(new Error('IndexedDB is not available'));
+                    return;
+                }
+                const request = window.indexedDB.open(DB_NAME, 1);
+                request.onupgradeneeded = function() {
+                    request.result.createObjectStore(STORE_NAME, { keyPath: 'client_id' });
+                };
+                request.onsuccess = function() {
+                    resolve(request.result);
+                };
+                request.onerror = function() {
+                    reject(request.error);
+                };
+            });
+        }
+        return databasePromise;
+    }
+    
+    // Run action(store) in one transaction; resolves with the result of the request it returns, once committed
+    function withStore(mode, action) {
+        return openDatabase().then(function(database) {
+            return new Promise(function(resolve, reject) {
+                const transaction = database.transaction(STORE_NAME, mode);
+                const request = action(transaction.objectStore(STORE_NAME));
+                transaction.oncomplete = function() {
+                    resolve(request ? request.result : undefined);
+                };
+                transaction.onerror = transaction.onabort = function() {
+                    reject(transaction.error);
+                };
+            });
+        });
+    }
+    
+    function newClientId() {
+        // randomUUID needs a secure context, which a ward server on plain http is not
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID();
+        }
+        return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2) + Math.random().toString(36).slice(2);
+    }
+    
+    function pending() {
+        return withStore('readonly', function(store) {
+            return store.getAll();
+        });
+    }
+    
+    function statusBadge() {
+        let badge = document.getElementById('submission-queue-status');
+        if (!badge) {
+            // Outside the Dash tree, so re-renders never touch it
+            badge = document.createElement('div');
+            badge.id = 'submission-queue-status';
+            badge.className = 'submission-queue-status';
+            badge.setAttribute('role', 'status');
+            document.body.appendChild(badge);
+        }
+        return badge;
+    }
+    
+    function updateStatus() {
+        return pending().then(function(entries) {
+            const waiting = entries.filter(function(entry) {
+                return Date.now() - entry.queued_at >= STATUS_DELAY_MS;
+            }).length;
+            const badge = statusBadge();
+            badge.textContent = waiting === 1
+                ? '1 assessment waiting to be sent - it will be saved when the connection returns'
+                : `${waiting} assessments waiting to be sent - they will be saved when the connection returns`;
+            badge.classList.toggle('visible', waiting > 0);
+        }).catch(function() {});
+    }
+    
+    function enqueue(submission) {
+        const entry = Object.assign({}, submission, { client_id: newClientId(), queued_at: Date.now() });
+        return withStore('readwrite', function(store) {
+            return store.put(entry);
+        }).then(function() {
+            setTimeout(updateStatus, STATUS_DELAY_MS);
+            return entry.client_id;
+        });
+    }
+    
+    function acknowledge(clientIds) {
+        return withStore('readwrite', function(store) {
+            clientIds.forEach(function(clientId) {
+                store.delete(clientId);
+            });
+        }).then(updateStatus);
+    }
+    
+    function backOff() {
+        // Exponential backoff with jitter, so tablets reconnecting together do not all retry at once
+        retryDelay = Math.min(Math.max(retryDelay * 2, RETRY_BASE_MS), RETRY_MAX_MS);
+        nextAttemptAt = Date.now() + retryDelay * (0.5 + Math.random() / 2);
+    }
+    
+    function sendBatch() {
+        return pending().then(function(entries) {
+            const due = entries.filter(function(entry) {
+                return Date.now() - entry.queued_at >= CALLBACK_GRACE_MS;
+            }).sort(function(a, b) {
+                return a.queued_at - b.queued_at;
+            }).slice(0, batchSize);
+            if (!due.length) {
+                return;
+            }
+            
+            return fetch(BATCH_PATH, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                credentials: 'same-origin',
+                body: JSON.stringify({ submissions: due })
+            }).then(function(response) {
+                if (!response.ok) {
+                    throw new Error(`Batch submission failed with HTTP ${response.status}`);
+                }
+                return response.json();
+            }).then(function(body) {
+                // The server processes at most its limit and returns the rest as failed, to be sent again at once
+                const limit = body.batch_limit || due.length;
+                const full = due.length >= batchSize;
+                batchSize = limit;
+                const done = [];
+                let failed = false;
+                body.results.forEach(function(result, index) {
+                    if (result.status === 'failed') {
+                        failed = failed || index < limit;
+                        return;
+                    }
+                    if (result.status === 'invalid') {
+                        console.warn('Queued submission rejected:', result.client_id, result.errors);
+                    }
+                    done.push(result.client_id);
+                });
+                return acknowledge(done).then(function() {
+                    if (failed) {
+                        backOff();
+                        return;
+                    }
+                    retryDelay = 0;
+                    nextAttemptAt = 0;
+                    // More than one batch waiting: keep going
+                    if (full || due.length > limit) {
+                        return sendBatch();
+                    }
+                });
+            });
+        });
+    }
+    
+    function flush() {
+        if (flushing || Date.now() < nextAttemptAt || navigator.onLine === false) {
+            return;
+        }
+        flushing = true;
+        
+        function run() {
+            return sendBatch().catch(function(error) {
+                console.warn('Queued submissions not sent, retrying later:', error);
+                backOff();
+            });
+        }
+        // One tab sends the shared outbox at a time
+        const sending = navigator.locks
+            ? navigator.locks.request('ventro-submission-flush', { ifAvailable: true }, function(lock) {
+                return lock ? run() : undefined;
+            })
+            : run();
+        Promise.resolve(sending).finally(function() {
+            flushing = false;
+        });
+    }
+    
+    window.addEventListener('online', function() {
+        retryDelay = 0;
+        nextAttemptAt = 0;
+        flush();
+    });
+    setInterval(flush, POLL_INTERVAL_MS);
+    
+    function start() {
+        updateStatus();
+        flush();
+    }
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', start);
+    } else {
+        start();
+    }
+    
+    return {
+        enqueue: enqueue,
+        acknowledge: acknowledge,
+        flush: flush
+    };
+})();
@@ -1,6 +1,5 @@
 import dash
 import os
-import psycopg2
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
@@ -21,21 +20,40 @@ from Pages.PatientDetails.patientCallbacks import patientCallbacks
 from Pages.ResultsPage.resultsCallbacks import resultsCallbacks
 from Pages.HistoryDashboard.historyCallbacks import historyCallbacks
 
+# Import server routes
+from utils.report_utils import register_report_routes
+from utils.submission_utils import register_submission_routes
+from utils.job_utils import background_callback_manager
+from utils.model_utils import predictor
+from utils.shadow_utils import shadow_scorer
+from utils.drift_utils import drift_monitor, register_monitoring_routes
+from utils.retention_utils import retention_job
+from utils.similarity_utils import similarity_index
+from utils.load_test import register_recording_hook
+from utils.asset_utils import load_asset_manifest, register_asset_routes, vendor_stylesheet_urls
+from utils.profiling_utils import register_profiling_hooks
+
+# Serve the minified bundle once built (python -m utils.asset_utils), otherwise the vendored files and assets/ as they are
+asset_bundle = load_asset_manifest()
+
 # Create the app
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
+app = dash.Dash(__name__,
+                external_stylesheets=asset_bundle['stylesheets'] if asset_bundle else vendor_stylesheet_urls(),
+                external_scripts=asset_bundle['scripts'] if asset_bundle else [],
+                include_assets_files=asset_bundle is None,
+                compress=True,
+                suppress_callback_exceptions=True,
+                background_callback_manager=background_callback_manager)
 server = app.server
 
 # App layout with offcanvas dashboard
 app.layout = html.Div([
-    # Bootstrap Icons CDN
-    html.Link(
-        rel="stylesheet",
-        href="https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.0/font/bootstrap-icons.css"
-    ),
-    
     # Stores
     dcc.Store(id='prediction-store', storage_type='session'),
     dcc.Store(id='field-values-store', storage_type='session'),
+    # Outbox ID of the latest submission, and of the last one the server confirmed
+    dcc.Store(id='submission-store'),
+    dcc.Store(id='submission-ack-store'),
     
     # Floating Dashboard Toggle Button (Hamburger Menu Style)
     html.Button([
@@ -116,6 +134,33 @@ patientCallbacks(app)
 resultsCallbacks(app)
 historyCallbacks(app)
 
+# Register server routes
+register_report_routes(server)
+register_submission_routes(server)
+register_monitoring_routes(server)
+register_asset_routes(server)
+
+# Profile individual callback requests on demand (only wrapped when PROFILE_TOKEN is set)
+register_profiling_hooks(server)
+
+# Record callback payloads for load-test replay when requested
+if os.environ.get("DASH_RECORD_PAYLOADS"):
+    register_recording_hook(server, os.environ["DASH_RECORD_PAYLOADS"])
+
+# Score the challenger model (if configured) alongside every live prediction
+predictor.add_prediction_listener(shadow_scorer.submit)
+
+# Track live input distributions for drift monitoring
+predictor.add_prediction_listener(drift_monitor.update)
+
+# Start background work once the worker starts serving, rather than at import
+@server.before_request
+def start_background_tasks():
+    predictor.warm_up()
+    drift_monitor.start_scheduler()
+    retention_job.start_scheduler()
+    similarity_index.start_scheduler()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8050))
     app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
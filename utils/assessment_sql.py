@@ -0,0 +1,160 @@
+"""
+Assessment Statements
+SQL that saves and deletes an assessment along with its rollup, cohort cube, histogram and submission rows,
+shared by DatabaseManager and AsyncDatabaseManager so the two cannot drift apart.
+
+Statements use %s placeholders: DatabaseManager runs them through its backend, and AsyncDatabaseManager rewrites
+them with numbered_placeholders for asyncpg. Builders that need a calendar day or the current time take the backend's
+SQL expression for it.
+
+A row is always addressed by its id and assessment_date together, so PostgreSQL only probes the month's partition.
+"""
+
+from datetime import timedelta
+from utils.db_backends import COHORT_AGE_BAND, HISTOGRAM_BUCKET_WIDTHS, histogram_buckets_query
+
+# Columns written for each assessment, in the order of assessment_values(), which adds assessment_date last
+ASSESSMENT_COLUMNS = [
+    'patient_name', 'patient_id', 'age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 'thalachh', 'exang',
+    'oldpeak', 'slope', 'ca', 'thal', 'risk_probability', 'risk_level', 'model_version'
+]
+
+# Every column of a stored assessment, for full-row reads. Listed rather than SELECT *, because a server-side
+# prepared plan is tied to its row shape and fails once a column is added to patients.
+PATIENT_ROW_COLUMNS = ', '.join(['id'] + ASSESSMENT_COLUMNS + ['assessment_date'])
+
+# Claim an idempotency key, taking over a claim made before the dedup window; returns no row when the key was
+# claimed within it. A concurrent claim of the same key waits on the row and then finds it recent.
+CLAIM_SUBMISSION_QUERY = """
+    INSERT INTO assessment_submissions (
+        idempotency_key, prediction, risk_probability, risk_level, model_version, created_at
+    ) VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (idempotency_key) DO UPDATE SET
+        assessment_id = NULL,
+        prediction = excluded.prediction,
+        risk_probability = excluded.risk_probability,
+        risk_level = excluded.risk_level,
+        model_version = excluded.model_version,
+        created_at = excluded.created_at
+    WHERE assessment_submissions.created_at < %s
+    RETURNING idempotency_key
+"""
+
+LINK_SUBMISSION_QUERY = "UPDATE assessment_submissions SET assessment_id = %s WHERE idempotency_key = %s"
+
+# One row, by its key in the partitioned table: parameters (id, assessment_date)
+ROW_CONDITION = "id = %s AND assessment_date = %s"
+
+# Fold a new row into the cohort cube behind the dashboard drill-down
+ADD_TO_COHORT_STATS_QUERY = f"""
+    INSERT INTO cohort_stats (age_band, sex, cp, risk_level, assessment_count, risk_probability_sum)
+    SELECT {COHORT_AGE_BAND}, sex, cp, risk_level, 1, risk_probability
+    FROM patients
+    WHERE {ROW_CONDITION}
+    ON CONFLICT (age_band, sex, cp, risk_level) DO UPDATE SET
+        assessment_count = cohort_stats.assessment_count + excluded.assessment_count,
+        risk_probability_sum = cohort_stats.risk_probability_sum + excluded.risk_probability_sum
+"""
+
+# And into the population histogram used for percentile ranking (WHERE 1 = 1 lets SQLite parse the ON CONFLICT)
+ADD_TO_POPULATION_HISTOGRAM_QUERY = f"""
+    INSERT INTO population_histogram (field, bucket, assessment_count)
+    SELECT field, bucket, 1
+    FROM ({histogram_buckets_query(ROW_CONDITION)}) buckets
+    WHERE 1 = 1
+    ON CONFLICT (field, bucket) DO UPDATE SET
+        assessment_count = population_histogram.assessment_count + 1
+"""
+
+# Take a row out of the population histogram, while it can still be read
+REMOVE_FROM_POPULATION_HISTOGRAM_QUERY = f"""
+    UPDATE population_histogram
+    SET assessment_count = assessment_count - 1
+    WHERE (field, bucket) IN ({histogram_buckets_query(ROW_CONDITION)})
+"""
+
+REMOVE_FROM_DAILY_STATS_QUERY = """
+    UPDATE daily_assessment_stats
+    SET assessment_count = assessment_count - 1,
+        risk_probability_sum = risk_probability_sum - %s
+    WHERE day = %s AND risk_level = %s AND sex = %s
+"""
+
+REMOVE_FROM_COHORT_STATS_QUERY = """
+    UPDATE cohort_stats
+    SET assessment_count = assessment_count - 1,
+        risk_probability_sum = risk_probability_sum - %s
+    WHERE age_band = %s AND sex = %s AND cp = %s AND risk_level = %s
+"""
+
+# Rollup and cube rows emptied by a delete
+PRUNE_STATEMENTS = [
+    "DELETE FROM population_histogram WHERE assessment_count <= 0",
+    "DELETE FROM daily_assessment_stats WHERE assessment_count <= 0",
+    "DELETE FROM cohort_stats WHERE assessment_count <= 0"
+]
+
+# Let the same submission be made again after its assessment is deleted
+FORGET_SUBMISSION_QUERY = "DELETE FROM assessment_submissions WHERE assessment_id = %s"
+
+
+def insert_assessment_query(now_expression):
+    """Insert one row, returning its key; assessment_date falls back to now_expression, the backend's local time"""
+    return f"""
+        INSERT INTO patients ({', '.join(ASSESSMENT_COLUMNS)}, assessment_date)
+        VALUES ({', '.join(['%s'] * len(ASSESSMENT_COLUMNS))}, COALESCE(%s, {now_expression}))
+        RETURNING id, assessment_date
+    """
+
+
+def add_to_daily_stats_query(day_expression):
+    """Fold a new row into the daily rollup; day_expression is the backend's calendar day of assessment_date"""
+    return f"""
+        INSERT INTO daily_assessment_stats (day, risk_level, sex, assessment_count, risk_probability_sum)
+        SELECT {day_expression}, risk_level, sex, 1, risk_probability
+        FROM patients
+        WHERE {ROW_CONDITION}
+        ON CONFLICT (day, risk_level, sex) DO UPDATE SET
+            assessment_count = daily_assessment_stats.assessment_count + excluded.assessment_count,
+            risk_probability_sum = daily_assessment_stats.risk_probability_sum + excluded.risk_probability_sum
+    """
+
+
+def delete_assessment_query(day_expression):
+    """Delete one row, returning what is needed to take it back out of the rollup and cube:
+    (day, risk_level, sex, risk_probability, age_band, cp)"""
+    return f"""
+        DELETE FROM patients
+        WHERE {ROW_CONDITION}
+        RETURNING {day_expression} AS day, risk_level, sex, risk_probability, {COHORT_AGE_BAND} AS age_band, cp
+    """
+
+
+def assessment_values(patient_data, prediction_data, assessment_date=None):
+    """Parameters for insert_assessment_query; without an assessment_date the row is dated now"""
+    values = [patient_data[column] for column in ASSESSMENT_COLUMNS[:15]]
+    return tuple(values) + (
+        prediction_data['risk_probability'] * 100,  # Convert to percentage
+        prediction_data['risk_level'],
+        prediction_data.get('model_version'),
+        assessment_date
+    )
+
+
+def submission_values(idempotency_key, prediction_data, created_at, dedup_window):
+    """Parameters for CLAIM_SUBMISSION_QUERY; an earlier claim more than dedup_window seconds before created_at
+    is taken over"""
+    return (
+        idempotency_key,
+        prediction_data['prediction'],
+        prediction_data['risk_probability'],
+        prediction_data['risk_level'],
+        prediction_data.get('model_version'),
+        created_at,
+        created_at - timedelta(seconds=dedup_window)
+    )
+
+
+def histogram_params(record_id, assessment_date):
+    """Parameters for the histogram statements, the row's key once per measurement's UNION branch"""
+    return (record_id, assessment_date) * len(HISTOGRAM_BUCKET_WIDTHS)
@@ -0,0 +1,166 @@
+"""
+Static Asset Utilities
+Bundles the vendored stylesheets and the app's assets into minified, fingerprinted files served with immutable
+caching and precompressed gzip/brotli variants.
+
+Build the bundle with: python -m utils.asset_utils
+Without a bundle the app serves the vendored files and assets/ individually, as in development.
+"""
+
+import os
+import re
+import json
+import gzip
+import shutil
+import hashlib
+
+ASSETS_DIR = 'assets'
+STATIC_DIR = 'static'
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+DIST_URL = '/static/dist/'
+
+# Loaded ahead of assets/*.css so the app's rules override Bootstrap's
+VENDOR_STYLESHEETS = [
+    os.path.join('vendor', 'bootstrap-5.3.8', 'bootstrap.min.css'),
+    os.path.join('vendor', 'bootstrap-icons-1.13.1', 'bootstrap-icons.min.css')
+]
+
+# Fingerprinted file names never change content, so browsers may keep them for a year without revalidating
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Bundle files worth compressing; fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js')
+
+CSS_URL_PATTERN = re.compile(r'url\(\s*(["\']?)([^"\')]+)\1\s*\)')
+
+
+def vendor_stylesheet_urls():
+    """URLs of the vendored stylesheets, for serving them unbundled"""
+    return ['/static/' + path.replace(os.sep, '/') for path in VENDOR_STYLESHEETS]
+
+
+def _asset_files(extension):
+    # Same order Dash uses when it serves assets/ itself
+    return sorted(name for name in os.listdir(ASSETS_DIR) if name.endswith(extension))
+
+
+def _fingerprint(content):
+    return hashlib.sha256(content).hexdigest()[:12]
+
+
+def _copy_referenced_files(css, css_path):
+    """Copy files a stylesheet references (fonts) into the bundle under fingerprinted names and point at them"""
+    def replace(match):
+        url = match.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '/', '#')):
+            return match.group(0)
+        
+        path = os.path.normpath(os.path.join(os.path.dirname(css_path), re.split(r'[?#]', url)[0]))
+        with open(path, 'rb') as f:
+            content = f.read()
+        stem, extension = os.path.splitext(os.path.basename(path))
+        name = f"{stem}.{_fingerprint(content)}{extension}"
+        with open(os.path.join(DIST_DIR, name), 'wb') as f:
+            f.write(content)
+        return f'url("{name}")'
+    
+    return CSS_URL_PATTERN.sub(replace, css)
+
+
+def _write_bundle(content, extension):
+    """Write one fingerprinted bundle file with its .gz and .br siblings; returns its URL"""
+    data = content.encode('utf-8')
+    name = f"app.{_fingerprint(data)}{extension}"
+    path = os.path.join(DIST_DIR, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    
+    try:
+        import brotli
+    except ImportError:
+        print("brotli is not installed; writing gzip variants only")
+    else:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+    return DIST_URL + name
+
+
+def build_asset_bundle():
+    """Bundle, minify and fingerprint the stylesheets and scripts, and write the manifest main.py reads"""
+    # Build-time dependencies, not needed to run the app
+    from rcssmin import cssmin
+    from rjsmin import jsmin
+    
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR)
+    
+    stylesheets = []
+    for relative_path in VENDOR_STYLESHEETS:
+        path = os.path.join(STATIC_DIR, relative_path)
+        with open(path, encoding='utf-8') as f:
+            stylesheets.append(_copy_referenced_files(f.read(), path))
+    for name in _asset_files('.css'):
+        path = os.path.join(ASSETS_DIR, name)
+        with open(path, encoding='utf-8') as f:
+            stylesheets.append(_copy_referenced_files(f.read(), path))
+    
+    scripts = []
+    for name in _asset_files('.js'):
+        with open(os.path.join(ASSETS_DIR, name), encoding='utf-8') as f:
+            # Each file on its own line so a missing trailing semicolon cannot join two statements
+            scripts.append(jsmin(f.read()))
+    
+    manifest = {
+        'stylesheets': [_write_bundle("\n".join(cssmin(css, keep_bang_comments=True) for css in stylesheets), '.css')],
+        'scripts': [_write_bundle(";\n".join(scripts), '.js')]
+    }
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_asset_manifest():
+    """The built bundle's stylesheet and script URLs, or None when no bundle has been built"""
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def register_asset_routes(server):
+    """Serve the bundle with immutable caching, picking a precompressed variant the browser accepts"""
+    from flask import abort, request, send_from_directory
+    
+    @server.route(DIST_URL + '<path:filename>')
+    def bundled_asset(filename):
+        accepted = request.headers.get('Accept-Encoding', '')
+        encoding = None
+        if filename.endswith(COMPRESSIBLE_EXTENSIONS):
+            for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+                if candidate in accepted and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+                    encoding = (candidate, suffix)
+                    break
+        
+        if not os.path.isfile(os.path.join(DIST_DIR, filename)):
+            abort(404)
+        
+        if encoding:
+            response = send_from_directory(os.path.abspath(DIST_DIR), filename + encoding[1])
+            response.headers['Content-Encoding'] = encoding[0]
+            response.mimetype = 'text/css' if filename.endswith('.css') else 'application/javascript'
+        else:
+            response = send_from_directory(os.path.abspath(DIST_DIR), filename)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+
+if __name__ == "__main__":
+    built = build_asset_bundle()
+    for url in built['stylesheets'] + built['scripts']:
+        print(f"Built {url}")
@@ -0,0 +1,235 @@
+"""
+Async Database Access
+asyncio counterpart of DatabaseManager for high-concurrency endpoints, on asyncpg with an async connection pool.
+
+The pool belongs to the event loop that first uses it, so create one manager per loop (an ASGI app, an aiohttp
+server or a script). Flask views run one request per thread and keep using db_manager.
+With a SQLite DATABASE_URL the calls run the blocking manager on the loop's default executor.
+"""
+
+import asyncio
+from datetime import datetime
+from utils.db_utils import DatabaseManager, SUBMISSION_DEDUP_WINDOW
+from utils.db_backends import (
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_PREPARED_STATEMENTS, DB_PLAN_CACHE_MODE, SQLITE_URL_PREFIX,
+    DB_CONNECT_TIMEOUT, DB_STATEMENT_TIMEOUT, numbered_placeholders
+)
+from utils.assessment_sql import (
+    CLAIM_SUBMISSION_QUERY, LINK_SUBMISSION_QUERY, ADD_TO_COHORT_STATS_QUERY,
+    ADD_TO_POPULATION_HISTOGRAM_QUERY, REMOVE_FROM_POPULATION_HISTOGRAM_QUERY, REMOVE_FROM_DAILY_STATS_QUERY,
+    REMOVE_FROM_COHORT_STATS_QUERY, FORGET_SUBMISSION_QUERY, PRUNE_STATEMENTS, PATIENT_ROW_COLUMNS,
+    add_to_daily_stats_query, insert_assessment_query, delete_assessment_query, assessment_values, submission_values,
+    histogram_params
+)
+
+# Statements asyncpg keeps prepared per pooled connection (0 disables, like DB_PREPARED_STATEMENTS=0)
+ASYNC_STATEMENT_CACHE_SIZE = 100
+
+# The shared assessment statements, in asyncpg's numbered placeholder style
+DAY_EXPRESSION = "CAST(assessment_date AS DATE)"
+NOW_EXPRESSION = "LOCALTIMESTAMP"
+CLAIM_SUBMISSION = numbered_placeholders(CLAIM_SUBMISSION_QUERY)
+INSERT_ASSESSMENT = numbered_placeholders(insert_assessment_query(NOW_EXPRESSION))
+ADD_TO_DAILY_STATS = numbered_placeholders(add_to_daily_stats_query(DAY_EXPRESSION))
+ADD_TO_COHORT_STATS = numbered_placeholders(ADD_TO_COHORT_STATS_QUERY)
+ADD_TO_POPULATION_HISTOGRAM = numbered_placeholders(ADD_TO_POPULATION_HISTOGRAM_QUERY)
+LINK_SUBMISSION = numbered_placeholders(LINK_SUBMISSION_QUERY)
+REMOVE_FROM_POPULATION_HISTOGRAM = numbered_placeholders(REMOVE_FROM_POPULATION_HISTOGRAM_QUERY)
+DELETE_ASSESSMENT = numbered_placeholders(delete_assessment_query(DAY_EXPRESSION))
+REMOVE_FROM_DAILY_STATS = numbered_placeholders(REMOVE_FROM_DAILY_STATS_QUERY)
+REMOVE_FROM_COHORT_STATS = numbered_placeholders(REMOVE_FROM_COHORT_STATS_QUERY)
+FORGET_SUBMISSION = numbered_placeholders(FORGET_SUBMISSION_QUERY)
+
+ASSESSMENT_LIST_COLUMNS = """
+    id,
+    patient_name,
+    patient_id,
+    age,
+    CASE WHEN sex = 1 THEN 'Male' ELSE 'Female' END as sex,
+    risk_probability,
+    risk_level,
+    assessment_date
+"""
+
+
+class AsyncDatabaseManager:
+    def __init__(self):
+        # Applies the schema before the pool opens, and serves every call on SQLite
+        self._blocking = DatabaseManager()
+        self.database_url = self._blocking.database_url
+        self.uses_pool = not self.database_url.startswith(SQLITE_URL_PREFIX)
+        self._pool = None
+        self._pool_lock = None
+    
+    async def get_pool(self):
+        """Create the connection pool on first use"""
+        if self._pool is None:
+            if self._pool_lock is None:
+                self._pool_lock = asyncio.Lock()
+            async with self._pool_lock:
+                if self._pool is None:
+                    # Imported on first use so the driver is not loaded at app startup
+                    import asyncpg
+                    
+                    conn = await asyncio.to_thread(self._blocking.get_connection)
+                    if conn:
+                        conn.close()
+                    
+                    server_settings = {}
+                    if DB_PLAN_CACHE_MODE:
+                        server_settings['plan_cache_mode'] = DB_PLAN_CACHE_MODE
+                    if DB_STATEMENT_TIMEOUT:
+                        server_settings['statement_timeout'] = str(DB_STATEMENT_TIMEOUT)
+                    self._pool = await asyncpg.create_pool(
+                        self.database_url,
+                        min_size=DB_POOL_MIN_SIZE,
+                        max_size=DB_POOL_MAX_SIZE,
+                        statement_cache_size=ASYNC_STATEMENT_CACHE_SIZE if DB_PREPARED_STATEMENTS else 0,
+                        server_settings=server_settings or None,
+                        timeout=DB_CONNECT_TIMEOUT
+                    )
+        return self._pool
+    
+    async def close(self):
+        """Close every pooled connection"""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+    
+    async def save_patient_assessment(self, patient_data, prediction_data, idempotency_key=None, assessment_date=None):
+        """Save a patient assessment to the database.
+        
+        With an idempotency key, a repeat of a submission saved within the dedup window before assessment_date
+        (default now) is not written again.
+        """
+        if not self.uses_pool:
+            return await asyncio.to_thread(
+                self._blocking.save_patient_assessment, patient_data, prediction_data, idempotency_key, assessment_date
+            )
+        
+        try:
+            pool = await self.get_pool()
+            async with pool.acquire(timeout=DB_POOL_TIMEOUT) as conn:
+                async with conn.transaction():
+                    if idempotency_key:
+                        # Claim the key first; a concurrent or repeated submission waits on the key and then inserts nothing
+                        claimed = await conn.fetchval(CLAIM_SUBMISSION, *submission_values(
+                            idempotency_key, prediction_data, assessment_date or datetime.now(), SUBMISSION_DEDUP_WINDOW
+                        ))
+                        if claimed is None:
+                            print("Duplicate submission detected, assessment already saved")
+                            return True
+                    
+                    record_id, assessment_date = await conn.fetchrow(
+                        INSERT_ASSESSMENT, *assessment_values(patient_data, prediction_data, assessment_date)
+                    )
+                    
+                    # Fold the new row into the daily rollup, cohort cube and population histogram in the same transaction
+                    await conn.execute(ADD_TO_DAILY_STATS, record_id, assessment_date)
+                    await conn.execute(ADD_TO_COHORT_STATS, record_id, assessment_date)
+                    await conn.execute(ADD_TO_POPULATION_HISTOGRAM, *histogram_params(record_id, assessment_date))
+                    
+                    if idempotency_key:
+                        await conn.execute(LINK_SUBMISSION, record_id, idempotency_key)
+            
+            print(f"Patient assessment saved successfully with ID: {record_id}")
+            return True
+        
+        except Exception as e:
+            print(f"Error saving patient assessment: {e}")
+            return False
+    
+    async def get_all_assessments(self):
+        """Retrieve all patient assessments"""
+        if not self.uses_pool:
+            return await asyncio.to_thread(self._blocking.get_all_assessments)
+        
+        try:
+            pool = await self.get_pool()
+            async with pool.acquire(timeout=DB_POOL_TIMEOUT) as conn:
+                rows = await conn.fetch(f"""
+                    SELECT {ASSESSMENT_LIST_COLUMNS}
+                    FROM patients
+                    ORDER BY assessment_date DESC
+                """)
+            return [dict(row) for row in rows]
+        
+        except Exception as e:
+            print(f"Error retrieving assessments: {e}")
+            return []
+    
+    async def get_patient_by_id(self, patient_id):
+        """Get detailed information for a specific patient"""
+        if not self.uses_pool:
+            return await asyncio.to_thread(self._blocking.get_patient_by_id, patient_id)
+        
+        try:
+            pool = await self.get_pool()
+            async with pool.acquire(timeout=DB_POOL_TIMEOUT) as conn:
+                row = await conn.fetchrow(f"""
+                    SELECT {PATIENT_ROW_COLUMNS}
+                    FROM patients
+                    WHERE patient_id = $1
+                    ORDER BY assessment_date DESC
+                    LIMIT 1
+                """, patient_id)
+            return dict(row) if row else None
+        
+        except Exception as e:
+            print(f"Error retrieving patient: {e}")
+            return None
+    
+    async def search_patients(self, search_term):
+        """Search patients by name or ID"""
+        if not self.uses_pool:
+            return await asyncio.to_thread(self._blocking.search_patients, search_term)
+        
+        try:
+            pool = await self.get_pool()
+            async with pool.acquire(timeout=DB_POOL_TIMEOUT) as conn:
+                rows = await conn.fetch(f"""
+                    SELECT {ASSESSMENT_LIST_COLUMNS}
+                    FROM patients
+                    WHERE
+                        LOWER(patient_name) LIKE LOWER($1) OR
+                        LOWER(patient_id) LIKE LOWER($1)
+                    ORDER BY assessment_date DESC
+                """, f"%{search_term}%")
+            return [dict(row) for row in rows]
+        
+        except Exception as e:
+            print(f"Error searching patients: {e}")
+            return []
+    
+    async def delete_assessment(self, assessment_id, assessment_date):
+        """Delete a specific assessment, given its id and assessment_date (both part of the row's key)"""
+        if not self.uses_pool:
+            return await asyncio.to_thread(self._blocking.delete_assessment, assessment_id, assessment_date)
+        
+        try:
+            pool = await self.get_pool()
+            async with pool.acquire(timeout=DB_POOL_TIMEOUT) as conn:
+                async with conn.transaction():
+                    # Take the row out of the population histogram while it can still be read
+                    await conn.execute(REMOVE_FROM_POPULATION_HISTOGRAM, *histogram_params(assessment_id, assessment_date))
+                    deleted = await conn.fetchrow(DELETE_ASSESSMENT, assessment_id, assessment_date)
+                    
+                    # Take the deleted row back out of the daily rollup and cohort cube in the same transaction
+                    if deleted:
+                        day, risk_level, sex, risk_probability, age_band, cp = deleted
+                        await conn.execute(REMOVE_FROM_DAILY_STATS, risk_probability, day, risk_level, sex)
+                        await conn.execute(REMOVE_FROM_COHORT_STATS, risk_probability, age_band, sex, cp, risk_level)
+                        await conn.execute(FORGET_SUBMISSION, assessment_id)
+                    for statement in PRUNE_STATEMENTS:
+                        await conn.execute(statement)
+            
+            print(f"Assessment {assessment_id} deleted successfully")
+            return True
+        
+        except Exception as e:
+            print(f"Error deleting assessment: {e}")
+            return False
+
+
+# Create a singleton instance
+async_db_manager = AsyncDatabaseManager()
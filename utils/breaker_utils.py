@@ -0,0 +1,88 @@
+"""
+Circuit Breaker Utilities
+Fails calls to an unreachable dependency immediately instead of letting each one wait out its own timeout.
+
+After failure_threshold failures in a row the breaker opens: callers check allow() and skip the dependency, while a
+background thread probes it every probe_interval seconds. The first probe that succeeds closes the breaker again.
+"""
+
+import time
+import threading
+
+
+class CircuitBreaker:
+    def __init__(self, name, probe, failure_threshold, probe_interval, on_recover=None):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.on_recover = on_recover
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+        # Failed and fast-failed calls per thread, so a caller can tell whether its own work failed
+        self._thread_failures = threading.local()
+    
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+    
+    @property
+    def thread_failures(self):
+        """Failed and fast-failed calls made by the calling thread; never reset"""
+        return getattr(self._thread_failures, 'count', 0)
+    
+    def _count_thread_failure(self):
+        self._thread_failures.count = self.thread_failures + 1
+    
+    def allow(self):
+        """Whether a call should go ahead; a call turned away counts as failed"""
+        if self.opened_at is None:
+            return True
+        self._count_thread_failure()
+        return False
+    
+    def record(self, healthy, error=None):
+        if healthy:
+            self.record_success()
+        else:
+            self.record_failure(error)
+    
+    def record_success(self):
+        if self.consecutive_failures:
+            with self._lock:
+                self.consecutive_failures = 0
+    
+    def record_failure(self, error=None):
+        self._count_thread_failure()
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.opened_at is not None or self.consecutive_failures < self.failure_threshold:
+                return
+            self.opened_at = time.time()
+        
+        print(f"{self.name} failed {self.failure_threshold} times in a row, failing fast until it recovers: {error}")
+        threading.Thread(target=self._run_probe, name=f"{self.name.lower().replace(' ', '-')}-probe",
+                         daemon=True).start()
+    
+    def _run_probe(self):
+        """Probe until the dependency answers, then close the breaker"""
+        while True:
+            time.sleep(self.probe_interval)
+            try:
+                self.probe()
+                break
+            except Exception:
+                continue
+        
+        if self.on_recover:
+            try:
+                self.on_recover()
+            except Exception as e:
+                print(f"Error recovering {self.name}: {e}")
+        
+        outage = time.time() - self.opened_at
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+        print(f"{self.name} reachable again after {outage:.0f}s")
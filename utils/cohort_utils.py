@@ -0,0 +1,174 @@
+"""
+Cohort Percentile Utilities
+Ranks a patient's key measurements and risk against the training cohort and the clinic's stored population.
+
+Training cohort values are kept as sorted arrays; the stored population is a bucket-count sketch read from the
+population_histogram table, which every save and delete updates in its own transaction.
+"""
+
+import os
+import csv
+import math
+import time
+import threading
+from bisect import bisect_left, bisect_right
+from utils.model_utils import predictor, FEATURE_ORDER
+from utils.db_utils import db_manager
+from utils.db_backends import HISTOGRAM_BUCKET_WIDTHS
+from utils.drift_utils import TRAINING_DATA_PATH
+
+# Seconds before the population sketch is re-read, picking up assessments saved by other workers
+POPULATION_REFRESH_INTERVAL = int(os.getenv("POPULATION_REFRESH_INTERVAL", 60))
+
+RANKED_FIELDS = list(HISTOGRAM_BUCKET_WIDTHS)
+
+
+def bucket_of(field, value):
+    """Histogram bucket of a measurement, rounding half up like the database's ROUND"""
+    return int(math.floor(float(value) / HISTOGRAM_BUCKET_WIDTHS[field] + 0.5))
+
+
+def midrank_percentile(below, equal, total):
+    """Percentage of the cohort below a value, counting ties as half below"""
+    if total <= 0:
+        return None
+    return 100.0 * (below + 0.5 * equal) / total
+
+
+class SortedCohort:
+    """Exact percentiles over a fixed set of values: one sort up front, then two binary searches per lookup"""
+    
+    def __init__(self, values):
+        self.values = sorted(values)
+    
+    def __len__(self):
+        return len(self.values)
+    
+    def percentile(self, value):
+        below = bisect_left(self.values, value)
+        return midrank_percentile(below, bisect_right(self.values, value) - below, len(self.values))
+
+
+class PercentileSketch:
+    """Bucket counts for one measurement. Sketches merge by adding counts, and lookups binary-search a
+    cumulative index that is rebuilt only after the counts change."""
+    
+    def __init__(self, counts=None):
+        self.counts = dict(counts or {})
+        self._buckets = None
+        self._cumulative = None
+    
+    @property
+    def total(self):
+        return sum(self.counts.values())
+    
+    def add(self, bucket, count=1):
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self._buckets = None
+    
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.add(bucket, count)
+        return self
+    
+    def _build_index(self):
+        self._buckets = sorted(self.counts)
+        self._cumulative = []
+        running = 0
+        for bucket in self._buckets:
+            running += self.counts[bucket]
+            self._cumulative.append(running)
+    
+    def percentile(self, bucket):
+        if self._buckets is None:
+            self._build_index()
+        if not self._cumulative:
+            return None
+        index = bisect_left(self._buckets, bucket)
+        below = self._cumulative[index - 1] if index > 0 else 0
+        return midrank_percentile(below, self.counts.get(bucket, 0), self._cumulative[-1])
+
+
+class CohortRanker:
+    def __init__(self, data_path=TRAINING_DATA_PATH):
+        self.data_path = data_path
+        self._training = None
+        self._training_version = None
+        self._population = None
+        self._population_loaded_at = 0
+        self._lock = threading.Lock()
+    
+    def _load_training(self):
+        """Sorted training values per measurement, with the current model's risk for every training row"""
+        with open(self.data_path, newline='') as f:
+            rows = [[float(row[key]) for key in FEATURE_ORDER] for row in csv.DictReader(f)]
+        
+        cohorts = {field: SortedCohort(row[FEATURE_ORDER.index(field)] for row in rows)
+                   for field in RANKED_FIELDS if field in FEATURE_ORDER}
+        risks = predictor.predict_proba_batch(rows)
+        if risks is not None:
+            cohorts['risk_probability'] = SortedCohort(risk * 100 for risk in risks)
+        return cohorts
+    
+    def training_cohort(self):
+        """Training cohorts, rescored whenever a different model version goes live"""
+        predictor.ensure_loaded()
+        version = predictor.model_version
+        if self._training is None or self._training_version != version:
+            with self._lock:
+                if self._training is None or self._training_version != version:
+                    self._training = self._load_training()
+                    self._training_version = version
+        return self._training
+    
+    def population(self):
+        """Population sketches, re-read from the histogram table every POPULATION_REFRESH_INTERVAL seconds"""
+        if self._population is None or time.time() - self._population_loaded_at > POPULATION_REFRESH_INTERVAL:
+            with self._lock:
+                if self._population is None or time.time() - self._population_loaded_at > POPULATION_REFRESH_INTERVAL:
+                    histogram = db_manager.get_population_histogram()
+                    # Keep ranking against the last sketches read while the database is unreachable
+                    if histogram is not None or self._population is None:
+                        self._population = {field: PercentileSketch((histogram or {}).get(field))
+                                            for field in RANKED_FIELDS}
+                    self._population_loaded_at = time.time()
+        return self._population
+    
+    def record(self, values):
+        """Count a just-saved assessment before the next refresh, so this worker ranks against it immediately"""
+        # A sketch loaded after the save already includes it
+        population = self._population
+        if population is None:
+            return
+        update = {field: PercentileSketch({bucket_of(field, values[field]): 1})
+                  for field in RANKED_FIELDS if values.get(field) is not None}
+        with self._lock:
+            for field, sketch in update.items():
+                population[field].merge(sketch)
+    
+    def rank(self, values):
+        """Percentile of each ranked measurement against both cohorts.
+        
+        values holds the measurements by field name, with risk_probability as a percentage.
+        """
+        training = self.training_cohort()
+        population = self.population()
+        
+        ranking = []
+        for field in RANKED_FIELDS:
+            value = values.get(field)
+            if value is None:
+                continue
+            ranking.append({
+                'field': field,
+                'value': value,
+                'training_percentile': training[field].percentile(float(value)) if field in training else None,
+                'training_size': len(training[field]) if field in training else 0,
+                'population_percentile': population[field].percentile(bucket_of(field, value)),
+                'population_size': population[field].total
+            })
+        return ranking
+
+
+# Create a singleton instance
+cohort_ranker = CohortRanker()
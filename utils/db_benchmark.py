@@ -0,0 +1,146 @@
+"""
+Database Query Benchmark
+Compares hot-query latency with prepared statements against ad-hoc execution.
+
+Run with: python -m utils.db_benchmark --iterations 500
+Add --seed 10000 to insert synthetic assessments first (only against a test database).
+Add --concurrency 50 to also compare request throughput of the threaded and asyncio data access paths.
+"""
+
+import time
+import random
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from utils.db_utils import DatabaseManager
+from utils.db_backends import get_backend
+from utils.async_db_utils import AsyncDatabaseManager
+
+
+def _timed(function, iterations):
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return latencies
+
+
+def _percentile(sorted_values, percent):
+    return sorted_values[min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))]
+
+
+def seed_assessments(manager, count):
+    """Insert synthetic assessments so the queries have realistic data to scan"""
+    for index in range(count):
+        patient = {
+            'patient_name': f"Benchmark Patient {index}",
+            'patient_id': f"BM-{index % max(1, count // 5)}",
+            'age': random.randint(29, 77), 'sex': random.randint(0, 1), 'cp': random.randint(0, 3),
+            'trestbps': random.randint(94, 200), 'chol': random.randint(126, 564), 'fbs': random.randint(0, 1),
+            'restecg': random.randint(0, 2), 'thalachh': random.randint(71, 202), 'exang': random.randint(0, 1),
+            'oldpeak': round(random.uniform(0, 6.2), 1), 'slope': random.randint(0, 2),
+            'ca': random.randint(0, 4), 'thal': random.randint(0, 3)
+        }
+        probability = random.random()
+        manager.save_patient_assessment(patient, {
+            'prediction': int(probability >= 0.5),
+            'risk_probability': probability,
+            'risk_level': 'High Risk' if probability >= 0.5 else 'Low Risk'
+        })
+
+
+def run_benchmark(iterations, include_list=False):
+    """Time each hot read query in both modes, interleaving modes so drift affects both equally"""
+    managers = {}
+    for mode, prepared in (('ad-hoc', False), ('prepared', True)):
+        manager = DatabaseManager()
+        manager.backend = get_backend(manager.database_url, prepared_statements=prepared)
+        managers[mode] = manager
+    
+    queries = {
+        'detail': lambda manager: manager.get_patient_by_id('BM-1'),
+        'search': lambda manager: manager.search_patients('patient 1'),
+        'submission': lambda manager: manager.get_submission('0' * 64)
+    }
+    if include_list:
+        queries['list'] = lambda manager: manager.get_all_assessments()
+    
+    results = {}
+    for name, query in queries.items():
+        for mode, manager in managers.items():
+            # Warm up the pool and the statement
+            _timed(lambda: query(manager), 5)
+        for mode, manager in managers.items():
+            results[(name, mode)] = _timed(lambda: query(manager), iterations)
+    
+    print(f"\n{'query':<12}{'mode':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    print("-" * 52)
+    for (name, mode), latencies in results.items():
+        print(f"{name:<12}{mode:<10}{_percentile(latencies, 50):>10.3f}"
+              f"{_percentile(latencies, 95):>10.3f}{_percentile(latencies, 99):>10.3f}")
+    return results
+
+
+def _request_mix(index):
+    """The call a simulated client makes: mostly detail lookups, with a search every tenth request"""
+    if index % 10 == 0:
+        return 'search_patients', ('patient 1',)
+    return 'get_patient_by_id', (f"BM-{index % 50}",)
+
+
+def run_throughput_benchmark(concurrency, requests):
+    """Serve the same request mix from a thread pool on DatabaseManager and from tasks on AsyncDatabaseManager"""
+    manager = DatabaseManager()
+    manager.get_patient_by_id('BM-0')
+    
+    def threaded_call(index):
+        name, args = _request_mix(index)
+        return getattr(manager, name)(*args)
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(threaded_call, range(requests)))
+    threaded_seconds = time.perf_counter() - started
+    
+    async def run_async():
+        async_manager = AsyncDatabaseManager()
+        await async_manager.get_patient_by_id('BM-0')
+        in_flight = asyncio.Semaphore(concurrency)
+        
+        async def async_call(index):
+            name, args = _request_mix(index)
+            async with in_flight:
+                return await getattr(async_manager, name)(*args)
+        
+        started = time.perf_counter()
+        await asyncio.gather(*(async_call(index) for index in range(requests)))
+        elapsed = time.perf_counter() - started
+        await async_manager.close()
+        return elapsed
+    
+    async_seconds = asyncio.run(run_async())
+    
+    print(f"\n{requests} requests, {concurrency} concurrent")
+    print(f"{'path':<12}{'seconds':>10}{'req/s':>10}")
+    print("-" * 32)
+    for path, seconds in (('threaded', threaded_seconds), ('asyncio', async_seconds)):
+        print(f"{path:<12}{seconds:>10.2f}{requests / seconds:>10.0f}")
+    return {'threaded': threaded_seconds, 'asyncio': async_seconds}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare prepared and ad-hoc query latency")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0, help="Insert this many synthetic assessments first")
+    parser.add_argument("--include-list", action="store_true", help="Also time the full history list query")
+    parser.add_argument("--concurrency", type=int, default=0, help="Also compare threaded and asyncio throughput")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests per path in the throughput comparison")
+    args = parser.parse_args()
+    
+    if args.seed:
+        seed_assessments(DatabaseManager(), args.seed)
+    run_benchmark(args.iterations, include_list=args.include_list)
+    if args.concurrency:
+        run_throughput_benchmark(args.concurrency, args.requests)
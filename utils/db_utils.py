@@ -1,71 +1,358 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
+import json
+import time
+import hashlib
+import threading
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from utils.db_backends import (
+    get_backend, next_month, histogram_buckets_query, SCHEMA_STATE_STATEMENT, COHORT_AGE_BAND, COHORT_DIMENSIONS
+)
+from utils.breaker_utils import CircuitBreaker
+from utils.assessment_sql import (
+    CLAIM_SUBMISSION_QUERY, LINK_SUBMISSION_QUERY, ADD_TO_COHORT_STATS_QUERY,
+    ADD_TO_POPULATION_HISTOGRAM_QUERY, REMOVE_FROM_POPULATION_HISTOGRAM_QUERY, REMOVE_FROM_DAILY_STATS_QUERY,
+    REMOVE_FROM_COHORT_STATS_QUERY, FORGET_SUBMISSION_QUERY, PRUNE_STATEMENTS, PATIENT_ROW_COLUMNS,
+    add_to_daily_stats_query, insert_assessment_query, delete_assessment_query, assessment_values, submission_values,
+    histogram_params
+)
 
 load_dotenv()
 
+# Local SQLite file used without a DATABASE_URL only when DATABASE_SQLITE_FALLBACK=1, for development
+DEV_DATABASE_URL = "sqlite:///ventro.db"
+SQLITE_FALLBACK = os.getenv("DATABASE_SQLITE_FALLBACK") == "1"
+
+# Visits per page of a patient's timeline
+TIMELINE_PAGE_SIZE = 10
+
+# Risk changes smaller than this many percentage points count as stable
+TREND_TOLERANCE = 1.0
+
+# Days of history shown in the dashboard trend chart
+DAILY_TREND_DAYS = 90
+
+# Monthly partitions created ahead of time, so new rows never land in the default partition
+PARTITION_PREMAKE_MONTHS = 3
+
+
+# Dashboard reads go to the replica only while it is at most this many seconds behind the primary
+REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 5))
+
+# Seconds a replica position check is reused before the replica is asked again
+REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 1))
+
+
+# Identical submissions for the same patient made within this many seconds of each other are treated as one
+SUBMISSION_DEDUP_WINDOW = int(os.getenv("SUBMISSION_DEDUP_WINDOW", 600))
+
+
+# Failures in a row after which database calls fail fast, and seconds between the background probes that follow
+DB_BREAKER_FAILURE_THRESHOLD = int(os.getenv("DB_BREAKER_FAILURE_THRESHOLD", 3))
+DB_BREAKER_PROBE_INTERVAL = float(os.getenv("DB_BREAKER_PROBE_INTERVAL", 5))
+
+
+def make_idempotency_key(patient_id, features):
+    """Hash the patient ID and feature values into a submission key; the dedup window is applied to when each
+    claim of the key was made"""
+    payload = json.dumps([str(patient_id).strip(), [float(value) for value in features]])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_database_url():
+    """DATABASE_URL, or the development SQLite file when the fallback is switched on.
+    
+    A missing DATABASE_URL is a deployment error, so it stops the app rather than quietly keeping patient data
+    in a local file.
+    """
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        return database_url
+    if SQLITE_FALLBACK:
+        print(f"WARNING: DATABASE_URL is not set; storing assessments in {DEV_DATABASE_URL} (DATABASE_SQLITE_FALLBACK=1)")
+        return DEV_DATABASE_URL
+    raise RuntimeError("DATABASE_URL is not set. Point it at PostgreSQL, or set DATABASE_URL=sqlite:///ventro.db "
+                       "(or DATABASE_SQLITE_FALLBACK=1) to store assessments in a local SQLite file.")
+
+
+def wal_position(lsn):
+    """Turn a PostgreSQL WAL position such as '16/B374D848' into a comparable integer"""
+    high, low = lsn.split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def month_start(value):
+    """First day of the month containing a date or datetime"""
+    return date(value.year, value.month, 1)
+
 class DatabaseManager:
     def __init__(self):
-        self.database_url = os.getenv("DATABASE_URL")
+        self.database_url = get_database_url()
+        self.backend = get_backend(self.database_url)
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        
+        # Optional read replica for the dashboard lookups; the primary takes every write
+        read_url = os.getenv("DATABASE_READ_URL")
+        self.read_backend = get_backend(read_url) if read_url and self.backend.supports_replicas else None
+        # Latest WAL position committed by this worker, so its own writes are never read back stale
+        self.write_position = None
+        # (checked at, replayed WAL position, lag seconds) from the last replica check
+        self._replica_state = (0, None, None)
+        self._replica_lock = threading.Lock()
+        
+        # Calls fail fast while the primary (or replica) is unreachable; a background probe closes the breaker
+        self.breaker = self._create_breaker("Database", self.backend)
+        self.read_breaker = self._create_breaker("Read replica", self.read_backend) if self.read_backend else None
+    
+    def _create_breaker(self, name, backend):
+        breaker = CircuitBreaker(name, backend.probe, DB_BREAKER_FAILURE_THRESHOLD, DB_BREAKER_PROBE_INTERVAL,
+                                 on_recover=backend.discard_connections)
+        backend.health_listener = breaker.record
+        return breaker
+    
+    def is_available(self):
+        """Whether the primary is taking calls, rather than failing them fast"""
+        return not self.breaker.is_open
+    
+    def failure_count(self):
+        """Database failures the calling thread has seen so far, to tell whether any happened during its own
+        piece of work"""
+        return self.breaker.thread_failures + (self.read_breaker.thread_failures if self.read_breaker else 0)
     
     def get_connection(self):
-        """Create and return a database connection"""
+        """Create and return a database connection, or None without trying while the circuit breaker is open"""
+        if not self.breaker.allow():
+            return None
         try:
-            conn = psycopg2.connect(self.database_url)
+            conn = self.backend.connect()
+            if not self._schema_ready:
+                # Other threads wait for the DDL rather than racing it with their own queries
+                with self._schema_lock:
+                    if not self._schema_ready:
+                        self._ensure_schema(conn)
             return conn
         except Exception as e:
+            self.breaker.record_failure(e)
             print(f"Database connection error: {e}")
             return None
     
-    def save_patient_assessment(self, patient_data, prediction_data):
-        """Save a patient assessment to the database"""
+    def get_read_connection(self, min_position=None):
+        """Connection for dashboard reads: the replica once it has replayed min_position and this
+        worker's own writes, otherwise the primary"""
+        if not self.read_backend:
+            return self.get_connection()
+        
+        if self.write_position and (not min_position or wal_position(self.write_position) > wal_position(min_position)):
+            min_position = self.write_position
+        
+        conn = None
+        try:
+            if self.read_breaker.allow():
+                conn = self.read_backend.connect()
+                if self._replica_caught_up(conn, min_position):
+                    return conn
+        except Exception as e:
+            if not conn:
+                self.read_breaker.record_failure(e)
+            print(f"Read replica unavailable, reading from primary: {e}")
+        if conn:
+            conn.close()
+        return self.get_connection()
+    
+    def _replica_caught_up(self, conn, min_position):
+        """Whether the replica is within REPLICA_MAX_LAG and has replayed min_position"""
+        checked_at, replayed, lag = self._replica_state
+        needed = wal_position(min_position) if min_position else None
+        
+        # Ask again when the last answer is old, or too far behind for this read
+        if (time.monotonic() - checked_at > REPLICA_CHECK_INTERVAL
+                or (needed is not None and (replayed is None or replayed < needed))):
+            cursor = conn.cursor()
+            cursor.execute(self.read_backend.replica_status_query)
+            position, lag = cursor.fetchone()
+            cursor.close()
+            conn.commit()
+            replayed = wal_position(position) if position else None
+            self._replica_state = (time.monotonic(), replayed, lag)
+        
+        if lag is None or lag > REPLICA_MAX_LAG:
+            return False
+        return needed is None or (replayed is not None and replayed >= needed)
+    
+    def _record_write_position(self, cursor):
+        """Remember where this commit ended in the WAL, for read-your-writes on the replica"""
+        if not self.read_backend:
+            return None
+        cursor.execute(self.backend.write_position_query)
+        position = cursor.fetchone()[0]
+        with self._replica_lock:
+            if not self.write_position or wal_position(position) > wal_position(self.write_position):
+                self.write_position = position
+        return position
+    
+    def _ensure_schema(self, conn):
+        """Create the table and apply column additions the app relies on"""
+        try:
+            cursor = conn.cursor()
+            if self.backend.schema_lock_statement:
+                cursor.execute(self.backend.schema_lock_statement)
+            # New indexes and rollup backfills scan the whole patients table
+            self.backend.lift_statement_timeout(cursor)
+            
+            # ALTER TABLE and CREATE INDEX lock tables other workers are writing to, so only run them when the schema changed
+            schema_hash = hashlib.sha256("\n".join(self.backend.schema_statements).encode()).hexdigest()
+            cursor.execute(SCHEMA_STATE_STATEMENT)
+            cursor.execute(self.backend.sql("SELECT 1 FROM schema_state WHERE schema_hash = %s"), (schema_hash,))
+            if cursor.fetchone() is None:
+                for statement in self.backend.schema_statements:
+                    cursor.execute(statement)
+                cursor.execute("DELETE FROM schema_state")
+                cursor.execute(self.backend.sql("INSERT INTO schema_state (schema_hash) VALUES (%s)"), (schema_hash,))
+            
+            # Same transaction, so no worker can see a new partitioned table before it has partitions
+            if self.backend.supports_partitions:
+                cursor.execute("SAVEPOINT create_partitions")
+                try:
+                    cursor.execute(self.backend.partition_statement(self._partition_months()))
+                except Exception as e:
+                    print(f"Error creating monthly partitions: {e}")
+                    cursor.execute("ROLLBACK TO SAVEPOINT create_partitions")
+            conn.commit()
+            cursor.close()
+        except Exception as e:
+            print(f"Error applying database schema: {e}")
+            conn.rollback()
+        # Only attempt once per process so a read-only role does not retry on every call
+        self._schema_ready = True
+    
+    def _partition_months(self):
+        """The current month and the next PARTITION_PREMAKE_MONTHS months"""
+        months = [month_start(date.today())]
+        for _ in range(PARTITION_PREMAKE_MONTHS):
+            months.append(next_month(months[-1]))
+        return months
+    
+    def _create_partitions(self, conn):
+        """Create partitions for the current month and the next PARTITION_PREMAKE_MONTHS months"""
+        if not self.backend.supports_partitions:
+            return True
+        
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.backend.partition_statement(self._partition_months()))
+            conn.commit()
+            cursor.close()
+            return True
+        except Exception as e:
+            print(f"Error creating monthly partitions: {e}")
+            conn.rollback()
+            return False
+    
+    def ensure_partitions(self):
+        """Make sure upcoming monthly partitions exist (run periodically by the retention job)"""
+        if not self.backend.supports_partitions:
+            return True
         conn = self.get_connection()
         if not conn:
             return False
         
         try:
-            cursor = conn.cursor()
+            return self._create_partitions(conn)
+        finally:
+            conn.close()
+    
+    def _dict_cursor(self, conn):
+        """Create a cursor that returns rows as dictionaries"""
+        return self.backend.dict_cursor(conn)
+    
+    def get_submission(self, idempotency_key, submitted_at=None):
+        """Return the stored result of a submission with this key made within the dedup window before submitted_at
+        (default now), or None"""
+        conn = self.get_connection()
+        if not conn:
+            return None
+        
+        try:
+            cursor = self._dict_cursor(conn)
             
-            insert_query = """
-                INSERT INTO patients (
-                    patient_name, patient_id, age, sex, cp, trestbps, chol, 
-                    fbs, restecg, thalachh, exang, oldpeak, slope, ca, thal,
-                    risk_probability, risk_level
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
+            query = """
+                SELECT assessment_id, prediction, risk_probability, risk_level, model_version
+                FROM assessment_submissions
+                WHERE idempotency_key = %s AND created_at >= %s
             """
             
-            values = (
-                patient_data['patient_name'],
-                patient_data['patient_id'],
-                patient_data['age'],
-                patient_data['sex'],
-                patient_data['cp'],
-                patient_data['trestbps'],
-                patient_data['chol'],
-                patient_data['fbs'],
-                patient_data['restecg'],
-                patient_data['thalachh'],
-                patient_data['exang'],
-                patient_data['oldpeak'],
-                patient_data['slope'],
-                patient_data['ca'],
-                patient_data['thal'],
-                prediction_data['risk_probability'] * 100,  # Convert to percentage
-                prediction_data['risk_level']
-            )
-            
-            cursor.execute(insert_query, values)
-            record_id = cursor.fetchone()[0]
+            window_start = (submitted_at or datetime.now()) - timedelta(seconds=SUBMISSION_DEDUP_WINDOW)
+            self.backend.execute(cursor, 'get_submission', query, (idempotency_key, window_start))
+            result = cursor.fetchone()
+            cursor.close()
+            conn.close()
+            
+            return result
+        
+        except Exception as e:
+            print(f"Error retrieving submission: {e}")
+            if conn:
+                conn.close()
+            return None
+    
+    def _write_assessment(self, cursor, patient_data, prediction_data, idempotency_key=None, assessment_date=None):
+        """Insert one assessment and fold it into the rollups, in the caller's transaction.
+        
+        Returns the new row's ID, or None when the idempotency key was claimed within the dedup window and nothing
+        was written. The key is claimed as of assessment_date.
+        """
+        if idempotency_key:
+            # Claim the key first; a concurrent or repeated submission waits on the key and then inserts nothing
+            self.backend.execute(cursor, 'claim_submission', CLAIM_SUBMISSION_QUERY,
+                                 submission_values(idempotency_key, prediction_data, assessment_date or datetime.now(),
+                                                   SUBMISSION_DEDUP_WINDOW))
+            if cursor.fetchone() is None:
+                return None
+        
+        self.backend.execute(cursor, 'insert_assessment', insert_assessment_query(self.backend.now()),
+                             assessment_values(patient_data, prediction_data, assessment_date))
+        record_id, assessment_date = cursor.fetchone()
+        
+        # Fold the new row into the daily rollup, cohort cube and population histogram in the same transaction
+        self.backend.execute(cursor, 'add_to_daily_stats', add_to_daily_stats_query(self.backend.date_of('assessment_date')),
+                             (record_id, assessment_date))
+        self.backend.execute(cursor, 'add_to_cohort_stats', ADD_TO_COHORT_STATS_QUERY, (record_id, assessment_date))
+        self.backend.execute(cursor, 'add_to_population_histogram', ADD_TO_POPULATION_HISTOGRAM_QUERY,
+                             histogram_params(record_id, assessment_date))
+        
+        if idempotency_key:
+            cursor.execute(self.backend.sql(LINK_SUBMISSION_QUERY), (record_id, idempotency_key))
+        return record_id
+    
+    def save_patient_assessment(self, patient_data, prediction_data, idempotency_key=None, assessment_date=None):
+        """Save a patient assessment to the database.
+        
+        With an idempotency key, a repeat of a submission saved within the dedup window before assessment_date
+        (default now) is not written again.
+        """
+        conn = self.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            cursor = conn.cursor()
+            record_id = self._write_assessment(cursor, patient_data, prediction_data, idempotency_key, assessment_date)
+            if record_id is None:
+                conn.rollback()
+                cursor.close()
+                conn.close()
+                print("Duplicate submission detected, assessment already saved")
+                return True
+            
             conn.commit()
+            self._record_write_position(cursor)
             cursor.close()
             conn.close()
             
             print(f"Patient assessment saved successfully with ID: {record_id}")
             return True
-            
+        
         except Exception as e:
             print(f"Error saving patient assessment: {e}")
             if conn:
@@ -73,14 +360,60 @@ class DatabaseManager:
                 conn.close()
             return False
     
-    def get_all_assessments(self):
-        """Retrieve all patient assessments"""
+    def save_patient_assessments(self, submissions):
+        """Save many assessments in one transaction.
+        
+        submissions is a list of (patient_data, prediction_data, idempotency_key, assessment_date) tuples, the
+        date None for now. Returns a status per
+        submission: 'saved', 'duplicate' or 'failed'. If the batch transaction fails, each submission is retried
+        on its own so one bad row does not lose the rest.
+        """
+        if not submissions:
+            return []
+        
         conn = self.get_connection()
+        if not conn:
+            return ['failed'] * len(submissions)
+        
+        try:
+            cursor = conn.cursor()
+            statuses = []
+            for patient_data, prediction_data, idempotency_key, assessment_date in submissions:
+                record_id = self._write_assessment(cursor, patient_data, prediction_data, idempotency_key,
+                                                   assessment_date)
+                statuses.append('duplicate' if record_id is None else 'saved')
+            conn.commit()
+            self._record_write_position(cursor)
+            cursor.close()
+            conn.close()
+            
+            print(f"Saved {statuses.count('saved')} of {len(submissions)} batched assessments")
+            return statuses
+        
+        except Exception as e:
+            print(f"Error saving assessment batch, saving one at a time: {e}")
+            if conn:
+                conn.rollback()
+                conn.close()
+        
+        statuses = []
+        for patient_data, prediction_data, idempotency_key, assessment_date in submissions:
+            if idempotency_key and self.get_submission(idempotency_key, assessment_date):
+                statuses.append('duplicate')
+            elif self.save_patient_assessment(patient_data, prediction_data, idempotency_key, assessment_date):
+                statuses.append('saved')
+            else:
+                statuses.append('failed')
+        return statuses
+    
+    def get_all_assessments(self, min_position=None):
+        """Retrieve all patient assessments"""
+        conn = self.get_read_connection(min_position)
         if not conn:
             return []
         
         try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor = self._dict_cursor(conn)
             
             query = """
                 SELECT 
@@ -96,57 +429,57 @@ class DatabaseManager:
                 ORDER BY assessment_date DESC
             """
             
-            cursor.execute(query)
+            self.backend.execute(cursor, 'list_assessments', query)
             results = cursor.fetchall()
             cursor.close()
             conn.close()
             
             return results
-            
+        
         except Exception as e:
             print(f"Error retrieving assessments: {e}")
             if conn:
                 conn.close()
             return []
     
-    def get_patient_by_id(self, patient_id):
+    def get_patient_by_id(self, patient_id, min_position=None):
         """Get detailed information for a specific patient"""
-        conn = self.get_connection()
+        conn = self.get_read_connection(min_position)
         if not conn:
             return None
         
         try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor = self._dict_cursor(conn)
             
-            query = """
-                SELECT *
+            query = f"""
+                SELECT {PATIENT_ROW_COLUMNS}
                 FROM patients
                 WHERE patient_id = %s
                 ORDER BY assessment_date DESC
                 LIMIT 1
             """
             
-            cursor.execute(query, (patient_id,))
+            self.backend.execute(cursor, 'latest_assessment', query, (patient_id,))
             result = cursor.fetchone()
             cursor.close()
             conn.close()
             
             return result
-            
+        
         except Exception as e:
             print(f"Error retrieving patient: {e}")
             if conn:
                 conn.close()
             return None
     
-    def search_patients(self, search_term):
+    def search_patients(self, search_term, min_position=None):
         """Search patients by name or ID"""
-        conn = self.get_connection()
+        conn = self.get_read_connection(min_position)
         if not conn:
             return []
         
         try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor = self._dict_cursor(conn)
             
             query = """
                 SELECT 
@@ -166,21 +499,222 @@ class DatabaseManager:
             """
             
             search_pattern = f"%{search_term}%"
-            cursor.execute(query, (search_pattern, search_pattern))
+            self.backend.execute(cursor, 'search_assessments', query, (search_pattern, search_pattern))
             results = cursor.fetchall()
             cursor.close()
             conn.close()
             
             return results
-            
+        
         except Exception as e:
             print(f"Error searching patients: {e}")
             if conn:
                 conn.close()
             return []
     
-    def delete_assessment(self, assessment_id):
-        """Delete a specific assessment"""
+    def get_patient_timeline(self, patient_id, page=1, page_size=TIMELINE_PAGE_SIZE):
+        """Get one page of a patient's assessments, newest first, with changes since the previous visit"""
+        conn = self.get_connection()
+        if not conn:
+            return {'visits': [], 'total_visits': 0, 'page': page, 'page_size': page_size}
+        
+        try:
+            cursor = self._dict_cursor(conn)
+            
+            # Deltas are computed over the patient's full history before the page is cut
+            query = f"""
+                SELECT
+                    timeline.*,
+                    CASE
+                        WHEN risk_change IS NULL THEN 'first'
+                        WHEN risk_change > %s THEN 'up'
+                        WHEN risk_change < -%s THEN 'down'
+                        ELSE 'stable'
+                    END AS trend,
+                    COUNT(*) OVER () AS total_visits
+                FROM (
+                    SELECT
+                        id,
+                        assessment_date,
+                        risk_probability,
+                        risk_level,
+                        model_version,
+                        trestbps,
+                        chol,
+                        thalachh,
+                        oldpeak,
+                        ROW_NUMBER() OVER visits AS visit_number,
+                        risk_probability - LAG(risk_probability) OVER visits AS risk_change,
+                        risk_probability - FIRST_VALUE(risk_probability) OVER visits AS risk_change_since_first,
+                        LAG(risk_level) OVER visits AS previous_risk_level,
+                        trestbps - LAG(trestbps) OVER visits AS trestbps_change,
+                        chol - LAG(chol) OVER visits AS chol_change,
+                        thalachh - LAG(thalachh) OVER visits AS thalachh_change,
+                        oldpeak - LAG(oldpeak) OVER visits AS oldpeak_change,
+                        {self.backend.days_between('assessment_date', 'LAG(assessment_date) OVER visits')}
+                            AS days_since_previous
+                    FROM patients
+                    WHERE patient_id = %s
+                    WINDOW visits AS (ORDER BY assessment_date, id)
+                ) timeline
+                ORDER BY visit_number DESC
+                LIMIT %s OFFSET %s
+            """
+            
+            cursor.execute(self.backend.sql(query),
+                           (TREND_TOLERANCE, TREND_TOLERANCE, patient_id, page_size, (page - 1) * page_size))
+            visits = cursor.fetchall()
+            cursor.close()
+            conn.close()
+            
+            return {
+                'visits': visits,
+                'total_visits': visits[0]['total_visits'] if visits else 0,
+                'page': page,
+                'page_size': page_size
+            }
+        
+        except Exception as e:
+            print(f"Error retrieving patient timeline: {e}")
+            if conn:
+                conn.close()
+            return {'visits': [], 'total_visits': 0, 'page': page, 'page_size': page_size}
+    
+    def get_risk_level_totals(self):
+        """Count all assessments by risk level from the daily rollup"""
+        conn = self.get_connection()
+        if not conn:
+            return {}
+        
+        try:
+            cursor = conn.cursor()
+            
+            query = """
+                SELECT risk_level, SUM(assessment_count)
+                FROM daily_assessment_stats
+                GROUP BY risk_level
+            """
+            
+            cursor.execute(query)
+            totals = {risk_level: int(count) for risk_level, count in cursor.fetchall()}
+            cursor.close()
+            conn.close()
+            
+            return totals
+        
+        except Exception as e:
+            print(f"Error retrieving assessment totals: {e}")
+            if conn:
+                conn.close()
+            return {}
+    
+    def get_daily_trend(self, days=DAILY_TREND_DAYS):
+        """Daily assessment counts and mean risk per risk level from the daily rollup"""
+        conn = self.get_connection()
+        if not conn:
+            return []
+        
+        try:
+            cursor = self._dict_cursor(conn)
+            
+            query = """
+                SELECT
+                    day,
+                    risk_level,
+                    SUM(assessment_count) AS assessment_count,
+                    SUM(risk_probability_sum) / SUM(assessment_count) AS mean_risk_probability
+                FROM daily_assessment_stats
+                WHERE day >= %s
+                GROUP BY day, risk_level
+                ORDER BY day
+            """
+            
+            cursor.execute(self.backend.sql(query), (date.today() - timedelta(days=days - 1),))
+            results = cursor.fetchall()
+            cursor.close()
+            conn.close()
+            
+            return results
+        
+        except Exception as e:
+            print(f"Error retrieving daily trend: {e}")
+            if conn:
+                conn.close()
+            return []
+    
+    def get_cohort_breakdown(self, group_by, filters=None):
+        """Assessment counts and mean risk per value of one cohort dimension, from the cohort cube.
+        
+        filters maps dimensions to the values to keep; an empty or missing list keeps every value.
+        """
+        if group_by not in COHORT_DIMENSIONS:
+            raise ValueError(f"Unknown cohort dimension: {group_by}")
+        
+        conn = self.get_connection()
+        if not conn:
+            return []
+        
+        try:
+            cursor = self._dict_cursor(conn)
+            
+            conditions = []
+            params = []
+            for dimension in COHORT_DIMENSIONS:
+                values = (filters or {}).get(dimension)
+                if values:
+                    conditions.append(f"{dimension} IN ({', '.join(['%s'] * len(values))})")
+                    params.extend(values)
+            
+            query = f"""
+                SELECT
+                    {group_by} AS value,
+                    SUM(assessment_count) AS assessment_count,
+                    SUM(risk_probability_sum) / SUM(assessment_count) AS mean_risk_probability
+                FROM cohort_stats
+                {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+                GROUP BY {group_by}
+                ORDER BY {group_by}
+            """
+            
+            cursor.execute(self.backend.sql(query), params)
+            results = cursor.fetchall()
+            cursor.close()
+            conn.close()
+            
+            return results
+        
+        except Exception as e:
+            print(f"Error retrieving cohort breakdown: {e}")
+            if conn:
+                conn.close()
+            return []
+    
+    def purge_submissions(self, older_than):
+        """Forget idempotency keys created before a datetime; they can no longer match a new submission"""
+        conn = self.get_connection()
+        if not conn:
+            return 0
+        
+        try:
+            cursor = conn.cursor()
+            self.backend.lift_statement_timeout(cursor)
+            cursor.execute(self.backend.sql("DELETE FROM assessment_submissions WHERE created_at < %s"), (older_than,))
+            purged = cursor.rowcount
+            conn.commit()
+            cursor.close()
+            conn.close()
+            
+            return purged
+        
+        except Exception as e:
+            print(f"Error purging submissions: {e}")
+            if conn:
+                conn.rollback()
+                conn.close()
+            return 0
+    
+    def rebuild_daily_stats(self):
+        """Recompute the daily rollup from the patients table"""
         conn = self.get_connection()
         if not conn:
             return False
@@ -188,16 +722,271 @@ class DatabaseManager:
         try:
             cursor = conn.cursor()
             
-            delete_query = "DELETE FROM patients WHERE id = %s"
-            cursor.execute(delete_query, (assessment_id,))
+            rebuild_query = f"""
+                INSERT INTO daily_assessment_stats (day, risk_level, sex, assessment_count, risk_probability_sum)
+                SELECT {self.backend.date_of('assessment_date')}, risk_level, sex, COUNT(*), SUM(risk_probability)
+                FROM patients
+                GROUP BY {self.backend.date_of('assessment_date')}, risk_level, sex
+            """
             
+            self.backend.lift_statement_timeout(cursor)
+            cursor.execute("DELETE FROM daily_assessment_stats")
+            cursor.execute(rebuild_query)
             conn.commit()
             cursor.close()
             conn.close()
             
-            print(f"Assessment {assessment_id} deleted successfully")
+            print("Daily assessment statistics rebuilt successfully")
+            return True
+        
+        except Exception as e:
+            print(f"Error rebuilding daily statistics: {e}")
+            if conn:
+                conn.rollback()
+                conn.close()
+            return False
+    
+    def rebuild_cohort_stats(self):
+        """Recompute the cohort cube from the patients table"""
+        conn = self.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            cursor = conn.cursor()
+            
+            rebuild_query = f"""
+                INSERT INTO cohort_stats (age_band, sex, cp, risk_level, assessment_count, risk_probability_sum)
+                SELECT {COHORT_AGE_BAND}, sex, cp, risk_level, COUNT(*), SUM(risk_probability)
+                FROM patients
+                GROUP BY {COHORT_AGE_BAND}, sex, cp, risk_level
+            """
+            
+            self.backend.lift_statement_timeout(cursor)
+            cursor.execute("DELETE FROM cohort_stats")
+            cursor.execute(rebuild_query)
+            conn.commit()
+            cursor.close()
+            conn.close()
+            
+            print("Cohort statistics rebuilt successfully")
             return True
+        
+        except Exception as e:
+            print(f"Error rebuilding cohort statistics: {e}")
+            if conn:
+                conn.rollback()
+                conn.close()
+            return False
+    
+    def get_population_histogram(self):
+        """Assessment counts per bucket for each ranked measurement, as {field: {bucket: count}}, or None when
+        the database cannot be read"""
+        conn = self.get_connection()
+        if not conn:
+            return None
+        
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT field, bucket, assessment_count FROM population_histogram")
+            histogram = {}
+            for field, bucket, count in cursor.fetchall():
+                histogram.setdefault(field, {})[bucket] = count
+            cursor.close()
+            conn.close()
             
+            return histogram
+        
+        except Exception as e:
+            print(f"Error retrieving population histogram: {e}")
+            if conn:
+                conn.close()
+            return None
+    
+    def rebuild_population_histogram(self):
+        """Recompute the population histogram from the patients table"""
+        conn = self.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            cursor = conn.cursor()
+            
+            rebuild_query = f"""
+                INSERT INTO population_histogram (field, bucket, assessment_count)
+                SELECT field, bucket, COUNT(*)
+                FROM ({histogram_buckets_query('1 = 1')}) buckets
+                GROUP BY field, bucket
+            """
+            
+            self.backend.lift_statement_timeout(cursor)
+            cursor.execute("DELETE FROM population_histogram")
+            cursor.execute(rebuild_query)
+            conn.commit()
+            cursor.close()
+            conn.close()
+            
+            print("Population histogram rebuilt successfully")
+            return True
+        
+        except Exception as e:
+            print(f"Error rebuilding population histogram: {e}")
+            if conn:
+                conn.rollback()
+                conn.close()
+            return False
+    
+    def _date_bounds(self, start_date, end_date):
+        """Convert an inclusive date range into [start, end) datetime bounds"""
+        start = date.fromisoformat(str(start_date)[:10])
+        end = date.fromisoformat(str(end_date)[:10]) + timedelta(days=1)
+        return datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+    
+    def count_assessments_between(self, start_date, end_date):
+        """Count assessments recorded within an inclusive date range"""
+        conn = self.get_connection()
+        if not conn:
+            raise ConnectionError("Database connection unavailable")
+        
+        try:
+            cursor = conn.cursor()
+            
+            query = """
+                SELECT COUNT(*)
+                FROM patients
+                WHERE assessment_date >= %s AND assessment_date < %s
+            """
+            
+            cursor.execute(self.backend.sql(query), self._date_bounds(start_date, end_date))
+            count = cursor.fetchone()[0]
+            cursor.close()
+            
+            return count
+        
+        finally:
+            conn.close()
+    
+    def iter_assessments_between(self, start_date, end_date, batch_size=500):
+        """Stream full assessments within an inclusive date range in batches"""
+        conn = self.get_connection()
+        if not conn:
+            raise ConnectionError("Database connection unavailable")
+        
+        try:
+            cursor = self.backend.streaming_cursor(conn, "assessment_export", batch_size)
+            
+            query = f"""
+                SELECT {PATIENT_ROW_COLUMNS}
+                FROM patients
+                WHERE assessment_date >= %s AND assessment_date < %s
+                ORDER BY assessment_date
+            """
+            
+            cursor.execute(self.backend.sql(query), self._date_bounds(start_date, end_date))
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield batch
+            cursor.close()
+        
+        finally:
+            conn.close()
+    
+    def iter_feature_vectors(self, columns, batch_size=10000):
+        """Stream (id, assessment_date, *values) rows for every stored assessment in batches, values in the order
+        of columns"""
+        conn = self.get_read_connection()
+        if not conn:
+            raise ConnectionError("Database connection unavailable")
+        
+        try:
+            # Plain tuples; building a dictionary per row dominates the read at this size
+            cursor = self.backend.streaming_cursor(conn, "feature_vectors", batch_size, dict_rows=False)
+            cursor.execute(f"SELECT id, assessment_date, {', '.join(columns)} FROM patients")
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield batch
+            cursor.close()
+        
+        finally:
+            conn.close()
+    
+    def get_assessments_by_keys(self, keys):
+        """Get full assessments by (id, assessment_date) key, as {id: assessment}; rows no longer stored are left out.
+        
+        The dates limit the read to the partitions of the months they fall in.
+        """
+        if not keys:
+            return {}
+        
+        conn = self.get_read_connection()
+        if not conn:
+            return {}
+        
+        try:
+            cursor = self._dict_cursor(conn)
+            
+            query = f"""
+                SELECT {PATIENT_ROW_COLUMNS}
+                FROM patients
+                WHERE id IN ({', '.join(['%s'] * len(keys))})
+                    AND assessment_date IN ({', '.join(['%s'] * len(keys))})
+            """
+            
+            ids, dates = zip(*keys)
+            cursor.execute(self.backend.sql(query), ids + dates)
+            # The two lists can pair an id with another key's date; keep exact matches only
+            wanted = set(keys)
+            assessments = {row['id']: dict(row) for row in cursor.fetchall()
+                           if (row['id'], row['assessment_date']) in wanted}
+            cursor.close()
+            conn.close()
+            
+            return assessments
+        
+        except Exception as e:
+            print(f"Error retrieving assessments: {e}")
+            if conn:
+                conn.close()
+            return {}
+    
+    def delete_assessment(self, assessment_id, assessment_date):
+        """Delete a specific assessment, given its id and assessment_date (both part of the row's key)"""
+        conn = self.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            cursor = conn.cursor()
+            
+            # Take the row out of the population histogram while it can still be read
+            cursor.execute(self.backend.sql(REMOVE_FROM_POPULATION_HISTOGRAM_QUERY),
+                           histogram_params(assessment_id, assessment_date))
+            cursor.execute(self.backend.sql(delete_assessment_query(self.backend.date_of('assessment_date'))),
+                           (assessment_id, assessment_date))
+            deleted = cursor.fetchone()
+            
+            # Take the deleted row back out of the daily rollup and cohort cube in the same transaction
+            if deleted:
+                day, risk_level, sex, risk_probability, age_band, cp = deleted
+                cursor.execute(self.backend.sql(REMOVE_FROM_DAILY_STATS_QUERY), (risk_probability, day, risk_level, sex))
+                cursor.execute(self.backend.sql(REMOVE_FROM_COHORT_STATS_QUERY),
+                               (risk_probability, age_band, sex, cp, risk_level))
+                cursor.execute(self.backend.sql(FORGET_SUBMISSION_QUERY), (assessment_id,))
+            for statement in PRUNE_STATEMENTS:
+                cursor.execute(statement)
+            
+            conn.commit()
+            self._record_write_position(cursor)
+            cursor.close()
+            conn.close()
+            
+            print(f"Assessment {assessment_id} deleted successfully")
+            return True
+        
         except Exception as e:
             print(f"Error deleting assessment: {e}")
             if conn:
@@ -206,4 +995,11 @@ class DatabaseManager:
             return False
 
 # Create a singleton instance
-db_manager = DatabaseManager()
\ No newline at end of file
+db_manager = DatabaseManager()
+
+
+if __name__ == "__main__":
+    # Repair the daily rollup, cohort cube and population histogram, e.g. after rows were changed outside the app
+    db_manager.rebuild_daily_stats()
+    db_manager.rebuild_cohort_stats()
+    db_manager.rebuild_population_histogram()
@@ -0,0 +1,283 @@
+"""
+Drift Monitoring Utilities
+Streams statistics for live model inputs and compares them with the training distribution.
+
+Rebuild the training baseline with: python -m utils.drift_utils
+"""
+
+import os
+import csv
+import hmac
+import json
+import math
+import time
+import threading
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime
+from utils.model_utils import FEATURE_ORDER
+
+TRAINING_DATA_PATH = os.path.join('Dataset', 'cleaned_merged_heart_dataset.csv')
+BASELINE_PATH = os.path.join('Dataset', 'training_baseline.json')
+DRIFT_CHECK_INTERVAL = int(os.getenv("DRIFT_CHECK_INTERVAL", 300))
+# Live statistics cover the last this many check intervals (an hour by default), so months of earlier traffic
+# cannot dilute a new shift
+DRIFT_WINDOW_CHECKS = int(os.getenv("DRIFT_WINDOW_CHECKS", 12))
+BASELINE_BINS = 10
+
+# Shared secret for /monitoring/drift, sent in the X-Monitoring-Token header; the route is not registered when unset
+MONITORING_TOKEN = os.getenv("MONITORING_TOKEN")
+MONITORING_HEADER = 'X-Monitoring-Token'
+
+# PSI above this is conventionally treated as a significant shift
+PSI_ALERT_THRESHOLD = 0.25
+PSI_EPSILON = 1e-4
+
+CATEGORICAL_FEATURES = {'sex', 'cp', 'fbs', 'restecg', 'exang', 'slope', 'ca', 'thal'}
+
+
+class StreamingFeatureStats:
+    """Constant-memory statistics for one feature: Welford mean/variance plus a fixed-bin
+    histogram (continuous features) or category counts (categorical features)."""
+    
+    def __init__(self, bin_edges=None):
+        self.bin_edges = bin_edges
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.bin_counts = [0] * (len(bin_edges) + 1) if bin_edges is not None else None
+        self.category_counts = {} if bin_edges is None else None
+    
+    def update(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        
+        if self.bin_counts is not None:
+            self.bin_counts[bisect_right(self.bin_edges, value)] += 1
+        else:
+            category = str(int(value)) if value.is_integer() else str(value)
+            self.category_counts[category] = self.category_counts.get(category, 0) + 1
+    
+    def merge(self, other):
+        """Add another set of statistics for the same feature and bins into this one"""
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+        self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+        
+        if self.bin_counts is not None:
+            self.bin_counts = [mine + theirs for mine, theirs in zip(self.bin_counts, other.bin_counts)]
+        else:
+            for category, category_count in other.category_counts.items():
+                self.category_counts[category] = self.category_counts.get(category, 0) + category_count
+    
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+    
+    def proportions(self):
+        """Share of observations per histogram bin or per category"""
+        if self.bin_counts is not None:
+            return [count / self.count if self.count else 0.0 for count in self.bin_counts]
+        return {category: count / self.count for category, count in self.category_counts.items()}
+    
+    def to_dict(self):
+        summary = {'count': self.count, 'mean': self.mean, 'std': self.std,
+                   'min': self.minimum, 'max': self.maximum}
+        if self.bin_counts is not None:
+            summary.update({'type': 'continuous', 'bin_edges': self.bin_edges, 'bin_proportions': self.proportions()})
+        else:
+            summary.update({'type': 'categorical', 'category_proportions': self.proportions()})
+        return summary
+
+
+def build_training_baseline(data_path=TRAINING_DATA_PATH, bins=BASELINE_BINS):
+    """Summarise the training data with decile bin edges for each continuous feature"""
+    with open(data_path, newline='') as f:
+        rows = [[float(row[key]) for key in FEATURE_ORDER] for row in csv.DictReader(f)]
+    
+    features = {}
+    for index, key in enumerate(FEATURE_ORDER):
+        values = sorted(row[index] for row in rows)
+        bin_edges = None
+        if key not in CATEGORICAL_FEATURES:
+            quantiles = [values[min(len(values) - 1, round(len(values) * i / bins))] for i in range(1, bins)]
+            bin_edges = sorted(set(quantiles))
+        
+        stats = StreamingFeatureStats(bin_edges)
+        for value in values:
+            stats.update(value)
+        features[key] = stats.to_dict()
+    
+    return {'source': data_path, 'rows': len(rows), 'features': features}
+
+
+def population_stability_index(expected, actual):
+    """PSI between two aligned lists of bin proportions"""
+    psi = 0.0
+    for expected_share, actual_share in zip(expected, actual):
+        expected_share = max(expected_share, PSI_EPSILON)
+        actual_share = max(actual_share, PSI_EPSILON)
+        psi += (actual_share - expected_share) * math.log(actual_share / expected_share)
+    return psi
+
+
+def ks_statistic(expected, actual):
+    """Largest gap between the cumulative distributions of two aligned lists of bin proportions"""
+    expected_cdf = actual_cdf = largest_gap = 0.0
+    for expected_share, actual_share in zip(expected, actual):
+        expected_cdf += expected_share
+        actual_cdf += actual_share
+        largest_gap = max(largest_gap, abs(expected_cdf - actual_cdf))
+    return largest_gap
+
+
+class DriftMonitor:
+    def __init__(self, baseline_path=BASELINE_PATH, check_interval=DRIFT_CHECK_INTERVAL,
+                 window_checks=DRIFT_WINDOW_CHECKS):
+        self.baseline_path = baseline_path
+        self.check_interval = check_interval
+        self._baseline = None
+        # Statistics per check interval, newest last; live inputs go into the newest and the oldest falls off
+        self._window = deque(maxlen=max(1, window_checks))
+        self._lock = threading.Lock()
+        self._last_report = None
+        self._scheduler_started = False
+    
+    def _ensure_baseline(self):
+        """Load the precomputed baseline, building it from the training data if it is missing"""
+        if self._baseline is not None:
+            return
+        with self._lock:
+            if self._baseline is not None:
+                return
+            if os.path.exists(self.baseline_path):
+                with open(self.baseline_path) as f:
+                    baseline = json.load(f)
+            else:
+                baseline = build_training_baseline()
+            self._baseline = baseline
+            self._window.append(self._new_stats())
+    
+    def _new_stats(self):
+        return {key: StreamingFeatureStats(self._baseline['features'][key].get('bin_edges')) for key in FEATURE_ORDER}
+    
+    def rotate(self):
+        """Start the next check interval's statistics, dropping the oldest interval once the window is full"""
+        self._ensure_baseline()
+        with self._lock:
+            self._window.append(self._new_stats())
+    
+    def update(self, features, result=None, latency=None):
+        """Add one live feature vector to the streaming statistics (prediction listener)"""
+        try:
+            self._ensure_baseline()
+            with self._lock:
+                stats = self._window[-1]
+                for key, value in zip(FEATURE_ORDER, features):
+                    stats[key].update(value)
+        except Exception as e:
+            print(f"Error updating drift statistics: {e}")
+    
+    def compare(self):
+        """Score every feature's live distribution over the window against the training baseline"""
+        self._ensure_baseline()
+        combined = self._new_stats()
+        with self._lock:
+            window_checks = len(self._window)
+            for stats in self._window:
+                for key in FEATURE_ORDER:
+                    combined[key].merge(stats[key])
+        live = {key: stats.to_dict() for key, stats in combined.items()}
+        
+        features = {}
+        for key in FEATURE_ORDER:
+            expected, actual = self._baseline['features'][key], live[key]
+            report = {'live': actual, 'baseline_mean': expected['mean'], 'baseline_std': expected['std']}
+            
+            if actual['count']:
+                if expected['type'] == 'continuous':
+                    expected_shares, actual_shares = expected['bin_proportions'], actual['bin_proportions']
+                else:
+                    categories = sorted(set(expected['category_proportions']) | set(actual['category_proportions']))
+                    expected_shares = [expected['category_proportions'].get(c, 0.0) for c in categories]
+                    actual_shares = [actual['category_proportions'].get(c, 0.0) for c in categories]
+                report['psi'] = population_stability_index(expected_shares, actual_shares)
+                report['ks'] = ks_statistic(expected_shares, actual_shares)
+                report['drifted'] = report['psi'] > PSI_ALERT_THRESHOLD
+            features[key] = report
+        
+        report = {
+            'checked_at': datetime.now().isoformat(timespec='seconds'),
+            'live_count': live[FEATURE_ORDER[0]]['count'],
+            'window_seconds': window_checks * self.check_interval,
+            'baseline_rows': self._baseline['rows'],
+            'psi_alert_threshold': PSI_ALERT_THRESHOLD,
+            'drifted_features': [key for key, value in features.items() if value.get('drifted')],
+            'features': features
+        }
+        self._last_report = report
+        return report
+    
+    def get_report(self, refresh=False):
+        """Return the most recent scheduled comparison, computing one if needed"""
+        if refresh or self._last_report is None:
+            return self.compare()
+        return self._last_report
+    
+    def start_scheduler(self):
+        """Compare against the baseline every check_interval seconds on a background thread"""
+        if self._scheduler_started:
+            return
+        self._scheduler_started = True
+        threading.Thread(target=self._run_scheduler, name="drift-monitor", daemon=True).start()
+    
+    def _run_scheduler(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                report = self.compare()
+                self.rotate()
+                if report['drifted_features']:
+                    print(f"Feature drift detected (PSI > {PSI_ALERT_THRESHOLD}): "
+                          f"{', '.join(report['drifted_features'])}")
+            except Exception as e:
+                print(f"Error comparing feature drift: {e}")
+
+
+def register_monitoring_routes(server):
+    """Register the drift monitoring route on the Flask server when MONITORING_TOKEN is set"""
+    if not MONITORING_TOKEN:
+        return
+    
+    from flask import abort, jsonify, request
+    
+    @server.route('/monitoring/drift')
+    def feature_drift():
+        token = request.headers.get(MONITORING_HEADER)
+        if not token or not hmac.compare_digest(token.encode(), MONITORING_TOKEN.encode()):
+            abort(404)
+        return jsonify(drift_monitor.get_report(refresh=request.args.get('refresh') == '1'))
+
+
+# Create a singleton instance
+drift_monitor = DriftMonitor()
+
+
+if __name__ == "__main__":
+    baseline = build_training_baseline()
+    with open(BASELINE_PATH, 'w') as f:
+        json.dump(baseline, f, indent=2)
+    print(f"Training baseline written to {BASELINE_PATH} ({baseline['rows']} rows)")
@@ -0,0 +1,114 @@
+"""
+Explanation Utilities
+Exact per-prediction feature contributions (TreeSHAP) for tree ensembles.
+"""
+
+import math
+import numpy as np
+
+
+class TreeShapExplainer:
+    """Exact path-dependent TreeSHAP for scikit-learn decision tree ensembles.
+
+    Every root-to-leaf path is flattened once into per-leaf arrays holding, for
+    each distinct feature on the path, the interval of values that reaches the
+    leaf and the fraction of training cover that follows the path. A leaf then
+    contributes the Shapley values of a product game over those features, which
+    are evaluated for all leaves at once with polynomial arithmetic in
+    O(leaves x depth^2) NumPy operations per explanation.
+    """
+
+    def __init__(self, model, n_features, positive_class=1):
+        self.n_features = n_features
+        estimators = getattr(model, 'estimators_', [model])
+        class_index = list(model.classes_).index(positive_class)
+
+        paths = []
+        for estimator in estimators:
+            paths.extend(self._collect_leaf_paths(estimator.tree_, class_index))
+
+        depth = max(1, max(len(conditions) for _, conditions in paths))
+        n_leaves = len(paths)
+
+        self.features = np.zeros((n_leaves, depth), dtype=np.intp)
+        self.lower = np.full((n_leaves, depth), -np.inf)
+        self.upper = np.full((n_leaves, depth), np.inf)
+        self.zero_fractions = np.ones((n_leaves, depth))
+        self.mask = np.zeros((n_leaves, depth), dtype=bool)
+        self.leaf_values = np.zeros(n_leaves)
+
+        for leaf, (value, conditions) in enumerate(paths):
+            # sklearn forests average the per-tree probabilities
+            self.leaf_values[leaf] = value / len(estimators)
+            for slot, (feature, (lower, upper, zero_fraction)) in enumerate(conditions.items()):
+                self.features[leaf, slot] = feature
+                self.lower[leaf, slot] = lower
+                self.upper[leaf, slot] = upper
+                self.zero_fractions[leaf, slot] = zero_fraction
+                self.mask[leaf, slot] = True
+
+        # Shapley weights k! (d - k - 1)! / d! for a leaf with d path features
+        path_lengths = self.mask.sum(axis=1)
+        self.weights = np.zeros((n_leaves, depth))
+        for leaf, d in enumerate(path_lengths):
+            for k in range(d):
+                self.weights[leaf, k] = math.factorial(k) * math.factorial(d - k - 1) / math.factorial(d)
+
+        self.expected_value = float(np.sum(self.leaf_values * np.prod(self.zero_fractions, axis=1)))
+
+    @staticmethod
+    def _collect_leaf_paths(tree, class_index):
+        """Return (leaf value, {feature: [lower, upper, zero fraction]}) for every leaf"""
+        cover = tree.weighted_n_node_samples
+        paths = []
+        stack = [(0, {})]
+        while stack:
+            node, conditions = stack.pop()
+            left, right = tree.children_left[node], tree.children_right[node]
+
+            if left == right:
+                class_values = tree.value[node, 0]
+                paths.append((float(class_values[class_index] / class_values.sum()), conditions))
+                continue
+
+            feature, threshold = int(tree.feature[node]), float(tree.threshold[node])
+            for child, goes_left in ((left, True), (right, False)):
+                lower, upper, zero_fraction = conditions.get(feature, (-np.inf, np.inf, 1.0))
+                if goes_left:
+                    upper = min(upper, threshold)
+                else:
+                    lower = max(lower, threshold)
+                child_conditions = dict(conditions)
+                child_conditions[feature] = (lower, upper, zero_fraction * cover[child] / cover[node])
+                stack.append((child, child_conditions))
+        return paths
+
+    def shap_values(self, x):
+        """Return the contribution of each feature to the prediction for one scaled sample"""
+        x = np.asarray(x, dtype=float)
+        values = x[self.features]
+        # sklearn sends a sample left when value <= threshold
+        one_fractions = ((values > self.lower) & (values <= self.upper) & self.mask).astype(float)
+        zero_fractions = self.zero_fractions
+        n_leaves, depth = one_fractions.shape
+
+        # Coefficients of prod_j (z_j + o_j * t) over each leaf's path features
+        poly = np.zeros((n_leaves, depth + 1))
+        poly[:, 0] = 1.0
+        for slot in range(depth):
+            extended = poly * zero_fractions[:, slot:slot + 1]
+            extended[:, 1:] += poly[:, :-1] * one_fractions[:, slot:slot + 1]
+            poly = extended
+
+        # Divide out each feature's own factor to get the polynomial over the other features
+        without_one = np.zeros((n_leaves, depth, depth))
+        without_one[:, :, depth - 1] = poly[:, depth][:, None]
+        for k in range(depth - 1, 0, -1):
+            without_one[:, :, k - 1] = poly[:, k][:, None] - zero_fractions * without_one[:, :, k]
+        without_zero = poly[:, None, :depth] / zero_fractions[:, :, None]
+        others = np.where(one_fractions[:, :, None] > 0, without_one, without_zero)
+
+        weighted = np.einsum('lik,lk->li', others, self.weights)
+        contributions = self.leaf_values[:, None] * (one_fractions - zero_fractions) * weighted
+        return np.bincount(self.features[self.mask], weights=contributions[self.mask],
+                           minlength=self.n_features)
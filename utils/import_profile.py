@@ -0,0 +1,119 @@
+"""
+Import Profile Report
+Measures how long importing the app takes and which modules dominate it.
+
+Run with: python -m utils.import_profile [module] [--top N] [--before REF]
+
+With --before, the module is also profiled as of a git revision (checked out in a temporary worktree) and a
+before/after table is printed, e.g. --before HEAD~1 to measure the last commit.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+def profile_imports(module_name, cwd=None):
+    """Import a module in a fresh interpreter with -X importtime and parse the timings"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        capture_output=True, text=True, cwd=cwd
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module_name} failed:\n{result.stderr}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip())) // 2,
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000
+        })
+    return timings
+
+
+def profile_imports_at(module_name, ref):
+    """Profile a module as of a git revision, from a temporary worktree of this repository"""
+    directory = tempfile.mkdtemp(prefix="import-profile-")
+    worktree = os.path.join(directory, "tree")
+    subprocess.run(["git", "worktree", "add", "--detach", worktree, ref], check=True, capture_output=True, text=True)
+    try:
+        return profile_imports(module_name, cwd=worktree)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", worktree], capture_output=True)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _total_ms(module_name, timings):
+    return next((t['cumulative_ms'] for t in timings if t['module'] == module_name), 0)
+
+
+def _package_times(timings):
+    """Self time per top-level package"""
+    packages = {}
+    for timing in timings:
+        root = timing['module'].split('.')[0]
+        packages[root] = packages.get(root, 0) + timing['self_ms']
+    return packages
+
+
+def print_report(module_name, timings, top=20):
+    """Print total import time, the slowest top-level packages and the slowest modules overall"""
+    total = _total_ms(module_name, timings)
+    packages = _package_times(timings)
+
+    print("=" * 60)
+    print(f"IMPORT PROFILE: {module_name}")
+    print("=" * 60)
+    print(f"Total import time: {total:.1f} ms ({len(timings)} modules)\n")
+
+    print("Top packages by self time")
+    print("-" * 60)
+    for name, self_ms in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"{self_ms:10.1f} ms  {name}")
+
+    print("\nTop modules by cumulative time")
+    print("-" * 60)
+    for timing in sorted(timings, key=lambda t: t['cumulative_ms'], reverse=True)[:top]:
+        print(f"{timing['cumulative_ms']:10.1f} ms  {timing['module']}")
+
+
+def print_comparison(module_name, ref, before, after, top=20):
+    """Print total import time and per-package self time before (at ref) and after (the working tree)"""
+    before_packages, after_packages = _package_times(before), _package_times(after)
+    before_total, after_total = _total_ms(module_name, before), _total_ms(module_name, after)
+
+    print("=" * 60)
+    print(f"IMPORT PROFILE: {module_name}, {ref} -> working tree")
+    print("=" * 60)
+    print(f"{'':22}{'before':>12}{'after':>12}{'change':>12}")
+    print(f"{'Total import time':22}{before_total:>9.1f} ms{after_total:>9.1f} ms{after_total - before_total:>+9.1f} ms")
+    print(f"{'Modules imported':22}{len(before):>12}{len(after):>12}{len(after) - len(before):>+12}\n")
+
+    print("Top packages by self time")
+    print("-" * 60)
+    names = sorted(set(before_packages) | set(after_packages),
+                   key=lambda name: max(before_packages.get(name, 0), after_packages.get(name, 0)), reverse=True)
+    for name in names[:top]:
+        before_ms, after_ms = before_packages.get(name, 0), after_packages.get(name, 0)
+        print(f"{name:22}{before_ms:>9.1f} ms{after_ms:>9.1f} ms{after_ms - before_ms:>+9.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report module import times")
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--before", metavar="REF", help="also profile this git revision and compare")
+    args = parser.parse_args()
+    if args.before:
+        print_comparison(args.module, args.before, profile_imports_at(args.module, args.before),
+                         profile_imports(args.module), top=args.top)
+    else:
+        print_report(args.module, profile_imports(args.module), top=args.top)
@@ -0,0 +1,27 @@
+"""
+Background Job Utilities
+Configures the disk-backed runner for long-running Dash callbacks.
+"""
+
+import os
+import diskcache
+from dash import DiskcacheManager
+
+BACKGROUND_CACHE_DIR = os.getenv("BACKGROUND_CACHE_DIR", os.path.join(".cache", "background_callbacks"))
+BACKGROUND_CACHE_SIZE_LIMIT = int(os.getenv("BACKGROUND_CACHE_SIZE_LIMIT", 256 * 1024 * 1024))
+
+
+def create_background_callback_manager():
+    """Create the background callback manager.
+
+    Jobs run in their own processes and report progress, cancellation and
+    results through a SQLite-backed diskcache, so no external broker is needed.
+    Results are not cached: each result is removed once it is collected, so
+    repeating a job (such as an export of a range that has new rows) runs it again.
+    """
+    cache = diskcache.Cache(BACKGROUND_CACHE_DIR, size_limit=BACKGROUND_CACHE_SIZE_LIMIT)
+    return DiskcacheManager(cache)
+
+
+# Create a singleton instance
+background_callback_manager = create_background_callback_manager()
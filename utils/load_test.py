@@ -0,0 +1,263 @@
+"""
+Load Testing Harness
+Drives the real Dash callback endpoint with simulated clinicians and reports throughput and latency.
+
+Synthetic run:  python -m utils.load_test --url http://localhost:8050 --users 1,5,10,25 --stage-duration 30
+Replay run:     python -m utils.load_test --replay payloads.jsonl --users 10
+
+Record real callback payloads by starting the app with DASH_RECORD_PAYLOADS=payloads.jsonl.
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from collections import defaultdict
+
+UPDATE_COMPONENT_PATH = '/_dash-update-component'
+DEPENDENCIES_PATH = '/_dash-dependencies'
+REQUEST_TIMEOUT = 30
+
+# Output of each scenario's callback (without allow_duplicate suffixes) and its share of the traffic
+SCENARIOS = {
+    'predict': ('patient-output.children', 0.4),
+    'results': ('results-output.children', 0.3),
+    'history': ('history-table-container.children', 0.3)
+}
+
+
+def register_recording_hook(server, path):
+    """Append every callback request body to a JSON Lines file for later replay"""
+    from flask import request
+    
+    lock = threading.Lock()
+    
+    @server.before_request
+    def record_callback_payload():
+        if request.path == UPDATE_COMPONENT_PATH and request.method == 'POST':
+            body = request.get_data(as_text=True)
+            with lock, open(path, 'a') as f:
+                f.write(json.dumps(json.loads(body)) + "\n")
+
+
+def _post_json(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+        response.read()
+        return response.status
+
+
+def _split_output(output):
+    """Turn a callback's output string into the 'outputs' list the renderer sends"""
+    def split_one(output_id):
+        component_id, prop = output_id.rsplit('.', 1)
+        return {'id': component_id, 'property': prop.split('@')[0]}
+    
+    if output.startswith('..'):
+        return [split_one(part) for part in output[2:-2].split('...')]
+    return split_one(output)
+
+
+def _scenario_name(output):
+    """Name a callback after its scenario, or after its first output component otherwise"""
+    outputs = _split_output(output)
+    first = outputs[0] if isinstance(outputs, list) else outputs
+    first_output = f"{first['id']}.{first['property']}"
+    for name, (scenario_output, _) in SCENARIOS.items():
+        if scenario_output == first_output:
+            return name
+    return first['id']
+
+
+def _random_patient():
+    return {
+        'patient-name': f"Load Test {random.randint(1, 10 ** 6)}",
+        'patient-id-input': f"LT-{random.randint(1, 5000)}",
+        'patient-age': random.randint(29, 77),
+        'patient-sex': random.randint(0, 1),
+        'patient-cp': random.randint(0, 3),
+        'patient-trestbps': random.randint(94, 200),
+        'patient-chol': random.randint(126, 564),
+        'patient-fbs': random.randint(0, 1),
+        'patient-restecg': random.randint(0, 2),
+        'patient-thalachh': random.randint(71, 202),
+        'patient-exang': random.randint(0, 1),
+        'patient-oldpeak': round(random.uniform(0, 6.2), 1),
+        'patient-slope': random.randint(0, 2),
+        'patient-ca': random.randint(0, 4),
+        'patient-thal': random.randint(0, 3)
+    }
+
+
+def _prediction_store(patient):
+    keys = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg',
+            'thalachh', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+    return {
+        'prediction': 1,
+        'risk_probability': round(random.random(), 3),
+        'risk_level': 'High Risk',
+        'patient_data': {key: patient[f'patient-{key}'] for key in keys},
+        'patient_name': patient['patient-name'],
+        'patient_id': patient['patient-id-input']
+    }
+
+
+class SyntheticPayloads:
+    """Builds callback payloads for each scenario from the app's own dependency graph"""
+    
+    def __init__(self, base_url):
+        with urllib.request.urlopen(base_url + DEPENDENCIES_PATH, timeout=REQUEST_TIMEOUT) as response:
+            dependencies = json.loads(response.read())
+        
+        self.callbacks = {_scenario_name(dependency['output']): dependency for dependency in dependencies}
+        for name, (output, _) in SCENARIOS.items():
+            if name not in self.callbacks:
+                raise ValueError(f"No callback found for scenario '{name}' ({output})")
+    
+    def _values(self, name):
+        patient = _random_patient()
+        if name == 'predict':
+            return dict(patient, **{'patient-button.n_clicks': 1}), ['patient-button.n_clicks']
+        if name == 'results':
+            return {'prediction-store.data': _prediction_store(patient)}, ['prediction-store.data']
+        return {'history-refresh-interval.n_intervals': random.randint(1, 100)}, ['history-refresh-interval.n_intervals']
+    
+    def next(self):
+        """Return (scenario name, payload) drawn according to the traffic mix"""
+        names = list(SCENARIOS)
+        name = random.choices(names, weights=[SCENARIOS[n][1] for n in names])[0]
+        dependency = self.callbacks[name]
+        values, changed = self._values(name)
+        
+        def fill(items):
+            return [dict(item, value=values.get(f"{item['id']}.{item['property']}", values.get(item['id'])))
+                    for item in items]
+        
+        return name, {
+            'output': dependency['output'],
+            'outputs': _split_output(dependency['output']),
+            'inputs': fill(dependency['inputs']),
+            'state': fill(dependency['state']),
+            'changedPropIds': changed
+        }
+
+
+class RecordedPayloads:
+    """Replays recorded callback payloads in random order"""
+    
+    def __init__(self, path):
+        with open(path) as f:
+            self.payloads = [json.loads(line) for line in f if line.strip()]
+        if not self.payloads:
+            raise ValueError(f"No payloads recorded in {path}")
+    
+    def next(self):
+        payload = random.choice(self.payloads)
+        return _scenario_name(payload['output']), payload
+
+
+class LoadTest:
+    def __init__(self, base_url, payloads, think_time=(1.0, 3.0)):
+        self.url = base_url + UPDATE_COMPONENT_PATH
+        self.payloads = payloads
+        self.think_time = think_time
+        self._lock = threading.Lock()
+        self._results = []
+    
+    def _user(self, stop_at):
+        while time.time() < stop_at:
+            name, payload = self.payloads.next()
+            started = time.perf_counter()
+            try:
+                status = _post_json(self.url, payload)
+                ok = status < 400
+            except (urllib.error.URLError, OSError):
+                ok = False
+            latency = time.perf_counter() - started
+            with self._lock:
+                self._results.append((name, latency, ok))
+            time.sleep(random.uniform(*self.think_time))
+    
+    def run_stage(self, users, duration):
+        """Run a fixed number of concurrent users for a stage and return its results"""
+        self._results = []
+        stop_at = time.time() + duration
+        threads = [threading.Thread(target=self._user, args=(stop_at,), daemon=True) for _ in range(users)]
+        started = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return list(self._results), time.time() - started
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(results, elapsed):
+    """Throughput, latency percentiles and error rate overall and per scenario"""
+    groups = defaultdict(list)
+    for name, latency, ok in results:
+        groups['all'].append((latency, ok))
+        groups[name].append((latency, ok))
+    
+    summary = {}
+    for name, samples in groups.items():
+        latencies = sorted(latency * 1000 for latency, _ in samples)
+        errors = sum(1 for _, ok in samples if not ok)
+        summary[name] = {
+            'requests': len(samples),
+            'throughput_rps': len(samples) / elapsed if elapsed else 0.0,
+            'p50_ms': _percentile(latencies, 50),
+            'p90_ms': _percentile(latencies, 90),
+            'p95_ms': _percentile(latencies, 95),
+            'p99_ms': _percentile(latencies, 99),
+            'error_rate': errors / len(samples)
+        }
+    return summary
+
+
+def print_summary(users, summary):
+    print(f"\n{users} concurrent users")
+    print("-" * 78)
+    print(f"{'scenario':<10}{'requests':>10}{'req/s':>9}{'p50 ms':>10}{'p90 ms':>10}"
+          f"{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for name, stats in sorted(summary.items(), key=lambda item: item[0] != 'all'):
+        print(f"{name:<10}{stats['requests']:>10}{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>10.1f}"
+              f"{stats['p90_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['error_rate']:>9.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the Dash callback endpoint")
+    parser.add_argument("--url", default=os.getenv("LOAD_TEST_URL", "http://localhost:8050"))
+    parser.add_argument("--users", default="1,5,10,25", help="Comma-separated user counts to ramp through")
+    parser.add_argument("--stage-duration", type=float, default=30, help="Seconds per ramp stage")
+    parser.add_argument("--think-min", type=float, default=1.0, help="Minimum think time in seconds")
+    parser.add_argument("--think-max", type=float, default=3.0, help="Maximum think time in seconds")
+    parser.add_argument("--replay", help="JSON Lines file of recorded callback payloads")
+    parser.add_argument("--json", help="Also write the per-stage summaries to this file")
+    args = parser.parse_args()
+    
+    base_url = args.url.rstrip('/')
+    payloads = RecordedPayloads(args.replay) if args.replay else SyntheticPayloads(base_url)
+    load_test = LoadTest(base_url, payloads, think_time=(args.think_min, args.think_max))
+    
+    report = []
+    for users in (int(count) for count in args.users.split(',')):
+        results, elapsed = load_test.run_stage(users, args.stage_duration)
+        summary = summarize(results, elapsed)
+        print_summary(users, summary)
+        report.append({'users': users, 'summary': summary})
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -1,65 +1,297 @@
-import joblib
-import pandas as pd
 import numpy as np
 import os
+import time
+import threading
+from functools import lru_cache
+from utils.explain_utils import TreeShapExplainer
+
+FEATURE_ORDER = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs',
+                 'restecg', 'thalachh', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+
+EXPLANATION_CACHE_SIZE = 4096
+
+# Model artifacts: a versioned registry, falling back to the original notebook exports
+MODEL_DIR = 'Model and EDA notebook'
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(MODEL_DIR, 'registry'))
+MODEL_FILENAME = 'random_forest_model.pkl'
+SCALER_FILENAME = 'scaler.pkl'
+CURRENT_VERSION_FILE = 'CURRENT'
+BASELINE_VERSION = 'baseline'
+MODEL_RELOAD_INTERVAL = int(os.getenv("MODEL_RELOAD_INTERVAL", 30))
+
+# Known high- and low-risk patients used to sanity check a model before it goes live
+VALIDATION_FEATURES = [
+    [65, 1, 3, 160, 280, 1, 2, 110, 1, 3.5, 2, 3, 2],
+    [35, 0, 0, 110, 180, 0, 0, 160, 0, 0.5, 0, 0, 0]
+]
+
+
+def scale_features(scaler, rows):
+    """Scale feature vectors given as plain arrays in FEATURE_ORDER with a scaler from load_bundle"""
+    return scaler.transform(np.asarray(rows, dtype=float))
+
+
+def accept_feature_arrays(name, artifact):
+    """Let an artifact fitted on a DataFrame take plain arrays in FEATURE_ORDER without scikit-learn warning that
+    they have no feature names, and without building a DataFrame per call: the fitted names are checked against
+    FEATURE_ORDER once here, then dropped from this loaded copy. Raises ValueError if they differ."""
+    names = getattr(artifact, 'feature_names_in_', None)
+    if names is not None:
+        if list(names) != FEATURE_ORDER:
+            raise ValueError(f"{name} was fitted on features {list(names)}, not {FEATURE_ORDER}")
+        del artifact.feature_names_in_
+    return artifact
+
+
+def get_registry_version():
+    """Return the version named by the registry's CURRENT file, or None without a registry"""
+    current_path = os.path.join(MODEL_REGISTRY_DIR, CURRENT_VERSION_FILE)
+    try:
+        with open(current_path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def get_artifact_paths(version):
+    """Return the (model, scaler) paths for a model version"""
+    if version == BASELINE_VERSION:
+        directory = MODEL_DIR
+    else:
+        directory = os.path.join(MODEL_REGISTRY_DIR, version)
+    return os.path.join(directory, MODEL_FILENAME), os.path.join(directory, SCALER_FILENAME)
+
+
+class ModelBundle:
+    """A loaded model version with its scaler and explanation cache. Never modified once live."""
+    
+    def __init__(self, version, model, scaler):
+        self.version = version
+        self.model = model
+        self.scaler = scaler
+        # Precompute tree path statistics once; explanations are cached per feature vector
+        try:
+            self.explainer = TreeShapExplainer(model, len(FEATURE_ORDER))
+        except Exception as e:
+            print(f"Explanations unavailable for model version {version}: {e}")
+            self.explainer = None
+        self.explain_cached = lru_cache(maxsize=EXPLANATION_CACHE_SIZE)(self._explain)
+    
+    def validate(self):
+        """Raise ValueError unless the artifacts fit the app's 13 features and produce probabilities"""
+        for name, artifact in (('model', self.model), ('scaler', self.scaler)):
+            n_features = getattr(artifact, 'n_features_in_', None)
+            if n_features != len(FEATURE_ORDER):
+                raise ValueError(f"{name} expects {n_features} features, not {len(FEATURE_ORDER)}")
+        if not hasattr(self.model, 'predict_proba') or 1 not in list(self.model.classes_):
+            raise ValueError("model does not predict the high-risk class probability")
+        
+        probabilities = self.model.predict_proba(scale_features(self.scaler, VALIDATION_FEATURES))
+        if not np.all(np.isfinite(probabilities)) or probabilities.min() < 0 or probabilities.max() > 1:
+            raise ValueError("model returned invalid probabilities for the validation patients")
+    
+    def _explain(self, features):
+        """Compute per-feature contributions for one feature vector"""
+        scaled_features = scale_features(self.scaler, [features])[0]
+        contributions = self.explainer.shap_values(scaled_features)
+        return {
+            'expected_value': self.explainer.expected_value,
+            'contributions': {key: float(value) for key, value in zip(FEATURE_ORDER, contributions)}
+        }
+
+
+def load_bundle(version):
+    """Load and validate a model version from disk, raising if it cannot be used"""
+    # joblib unpickling pulls in scikit-learn, so it is only imported when a model is needed
+    import joblib
+    
+    model_path, scaler_path = get_artifact_paths(version)
+    
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found at: {model_path}")
+    if not os.path.exists(scaler_path):
+        raise FileNotFoundError(f"Scaler file not found at: {scaler_path}")
+    
+    # Load using joblib
+    model = accept_feature_arrays('model', joblib.load(model_path))
+    scaler = accept_feature_arrays('scaler', joblib.load(scaler_path))
+    bundle = ModelBundle(version, model, scaler)
+    bundle.validate()
+    return bundle
+
 
 class HeartDiseasePredictor:
     def __init__(self):
-        self.model = None
-        self.scaler = None
-        self.load_model()
+        self._bundle = None
+        self._load_lock = threading.Lock()
+        self._load_attempted = False
+        self._warm_up_started = False
+        self._failed_version = None
+        self._prediction_listeners = []
+    
+    @property
+    def model(self):
+        return self._bundle.model if self._bundle else None
+    
+    @property
+    def scaler(self):
+        return self._bundle.scaler if self._bundle else None
     
-    def load_model(self):
-        """Load the trained model and scaler"""
+    @property
+    def model_version(self):
+        return self._bundle.version if self._bundle else None
+    
+    def load_model(self, version=None):
+        """Load, validate and activate a model version (the registry's current version by default)"""
+        version = version or get_registry_version() or BASELINE_VERSION
         try:
-            model_path = 'Model and EDA notebook/random_forest_model.pkl'
-            scaler_path = 'Model and EDA notebook/scaler.pkl'
-            
-            if not os.path.exists(model_path):
-                print(f"Model file not found at: {model_path}")
-                return
-            if not os.path.exists(scaler_path):
-                print(f"Scaler file not found at: {scaler_path}")
-                return
-            
-            # Load using joblib
-            self.model = joblib.load(model_path)
-            self.scaler = joblib.load(scaler_path)
+            bundle = load_bundle(version)
             
-            print("Model and scaler loaded successfully!")
+            # Swapping the reference is atomic; in-flight predictions finish on the bundle they started with
+            self._bundle = bundle
+            self._failed_version = None
             
+            print(f"Model and scaler loaded successfully! (version: {version})")
+            return True
+        
         except Exception as e:
-            print(f"Error loading model: {e}")
+            self._failed_version = version
+            print(f"Error loading model version {version}: {e}")
             print(f"Current working directory: {os.getcwd()}")
+            return False
+    
+    def ensure_loaded(self):
+        """Load the model on first use"""
+        if self._load_attempted:
+            return
+        with self._load_lock:
+            if not self._load_attempted:
+                self.load_model()
+                self._load_attempted = True
+    
+    def warm_up(self):
+        """Load the model and start watching the registry on a background thread"""
+        if self._warm_up_started:
+            return
+        self._warm_up_started = True
+        threading.Thread(target=self._watch_registry, name="model-registry-watcher", daemon=True).start()
+    
+    def _watch_registry(self):
+        """Hot-swap to a new version whenever the registry's CURRENT file changes"""
+        self.ensure_loaded()
+        while True:
+            time.sleep(MODEL_RELOAD_INTERVAL)
+            version = get_registry_version()
+            if not version or version in (self.model_version, self._failed_version):
+                continue
+            
+            print(f"Model registry now points at version {version}, reloading...")
+            with self._load_lock:
+                self.load_model(version)
+    
+    def add_prediction_listener(self, listener):
+        """Call listener(features, result, latency_seconds) after every successful prediction.
+
+        Listeners run on the request thread, so they must return immediately.
+        """
+        self._prediction_listeners.append(listener)
+    
+    def _notify_listeners(self, features, result, latency):
+        for listener in self._prediction_listeners:
+            try:
+                listener(features, result, latency)
+            except Exception as e:
+                print(f"Error in prediction listener: {e}")
     
     def predict(self, features):
         """Make prediction based on patient features"""
-        if self.model is None or self.scaler is None:
+        self.ensure_loaded()
+        bundle = self._bundle
+        if bundle is None:
             print("Model or scaler not loaded properly!")
             return None
-            
+        
         try:
-            feature_order = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 
-                           'restecg', 'thalachh', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
-            
-            df = pd.DataFrame([features], columns=feature_order)
-            scaled_features = self.scaler.transform(df)
-            prediction = self.model.predict(scaled_features)[0]
+            started = time.perf_counter()
+            scaled_features = scale_features(bundle.scaler, [features])
+            prediction = bundle.model.predict(scaled_features)[0]
             
             try:
-                probability = self.model.predict_proba(scaled_features)[0]
+                probability = bundle.model.predict_proba(scaled_features)[0]
                 # Convert NumPy float64 to Python float
                 risk_probability = float(probability[1])
             except:
                 risk_probability = None
             
-            return {
+            result = {
                 'prediction': int(prediction),
                 'risk_probability': risk_probability,
-                'risk_level': 'High Risk' if prediction == 1 else 'Low Risk'
+                'risk_level': 'High Risk' if prediction == 1 else 'Low Risk',
+                'model_version': bundle.version
             }
         except Exception as e:
             print(f"Error making prediction: {e}")
             return None
+        
+        self._notify_listeners(features, result, time.perf_counter() - started)
+        return result
+    
+    def predict_batch(self, feature_rows):
+        """Make predictions for many patients in one inference call; each result matches predict()'s"""
+        self.ensure_loaded()
+        bundle = self._bundle
+        if bundle is None:
+            print("Model or scaler not loaded properly!")
+            return None
+        
+        try:
+            started = time.perf_counter()
+            scaled_features = scale_features(bundle.scaler, feature_rows)
+            predictions = bundle.model.predict(scaled_features)
+            probabilities = bundle.model.predict_proba(scaled_features)[:, 1]
+            
+            results = [{
+                'prediction': int(prediction),
+                'risk_probability': float(probability),
+                'risk_level': 'High Risk' if prediction == 1 else 'Low Risk',
+                'model_version': bundle.version
+            } for prediction, probability in zip(predictions, probabilities)]
+        except Exception as e:
+            print(f"Error making batch prediction: {e}")
+            return None
+        
+        latency = (time.perf_counter() - started) / max(len(results), 1)
+        for features, result in zip(feature_rows, results):
+            self._notify_listeners(features, result, latency)
+        return results
+    
+    def predict_proba_batch(self, feature_rows):
+        """Return the high-risk probability for many feature vectors in one inference call"""
+        self.ensure_loaded()
+        bundle = self._bundle
+        if bundle is None:
+            print("Model or scaler not loaded properly!")
+            return None
+        
+        try:
+            scaled_features = scale_features(bundle.scaler, feature_rows)
+            return bundle.model.predict_proba(scaled_features)[:, 1]
+        except Exception as e:
+            print(f"Error making batch prediction: {e}")
+            return None
+    
+    def explain(self, features):
+        """Explain how each feature moved the risk probability away from the average patient"""
+        self.ensure_loaded()
+        bundle = self._bundle
+        if bundle is None or bundle.explainer is None:
+            print("Model or explainer not loaded properly!")
+            return None
+        
+        try:
+            return bundle.explain_cached(tuple(float(value) for value in features))
+        except Exception as e:
+            print(f"Error explaining prediction: {e}")
+            return None
 
-predictor = HeartDiseasePredictor()
\ No newline at end of file
+predictor = HeartDiseasePredictor()
@@ -0,0 +1,286 @@
+"""
+Request Profiling Utilities
+Opt-in sampling profiler for individual Dash callback requests.
+
+Set PROFILE_TOKEN to enable it. A callback request is profiled when it carries the token in the X-Profile-Token
+header; opening any page with ?profile=<token> profiles every callback from that browser until ?profile=off.
+Each profiled request writes a JSON call tree with wall and CPU time, split into model, database and layout-building
+time, to PROFILE_DIR. Without PROFILE_TOKEN the callback dispatch view is not wrapped at all.
+"""
+
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import functools
+import threading
+from datetime import datetime
+from utils.load_test import UPDATE_COMPONENT_PATH
+
+# Shared secret that turns profiling on for a request; profiling is unavailable when unset
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Seconds between stack samples
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.001))
+
+# The sampler waits for the GIL like any thread, so while a profiled request runs the interpreter hands it over
+# this often instead of every 5 ms; callbacks are often shorter than that
+PROFILE_SWITCH_INTERVAL = PROFILE_SAMPLE_INTERVAL / 5
+
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_QUERY_ARG = 'profile'
+PROFILE_COOKIE = 'ventro_profile'
+
+# A sample's time is charged to the category of its innermost frame that matches one of these paths
+PROFILE_CATEGORIES = [
+    ('db', ('utils/db_utils.py', 'utils/db_backends.py', 'utils/async_db_utils.py', '/psycopg2/', '/sqlite3/')),
+    ('model', ('utils/model_utils.py', 'utils/explain_utils.py', 'utils/whatif_utils.py', '/sklearn/', '/numpy/',
+               '/scipy/', '/joblib/')),
+    ('layout', ('/dash/development/', '/dash/html/', '/dash/dcc/', '/dash/dash_table/', '/dash_bootstrap_components/',
+                '/plotly/', '/dash/_utils.py', '/json/'))
+]
+OTHER_CATEGORY = 'other'
+
+
+def _frame_name(code):
+    """Short readable name for a code object: function (file:line)"""
+    path = code.co_filename.replace('\\', '/')
+    if 'site-packages/' in path:
+        path = path.split('site-packages/', 1)[1]
+    elif path.startswith(os.getcwd().replace('\\', '/')):
+        path = os.path.relpath(path)
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+@functools.lru_cache(maxsize=None)
+def _code_category(filename):
+    path = filename.replace('\\', '/')
+    for category, markers in PROFILE_CATEGORIES:
+        if any(marker in path for marker in markers):
+            return category
+    return None
+
+
+def _categorize(stack):
+    """Category of a root-to-leaf stack of code objects"""
+    for code in reversed(stack):
+        category = _code_category(code.co_filename)
+        if category:
+            return category
+    return OTHER_CATEGORY
+
+
+def _thread_cpu_clock(thread_id):
+    """Clock reading another thread's CPU time, or None where the platform has none"""
+    try:
+        clock_id = time.pthread_getcpuclockid(thread_id)
+        time.clock_gettime(clock_id)
+        return lambda: time.clock_gettime(clock_id)
+    except (AttributeError, OSError):
+        return None
+
+
+class CallTreeNode:
+    """Time spent in one call path; children are keyed by code object and named only when exported"""
+    
+    def __init__(self, code=None):
+        self.code = code
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.samples = 0
+        self.children = {}
+    
+    def add(self, stack, wall, cpu):
+        node = self
+        node.wall += wall
+        node.cpu += cpu
+        node.samples += 1
+        for code in stack:
+            child = node.children.get(code)
+            if child is None:
+                child = node.children[code] = CallTreeNode(code)
+            node = child
+            node.wall += wall
+            node.cpu += cpu
+            node.samples += 1
+    
+    def to_dict(self):
+        return {
+            'name': _frame_name(self.code) if self.code else 'request',
+            'wall_ms': round(self.wall * 1000, 3),
+            'cpu_ms': round(self.cpu * 1000, 3),
+            'samples': self.samples,
+            'children': [child.to_dict() for child in sorted(self.children.values(), key=lambda node: -node.wall)]
+        }
+
+
+class RequestSampler:
+    """Samples one thread's stack from a background thread, charging the time since the previous sample
+    to the stack found, below the frame running stop_code"""
+    
+    def __init__(self, thread_id, stop_code, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.stop_code = stop_code
+        self.interval = interval
+        self.tree = CallTreeNode()
+        self.categories = {category: {'wall': 0.0, 'cpu': 0.0} for category, _ in PROFILE_CATEGORIES}
+        self.categories[OTHER_CATEGORY] = {'wall': 0.0, 'cpu': 0.0}
+        self.cpu_clock = _thread_cpu_clock(thread_id)
+        self._stopped = False
+        self._thread = None
+    
+    def start(self):
+        self._last_wall = time.perf_counter()
+        self._last_cpu = self.cpu_clock() if self.cpu_clock else 0.0
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stopped = True
+        self._thread.join()
+    
+    def _run(self):
+        # A plain sleep gives up the GIL once per sample; Event.wait would take it back several times
+        while True:
+            time.sleep(self.interval)
+            if self._stopped:
+                break
+            self._sample()
+    
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        wall_now = time.perf_counter()
+        cpu_now = self.cpu_clock() if self.cpu_clock else 0.0
+        wall, cpu = wall_now - self._last_wall, cpu_now - self._last_cpu
+        self._last_wall, self._last_cpu = wall_now, cpu_now
+        
+        stack = []
+        while frame is not None and frame.f_code is not self.stop_code:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        
+        self.tree.add(stack, wall, cpu)
+        totals = self.categories[_categorize(stack)]
+        totals['wall'] += wall
+        totals['cpu'] += cpu
+
+
+def _token_matches(value):
+    """Constant-time comparison with PROFILE_TOKEN; compared as bytes, since compare_digest rejects non-ASCII str"""
+    return bool(value) and hmac.compare_digest(value.encode(), PROFILE_TOKEN.encode())
+
+
+def _profile_requested(request):
+    """Whether this request carries the profiling token, in the header or the cookie set by ?profile="""
+    return _token_matches(request.headers.get(PROFILE_HEADER) or request.cookies.get(PROFILE_COOKIE))
+
+
+def _callback_name(request):
+    """The callback's output, from the dispatch request body"""
+    try:
+        output = (request.get_json(silent=True) or {}).get('output', 'callback')
+    except Exception:
+        output = 'callback'
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', output.strip('.'))[:80]
+
+
+_switch_interval_lock = threading.Lock()
+_active_profiles = 0
+_default_switch_interval = None
+
+
+def _begin_fast_switching():
+    global _active_profiles, _default_switch_interval
+    with _switch_interval_lock:
+        if _active_profiles == 0:
+            _default_switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(PROFILE_SWITCH_INTERVAL)
+        _active_profiles += 1
+
+
+def _end_fast_switching():
+    global _active_profiles
+    with _switch_interval_lock:
+        _active_profiles -= 1
+        if _active_profiles == 0:
+            sys.setswitchinterval(_default_switch_interval)
+
+
+def profile_call(function, *args, **kwargs):
+    """Run function under the sampler; returns (result, profile)"""
+    sampler = RequestSampler(threading.get_ident(), profile_call.__code__)
+    _begin_fast_switching()
+    started_wall = time.perf_counter()
+    started_cpu = time.thread_time()
+    sampler.start()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        sampler.stop()
+        _end_fast_switching()
+    wall = time.perf_counter() - started_wall
+    cpu = time.thread_time() - started_cpu
+    
+    profile = {
+        'wall_ms': round(wall * 1000, 3),
+        'cpu_ms': round(cpu * 1000, 3),
+        'sample_interval_ms': sampler.interval * 1000,
+        'samples': sampler.tree.samples,
+        # Time after the last sample, and all of a request shorter than one interval
+        'unsampled_ms': round(max(0.0, wall - sampler.tree.wall) * 1000, 3),
+        'per_category_cpu': sampler.cpu_clock is not None,
+        'categories': {category: {'wall_ms': round(totals['wall'] * 1000, 3), 'cpu_ms': round(totals['cpu'] * 1000, 3)}
+                       for category, totals in sampler.categories.items()},
+        'call_tree': sampler.tree.to_dict()
+    }
+    return result, profile
+
+
+def write_profile(profile, name):
+    """Save a profile as JSON in PROFILE_DIR; returns its path"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{name}.json")
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+    return path
+
+
+def register_profiling_hooks(server):
+    """Wrap the Dash callback dispatch view with the on-demand profiler when PROFILE_TOKEN is set"""
+    if not PROFILE_TOKEN:
+        return
+    
+    from flask import request
+    
+    endpoint = next(rule.endpoint for rule in server.url_map.iter_rules() if rule.rule.endswith(UPDATE_COMPONENT_PATH))
+    dispatch = server.view_functions[endpoint]
+    
+    @functools.wraps(dispatch)
+    def profiled_dispatch(*args, **kwargs):
+        if not _profile_requested(request):
+            return dispatch(*args, **kwargs)
+        
+        name = _callback_name(request)
+        response, profile = profile_call(dispatch, *args, **kwargs)
+        profile.update({'callback': name, 'path': request.path, 'recorded_at': datetime.now().isoformat()})
+        try:
+            path = write_profile(profile, name)
+            print(f"Profiled {name} in {profile['wall_ms']:.1f} ms: {path}")
+        except Exception as e:
+            print(f"Error writing request profile: {e}")
+        return response
+    
+    server.view_functions[endpoint] = profiled_dispatch
+    
+    @server.after_request
+    def remember_profile_flag(response):
+        """Turn profiling on or off for the rest of this browser session via ?profile=<token> or ?profile=off"""
+        value = request.args.get(PROFILE_QUERY_ARG)
+        if value == 'off':
+            response.delete_cookie(PROFILE_COOKIE)
+        elif _token_matches(value):
+            response.set_cookie(PROFILE_COOKIE, value, httponly=True, samesite='Strict', secure=request.is_secure)
+        return response
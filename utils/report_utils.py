@@ -0,0 +1,172 @@
+"""
+Report Utilities
+Builds assessment report data and packages bulk report exports.
+"""
+
+import os
+import re
+import uuid
+import zipfile
+import tempfile
+from datetime import datetime, timedelta
+from utils.db_utils import db_manager
+
+# Value mapping functions for readable display
+VALUE_MAPPINGS = {
+    'sex': lambda v: "Male" if v == 1 else "Female",
+    'cp': {0: "Typical Angina", 1: "Atypical Angina", 2: "Non-anginal Pain", 3: "Asymptomatic"},
+    'fbs': lambda v: "Yes (> 120 mg/dl)" if v == 1 else "No (≤ 120 mg/dl)",
+    'restecg': {0: "Normal", 1: "ST-T Wave Abnormality", 2: "Left Ventricular Hypertrophy"},
+    'exang': lambda v: "Yes" if v == 1 else "No",
+    'slope': {0: "Upsloping", 1: "Flat", 2: "Downsloping"},
+    'thal': {0: "Normal", 1: "Fixed Defect", 2: "Reversible Defect", 3: "Reversible Defect (Type 3)"}
+}
+
+REPORT_EXPORT_DIR = os.getenv("REPORT_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "ventro_reports"))
+REPORT_EXPORT_BATCH_SIZE = 200
+REPORT_ARCHIVE_MAX_AGE = timedelta(hours=6)
+
+
+def get_mapped_value(field_name, value):
+    """Get human-readable value for a field."""
+    mapper = VALUE_MAPPINGS.get(field_name)
+    if mapper is None:
+        return str(value)
+
+    if callable(mapper):
+        return mapper(value)
+    else:
+        return mapper.get(value, "Unknown")
+
+
+def create_report_data(patient, risk_percentage, risk_text, assessment_date=None):
+    """Create report data dictionary for export."""
+    assessment_date = assessment_date or datetime.now()
+    return {
+        'patient_details': {
+            'Age': f"{patient['age']} years",
+            'Sex': get_mapped_value('sex', patient['sex']),
+            'Chest Pain Type': get_mapped_value('cp', patient['cp']),
+            'Resting Blood Pressure': f"{patient['trestbps']} mm Hg",
+            'Serum Cholesterol': f"{patient['chol']} mg/dl",
+            'Fasting Blood Sugar': get_mapped_value('fbs', patient['fbs']),
+            'Resting ECG': get_mapped_value('restecg', patient['restecg']),
+            'Maximum Heart Rate': f"{patient['thalachh']} bpm",
+            'Exercise Induced Angina': get_mapped_value('exang', patient['exang']),
+            'ST Depression': f"{patient['oldpeak']}",
+            'Slope': get_mapped_value('slope', patient['slope']),
+            'Number of Major Vessels': f"{patient['ca']}",
+            'Thalassemia': get_mapped_value('thal', patient['thal'])
+        },
+        'risk_assessment': {
+            'Risk Probability': f"{risk_percentage:.1f}%",
+            'Risk Level': risk_text,
+            'Assessment Date': assessment_date.strftime("%Y-%m-%d %H:%M:%S")
+        }
+    }
+
+
+def format_report_text(report_data):
+    """Format report data as plain text, matching the browser export in custom.js."""
+    lines = [
+        "=" * 60,
+        "HEART DISEASE RISK ASSESSMENT REPORT",
+        "=" * 60,
+        "",
+        f"Assessment Date: {report_data['risk_assessment']['Assessment Date']}",
+        "",
+        "PATIENT DETAILS",
+        "-" * 60
+    ]
+    lines.extend(f"{key}: {value}" for key, value in report_data['patient_details'].items())
+    lines.extend([
+        "",
+        "RISK ASSESSMENT",
+        "-" * 60,
+        f"Risk Probability: {report_data['risk_assessment']['Risk Probability']}",
+        f"Risk Level: {report_data['risk_assessment']['Risk Level']}",
+        "",
+        "=" * 60
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def _render_assessment_report(assessment):
+    """Render one stored assessment into (archive filename, report text)."""
+    assessment_date = assessment['assessment_date']
+    risk_percentage = float(assessment['risk_probability'])
+    report_data = create_report_data(assessment, risk_percentage, assessment['risk_level'],
+                                     assessment_date=assessment_date)
+    safe_patient_id = re.sub(r'[^A-Za-z0-9_-]+', '_', str(assessment['patient_id']))
+    filename = f"{safe_patient_id}_{assessment['id']}_{assessment_date.strftime('%Y%m%d_%H%M%S')}.txt"
+    return filename, format_report_text(report_data)
+
+
+def _cleanup_old_archives(output_dir):
+    """Delete exported archives once they expire"""
+    cutoff = (datetime.now() - REPORT_ARCHIVE_MAX_AGE).timestamp()
+    for filename in os.listdir(output_dir):
+        path = os.path.join(output_dir, filename)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+
+
+def get_report_archive_path(archive_id):
+    """Return the path of a finished archive, or None if it does not exist"""
+    if not re.fullmatch(r'[0-9a-f]{32}', archive_id or ''):
+        return None
+    path = os.path.join(REPORT_EXPORT_DIR, f"{archive_id}.zip")
+    return path if os.path.exists(path) else None
+
+
+def build_report_archive(start_date, end_date, progress_callback=None):
+    """Render every assessment in the date range into a ZIP archive.
+
+    Reports are rendered and written to the archive batch by batch as
+    assessments stream in. Rendering is CPU-bound, so it runs sequentially in
+    the background job's own process. ``progress_callback(completed, total)``
+    is called after each batch. Returns ``(archive_id, report_count)``.
+    """
+    os.makedirs(REPORT_EXPORT_DIR, exist_ok=True)
+    _cleanup_old_archives(REPORT_EXPORT_DIR)
+
+    archive_id = uuid.uuid4().hex
+    archive_path = os.path.join(REPORT_EXPORT_DIR, f"{archive_id}.zip")
+    partial_path = archive_path + ".part"
+
+    try:
+        total = db_manager.count_assessments_between(start_date, end_date)
+        if progress_callback:
+            progress_callback(0, total)
+
+        completed = 0
+        with zipfile.ZipFile(partial_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for batch in db_manager.iter_assessments_between(start_date, end_date,
+                                                             batch_size=REPORT_EXPORT_BATCH_SIZE):
+                for assessment in batch:
+                    filename, text = _render_assessment_report(assessment)
+                    archive.writestr(filename, text)
+                completed += len(batch)
+                if progress_callback:
+                    progress_callback(completed, total)
+
+        os.replace(partial_path, archive_path)
+        print(f"Bulk report export {archive_id} complete: {completed} reports")
+        return archive_id, completed
+
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def register_report_routes(server):
+    """Register the bulk report download route on the Flask server"""
+    from flask import abort, send_file
+
+    @server.route('/reports/bulk/<archive_id>/download')
+    def download_bulk_reports(archive_id):
+        path = get_report_archive_path(archive_id)
+        if not path:
+            abort(404)
+        return send_file(path, mimetype='application/zip', as_attachment=True,
+                         download_name=f"Heart_Disease_Assessments_{datetime.now().strftime('%Y-%m-%d')}.zip")
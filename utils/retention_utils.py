@@ -0,0 +1,384 @@
+"""
+Retention Utilities
+Archives whole months of assessments to Parquet once they pass the retention period.
+
+Run one retention pass:                     python -m utils.retention_utils
+Partition an existing PostgreSQL table:     python -m utils.retention_utils migrate
+"""
+
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from utils.db_utils import db_manager, month_start, PARTITION_PREMAKE_MONTHS, SUBMISSION_DEDUP_WINDOW
+from utils.db_backends import partition_name, next_month
+
+try:
+    import fcntl
+except ImportError:
+    # Windows runs the app as a single process, so there is no other worker to keep out
+    fcntl = None
+
+# Whole months kept in the database before the current one; 0 keeps everything
+ASSESSMENT_RETENTION_MONTHS = int(os.getenv("ASSESSMENT_RETENTION_MONTHS", 0))
+ASSESSMENT_ARCHIVE_DIR = os.getenv("ASSESSMENT_ARCHIVE_DIR", os.path.join('archive', 'assessments'))
+RETENTION_CHECK_INTERVAL = int(os.getenv("RETENTION_CHECK_INTERVAL", 24 * 60 * 60))
+ARCHIVE_BATCH_SIZE = 5000
+
+# Give up on a detach rather than queue behind long-running queries; the next pass retries
+DETACH_LOCK_TIMEOUT = '5s'
+
+# Only one worker runs retention at a time (PostgreSQL session advisory lock key; on SQLite, a lock on this
+# file next to the database)
+RETENTION_LOCK_KEY = 0x56454E54
+RETENTION_LOCK_SUFFIX = '.retention.lock'
+
+ARCHIVE_COLUMNS = [
+    ('id', 'int64'), ('patient_name', 'string'), ('patient_id', 'string'),
+    ('age', 'int32'), ('sex', 'int32'), ('cp', 'int32'), ('trestbps', 'int32'), ('chol', 'int32'),
+    ('fbs', 'int32'), ('restecg', 'int32'), ('thalachh', 'int32'), ('exang', 'int32'),
+    ('oldpeak', 'float64'), ('slope', 'int32'), ('ca', 'int32'), ('thal', 'int32'),
+    ('risk_probability', 'float64'), ('risk_level', 'string'), ('assessment_date', 'timestamp'),
+    ('model_version', 'string')
+]
+
+
+def get_archive_path(month, sequence=1):
+    suffix = f"-{sequence}" if sequence > 1 else ""
+    return os.path.join(ASSESSMENT_ARCHIVE_DIR, f"{partition_name(month)}{suffix}.parquet")
+
+
+def next_archive_path(month):
+    """First unused archive path for a month; rows found in a month after it was archived go to a new file"""
+    sequence = 1
+    while os.path.exists(get_archive_path(month, sequence)):
+        sequence += 1
+    return get_archive_path(month, sequence)
+
+
+@contextmanager
+def exclusive_file_lock(path):
+    """Hold a non-blocking exclusive lock on path for the block; yields False when another process holds it"""
+    if fcntl is None:
+        yield True
+        return
+    with open(path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_parquet_archive(batches, path):
+    """Write batches of assessment rows to a new Parquet file, returning the number of rows written.
+    
+    Nothing is written for an empty month, and an existing archive is never replaced.
+    """
+    # pyarrow is only needed by the retention job, so it is not imported at app startup
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    types = {'int64': pa.int64(), 'int32': pa.int32(), 'float64': pa.float64(),
+             'string': pa.string(), 'timestamp': pa.timestamp('us')}
+    schema = pa.schema([(name, types[type_name]) for name, type_name in ARCHIVE_COLUMNS])
+    
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    part_path = f"{path}.part"
+    row_count = 0
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pq.ParquetWriter(part_path, schema, compression='zstd')
+            rows = [{name: row.get(name) for name, _ in ARCHIVE_COLUMNS} for row in batch]
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            row_count += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    if row_count:
+        if os.path.exists(path):
+            os.remove(part_path)
+            raise FileExistsError(f"Archive {path} already exists")
+        os.replace(part_path, path)
+    elif os.path.exists(part_path):
+        os.remove(part_path)
+    return row_count
+
+
+def _fetch_batches(cursor, batch_size=ARCHIVE_BATCH_SIZE):
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+        yield batch
+
+
+class RetentionJob:
+    def __init__(self, retention_months=ASSESSMENT_RETENTION_MONTHS, check_interval=RETENTION_CHECK_INTERVAL):
+        self.retention_months = retention_months
+        self.check_interval = check_interval
+        self._scheduler_started = False
+    
+    def get_cutoff(self, today=None):
+        """First day of the oldest month that is kept"""
+        cutoff = month_start(today or date.today())
+        for _ in range(self.retention_months):
+            cutoff = month_start(cutoff - timedelta(days=1))
+        return cutoff
+    
+    def run_once(self):
+        """Create upcoming partitions and purge stale submission keys, then archive every month older than the retention period"""
+        db_manager.ensure_partitions()
+        # Keys older than two dedup windows can no longer match a new submission
+        db_manager.purge_submissions(datetime.now() - timedelta(seconds=2 * SUBMISSION_DEDUP_WINDOW))
+        if self.retention_months <= 0:
+            return []
+        
+        cutoff = self.get_cutoff()
+        if db_manager.backend.supports_partitions:
+            archived = self._archive_partitions(cutoff)
+        else:
+            archived = self._archive_months(cutoff)
+        
+        # Archived rows leave the cohort cube and the stored population that percentiles are ranked against
+        if archived:
+            db_manager.rebuild_cohort_stats()
+            db_manager.rebuild_population_histogram()
+        return archived
+    
+    def _archive_partitions(self, cutoff):
+        """Detach each expired monthly partition, export it, then drop it (PostgreSQL)"""
+        conn = db_manager.get_connection()
+        if not conn:
+            return []
+        
+        archived = []
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (RETENTION_LOCK_KEY,))
+            if not cursor.fetchone()[0]:
+                cursor.close()
+                return []
+            
+            try:
+                # Includes partitions detached by an earlier pass that stopped before dropping them
+                cursor.execute(r"""
+                    SELECT c.relname, i.inhparent IS NOT NULL
+                    FROM pg_class c
+                    LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+                    WHERE c.relkind = 'r'
+                      AND c.relname ~ '^patients_y[0-9]{4}m[0-9]{2}$'
+                      AND pg_table_is_visible(c.oid)
+                    ORDER BY c.relname
+                """)
+                partitions = cursor.fetchall()
+                
+                for name, attached in partitions:
+                    month = date(int(name[10:14]), int(name[15:17]), 1)
+                    if month >= cutoff:
+                        continue
+                    
+                    # Both steps run in a transaction, so a failure rolls back in the finally below and no setting
+                    # outlives it on the pooled connection
+                    conn.autocommit = False
+                    if attached:
+                        # Metadata-only change; the lock timeout keeps it from stalling live queries
+                        cursor.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+                        cursor.execute(f"ALTER TABLE patients DETACH PARTITION {name}")
+                        conn.commit()
+                    
+                    # Stream the detached table out, then drop it in the same transaction
+                    db_manager.backend.lift_statement_timeout(cursor)
+                    export_cursor = db_manager.backend.streaming_cursor(conn, "partition_archive", ARCHIVE_BATCH_SIZE)
+                    export_cursor.execute(f"SELECT * FROM {name} ORDER BY assessment_date")
+                    archive_path = next_archive_path(month)
+                    row_count = write_parquet_archive(_fetch_batches(export_cursor), archive_path)
+                    export_cursor.close()
+                    
+                    cursor.execute(f"DROP TABLE {name}")
+                    cursor.execute("DELETE FROM daily_assessment_stats WHERE day >= %s AND day < %s",
+                                   (month, next_month(month)))
+                    conn.commit()
+                    conn.autocommit = True
+                    
+                    print(f"Archived partition {name} ({row_count} assessments) to {archive_path}")
+                    archived.append(name)
+            finally:
+                if not conn.autocommit:
+                    conn.rollback()
+                    conn.autocommit = True
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (RETENTION_LOCK_KEY,))
+                cursor.close()
+            
+            return archived
+        
+        except Exception as e:
+            print(f"Error archiving assessment partitions: {e}")
+            return archived
+        finally:
+            conn.close()
+    
+    def _oldest_assessment_before(self, cutoff):
+        conn = db_manager.get_connection()
+        if not conn:
+            return None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(db_manager.backend.sql("SELECT MIN(assessment_date) FROM patients WHERE assessment_date < %s"),
+                           (cutoff,))
+            oldest = cursor.fetchone()[0]
+            cursor.close()
+            return oldest
+        finally:
+            conn.close()
+    
+    def _archive_months(self, cutoff):
+        """Export each expired month, then remove it with a single range delete (SQLite)"""
+        archived = []
+        try:
+            # Every worker's scheduler runs a pass; the others skip it rather than export and delete the same month
+            with exclusive_file_lock(f"{db_manager.backend.path}{RETENTION_LOCK_SUFFIX}") as locked:
+                if not locked:
+                    return []
+                
+                oldest = self._oldest_assessment_before(cutoff)
+                # SQLite returns aggregates of timestamps as text
+                month = month_start(date.fromisoformat(str(oldest)[:10])) if oldest else cutoff
+                while month < cutoff:
+                    end = next_month(month)
+                    archive_path = next_archive_path(month)
+                    row_count = write_parquet_archive(
+                        db_manager.iter_assessments_between(month, end - timedelta(days=1), ARCHIVE_BATCH_SIZE),
+                        archive_path
+                    )
+                    if row_count:
+                        self._delete_month(month, end)
+                        print(f"Archived {row_count} assessments from {month:%Y-%m} to {archive_path}")
+                        archived.append(partition_name(month))
+                    month = end
+        except Exception as e:
+            print(f"Error archiving assessments: {e}")
+        return archived
+    
+    def _delete_month(self, month, end):
+        conn = db_manager.get_connection()
+        if not conn:
+            raise ConnectionError("Database connection unavailable")
+        try:
+            cursor = conn.cursor()
+            db_manager.backend.lift_statement_timeout(cursor)
+            cursor.execute(db_manager.backend.sql("DELETE FROM patients WHERE assessment_date >= %s AND assessment_date < %s"),
+                           (month, end))
+            cursor.execute(db_manager.backend.sql("DELETE FROM daily_assessment_stats WHERE day >= %s AND day < %s"),
+                           (month, end))
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def start_scheduler(self):
+        """Run a retention pass now and then every check_interval seconds on a background thread"""
+        if self._scheduler_started:
+            return
+        self._scheduler_started = True
+        threading.Thread(target=self._run_scheduler, name="assessment-retention", daemon=True).start()
+    
+    def _run_scheduler(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error running assessment retention: {e}")
+            time.sleep(self.check_interval)
+
+
+def migrate_to_partitions():
+    """Rebuild an existing unpartitioned PostgreSQL patients table as monthly partitions.
+    
+    Runs in one transaction and holds an exclusive lock on patients while rows are copied,
+    so schedule it in a maintenance window.
+    """
+    if not db_manager.backend.supports_partitions:
+        print("Monthly partitions are only used with PostgreSQL")
+        return False
+    
+    conn = db_manager.get_connection()
+    if not conn:
+        return False
+    
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('patients')")
+        if cursor.fetchone():
+            print("patients is already partitioned")
+            return True
+        
+        db_manager.backend.lift_statement_timeout(cursor)
+        cursor.execute("LOCK TABLE patients IN ACCESS EXCLUSIVE MODE")
+        cursor.execute("SELECT MIN(assessment_date) FROM patients")
+        oldest = cursor.fetchone()[0]
+        
+        # Free the old table's index and constraint names for the partitioned table
+        cursor.execute("ALTER TABLE patients RENAME TO patients_unpartitioned")
+        cursor.execute("ALTER TABLE patients_unpartitioned RENAME CONSTRAINT patients_pkey TO patients_unpartitioned_pkey")
+        cursor.execute("DROP INDEX IF EXISTS idx_patients_patient_id")
+        cursor.execute("DROP INDEX IF EXISTS idx_patients_assessment_date")
+        for statement in db_manager.backend.schema_statements:
+            cursor.execute(statement)
+        
+        months = [month_start(oldest or date.today())]
+        last_month = month_start(date.today())
+        for _ in range(PARTITION_PREMAKE_MONTHS):
+            last_month = next_month(last_month)
+        while months[-1] < last_month:
+            months.append(next_month(months[-1]))
+        cursor.execute(db_manager.backend.partition_statement(months))
+        
+        # The partition key cannot be NULL, so undated rows are filed under the migration date
+        columns = [name for name, _ in ARCHIVE_COLUMNS]
+        source_columns = ["COALESCE(assessment_date, CURRENT_TIMESTAMP)" if name == 'assessment_date' else name
+                          for name in columns]
+        cursor.execute(f"""
+            INSERT INTO patients ({", ".join(columns)})
+            SELECT {", ".join(source_columns)} FROM patients_unpartitioned
+        """)
+        copied = cursor.rowcount
+        cursor.execute("SELECT setval(pg_get_serial_sequence('patients', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM patients")
+        cursor.execute("DROP TABLE patients_unpartitioned")
+        conn.commit()
+        cursor.close()
+        
+        print(f"patients migrated to {len(months)} monthly partitions ({copied} assessments)")
+        return True
+    
+    except Exception as e:
+        print(f"Error migrating patients to monthly partitions: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+# Create a singleton instance
+retention_job = RetentionJob()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['migrate']:
+        migrate_to_partitions()
+    else:
+        archived = retention_job.run_once()
+        print(f"Retention pass complete: {len(archived)} months archived")
@@ -0,0 +1,135 @@
+"""
+Shadow Scoring Utilities
+Scores a challenger model on live traffic in the background and logs how it compares to the champion.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from utils.model_utils import load_bundle, scale_features
+
+# Registry version of the challenger model; shadow scoring is off when unset
+SHADOW_MODEL_VERSION = os.getenv("SHADOW_MODEL_VERSION")
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", 32))
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", 1))
+SHADOW_LOG_EVERY = int(os.getenv("SHADOW_LOG_EVERY", 50))
+LATENCY_WINDOW = 1000
+
+
+class ShadowScorer:
+    def __init__(self, version=SHADOW_MODEL_VERSION, max_pending=SHADOW_MAX_PENDING, workers=SHADOW_WORKERS):
+        self.version = version
+        self._workers = workers
+        self._executor = None
+        self._bundle = None
+        self._disabled = not version
+        # Bounds queued plus running work; submissions beyond it are dropped rather than queued
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._stats = {'scored': 0, 'agreed': 0, 'dropped': 0, 'failed': 0, 'abs_difference': 0.0}
+        self._champion_latencies = deque(maxlen=LATENCY_WINDOW)
+        self._challenger_latencies = deque(maxlen=LATENCY_WINDOW)
+    
+    def submit(self, features, champion_result, champion_latency):
+        """Queue the challenger for a prediction the champion already returned. Never blocks."""
+        if self._disabled:
+            return
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['dropped'] += 1
+            return
+        
+        try:
+            if self._executor is None:
+                with self._lock:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(max_workers=self._workers,
+                                                            thread_name_prefix="shadow-scorer")
+            self._executor.submit(self._score, list(features), champion_result, champion_latency)
+        except Exception as e:
+            self._slots.release()
+            print(f"Error submitting shadow prediction: {e}")
+    
+    def _load_challenger(self):
+        """Load the challenger on the shadow thread the first time it is needed"""
+        if self._bundle is None:
+            try:
+                self._bundle = load_bundle(self.version)
+                print(f"Shadow scoring enabled with challenger version {self.version}")
+            except Exception as e:
+                self._disabled = True
+                print(f"Error loading challenger model {self.version}, shadow scoring disabled: {e}")
+        return self._bundle
+    
+    def _score(self, features, champion_result, champion_latency):
+        try:
+            bundle = self._load_challenger()
+            if bundle is None:
+                return
+            
+            started = time.perf_counter()
+            scaled_features = scale_features(bundle.scaler, [features])
+            challenger_probability = float(bundle.model.predict_proba(scaled_features)[0][1])
+            challenger_latency = time.perf_counter() - started
+            
+            challenger_prediction = int(challenger_probability >= 0.5)
+            champion_probability = champion_result['risk_probability'] or float(champion_result['prediction'])
+            agreed = challenger_prediction == champion_result['prediction']
+            
+            with self._lock:
+                self._stats['scored'] += 1
+                self._stats['agreed'] += int(agreed)
+                self._stats['abs_difference'] += abs(challenger_probability - champion_probability)
+                self._champion_latencies.append(champion_latency)
+                self._challenger_latencies.append(challenger_latency)
+                should_log = self._stats['scored'] % SHADOW_LOG_EVERY == 0
+            
+            if not agreed:
+                print(f"Shadow disagreement: champion {champion_result['model_version']} "
+                      f"{champion_probability:.3f} vs challenger {self.version} {challenger_probability:.3f}")
+            if should_log:
+                self.log_summary()
+        
+        except Exception as e:
+            with self._lock:
+                self._stats['failed'] += 1
+            print(f"Error scoring shadow prediction: {e}")
+        finally:
+            self._slots.release()
+    
+    def get_stats(self):
+        """Return agreement and latency statistics for the challenger so far"""
+        with self._lock:
+            stats = dict(self._stats)
+            champion = np.array(self._champion_latencies) * 1000
+            challenger = np.array(self._challenger_latencies) * 1000
+        
+        scored = stats['scored']
+        summary = {
+            'challenger_version': self.version,
+            'scored': scored,
+            'dropped': stats['dropped'],
+            'failed': stats['failed'],
+            'agreement_rate': stats['agreed'] / scored if scored else None,
+            'mean_abs_probability_difference': stats['abs_difference'] / scored if scored else None
+        }
+        for name, latencies in (('champion', champion), ('challenger', challenger)):
+            summary[f'{name}_latency_p50_ms'] = float(np.percentile(latencies, 50)) if latencies.size else None
+            summary[f'{name}_latency_p95_ms'] = float(np.percentile(latencies, 95)) if latencies.size else None
+        return summary
+    
+    def log_summary(self):
+        stats = self.get_stats()
+        print(f"Shadow scoring ({stats['challenger_version']}): {stats['scored']} scored, "
+              f"{stats['agreement_rate']:.1%} agreement, "
+              f"mean |dp| {stats['mean_abs_probability_difference']:.3f}, "
+              f"latency p50 champion {stats['champion_latency_p50_ms']:.2f} ms / "
+              f"challenger {stats['challenger_latency_p50_ms']:.2f} ms, "
+              f"{stats['dropped']} dropped, {stats['failed']} failed")
+
+
+# Create a singleton instance
+shadow_scorer = ShadowScorer()
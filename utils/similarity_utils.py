@@ -0,0 +1,228 @@
+"""
+Similar Patient Utilities
+Finds the past patients nearest to a patient in the model's scaled feature space, from the training dataset and
+saved assessments.
+
+Each build is a k-d tree over every known feature vector, rebuilt on a background thread. Assessments this worker
+saves after a build are searched directly until the next build takes them in; the other workers' saves appear
+after the next scheduled rebuild.
+"""
+
+import os
+import csv
+import time
+import threading
+import numpy as np
+from utils.model_utils import predictor, scale_features, FEATURE_ORDER
+from utils.db_utils import db_manager
+from utils.drift_utils import TRAINING_DATA_PATH
+
+# Matches shown for a patient
+SIMILAR_PATIENT_COUNT = int(os.getenv("SIMILAR_PATIENT_COUNT", 5))
+# Seconds between rebuilds, picking up assessments saved by other workers
+SIMILARITY_REBUILD_INTERVAL = int(os.getenv("SIMILARITY_REBUILD_INTERVAL", 300))
+# Saves searched without the tree before a rebuild is started early
+SIMILARITY_PENDING_LIMIT = int(os.getenv("SIMILARITY_PENDING_LIMIT", 5000))
+
+# Nearest rows fetched per match wanted, leaving room to skip repeat visits of one patient
+CANDIDATE_FACTOR = 4
+# Most rows read for one search
+MAX_CANDIDATES = 1000
+
+
+class SimilaritySnapshot:
+    """One build of the index: a k-d tree over the training rows followed by the saved assessments, scaled with
+    the model version it was built for. Never modified once live."""
+    
+    def __init__(self, version, scaler, training_features, training_targets, assessment_keys, assessment_features):
+        # scipy is only needed once a build runs, so it stays off the import path of every worker's cold start
+        from scipy.spatial import cKDTree
+        
+        self.version = version
+        self.scaler = scaler
+        self.training_features = training_features
+        self.training_targets = training_targets
+        # (id, assessment_date) of each saved assessment, in tree order after the training rows
+        self.assessment_keys = assessment_keys
+        
+        rows = np.vstack([training_features, assessment_features])
+        self.size = len(rows)
+        self.tree = cKDTree(scale_features(scaler, rows), balanced_tree=False, compact_nodes=False) if self.size else None
+    
+    def nearest(self, point, count):
+        """(distance, row) pairs for the count rows nearest to a scaled point"""
+        count = min(count, self.size)
+        if not count:
+            return []
+        distances, rows = self.tree.query(point, k=count)
+        return list(zip(np.atleast_1d(distances), np.atleast_1d(rows)))
+
+
+class SimilarityIndex:
+    def __init__(self, data_path=TRAINING_DATA_PATH):
+        self.data_path = data_path
+        self._snapshot = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._rebuild_requested = threading.Event()
+        self._scheduler_started = False
+        self._training = None
+    
+    def _load_training(self):
+        """Training feature rows and their diagnoses"""
+        if self._training is None:
+            with open(self.data_path, newline='') as f:
+                rows = list(csv.DictReader(f))
+            self._training = (np.array([[float(row[key]) for key in FEATURE_ORDER] for row in rows]),
+                              np.array([int(row['target']) for row in rows]))
+        return self._training
+    
+    def rebuild(self):
+        """Build a new tree from the training data and every stored assessment, then swap it in"""
+        with self._build_lock:
+            return self._build()
+    
+    def _build(self):
+        """Build under _build_lock"""
+        predictor.ensure_loaded()
+        version, scaler = predictor.model_version, predictor.scaler
+        if scaler is None:
+            print("Model or scaler not loaded properly!")
+            return False
+        
+        try:
+            # Saves recorded before this point are committed, so the read below includes them
+            started = time.time()
+            training_features, training_targets = self._load_training()
+            
+            assessment_keys = []
+            batches = []
+            for batch in db_manager.iter_feature_vectors(FEATURE_ORDER):
+                assessment_keys.extend((row[0], row[1]) for row in batch)
+                batches.append(np.array([row[2:] for row in batch], dtype=float))
+            features = np.vstack(batches) if batches else np.empty((0, len(FEATURE_ORDER)))
+            
+            snapshot = SimilaritySnapshot(
+                version, scaler, training_features, training_targets, assessment_keys, features
+            )
+        except Exception as e:
+            print(f"Error building similar patient index: {e}")
+            return False
+        
+        with self._lock:
+            self._snapshot = snapshot
+            self._pending = [entry for entry in self._pending if entry[0] >= started]
+        
+        print(f"Similar patient index built over {snapshot.size} patients in {time.time() - started:.1f}s")
+        return True
+    
+    def snapshot(self):
+        """The live build, or None while the first one is still running on the scheduler's thread"""
+        if self._snapshot is None:
+            # Never build on the calling (request) thread
+            self.start_scheduler()
+        elif self._snapshot.version != predictor.model_version:
+            # A different model scales features differently; keep answering with the old build meanwhile
+            self._rebuild_requested.set()
+        return self._snapshot
+    
+    def add(self, patient, prediction_data):
+        """Make a just-saved assessment searchable before the next rebuild"""
+        features = [float(patient[key]) for key in FEATURE_ORDER]
+        assessment = dict(patient,
+                          risk_probability=prediction_data['risk_probability'] * 100,
+                          risk_level=prediction_data['risk_level'])
+        with self._lock:
+            self._pending.append((time.time(), features, assessment))
+            if len(self._pending) > SIMILARITY_PENDING_LIMIT:
+                self._rebuild_requested.set()
+    
+    def find_similar(self, patient, count=SIMILAR_PATIENT_COUNT):
+        """The count past patients nearest to patient, closest first, skipping the patient's own visits.
+        
+        Saved assessments appear once per patient ID, at their nearest visit. None while the index is warming up.
+        """
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return None
+        
+        features = np.asarray([[float(patient[key]) for key in FEATURE_ORDER]])
+        point = scale_features(snapshot.scaler, features)[0]
+        
+        pending_matches = []
+        pending = list(self._pending)
+        if pending:
+            scaled = scale_features(snapshot.scaler, [entry[1] for entry in pending])
+            distances = np.sqrt(((scaled - point) ** 2).sum(axis=1))
+            for distance, (_, _, assessment) in zip(distances, pending):
+                pending_matches.append({'source': 'assessment', 'distance': float(distance), 'patient': assessment})
+        
+        # Widen the search while repeat visits of the same patients crowd out the rest
+        wanted = count * CANDIDATE_FACTOR
+        while True:
+            candidates = snapshot.nearest(point, wanted)
+            similar = self._distinct_patients(self._resolve(snapshot, candidates) + pending_matches,
+                                              patient.get('patient_id'), count)
+            if len(similar) == count or len(candidates) < wanted or wanted >= MAX_CANDIDATES:
+                return similar
+            wanted = min(wanted * CANDIDATE_FACTOR, MAX_CANDIDATES)
+    
+    def _resolve(self, snapshot, candidates):
+        """Turn (distance, row) pairs into matches, reading saved assessments in one query"""
+        training_size = len(snapshot.training_features)
+        assessments = db_manager.get_assessments_by_keys(
+            [snapshot.assessment_keys[row - training_size] for _, row in candidates if row >= training_size]
+        )
+        
+        matches = []
+        for distance, row in candidates:
+            if row < training_size:
+                matches.append({
+                    'source': 'training',
+                    'distance': float(distance),
+                    'patient': dict(zip(FEATURE_ORDER, snapshot.training_features[row].tolist())),
+                    'target': int(snapshot.training_targets[row])
+                })
+            else:
+                # Rows deleted since the build are skipped
+                assessment = assessments.get(snapshot.assessment_keys[row - training_size][0])
+                if assessment:
+                    matches.append({'source': 'assessment', 'distance': float(distance), 'patient': assessment})
+        return matches
+    
+    def _distinct_patients(self, matches, own_patient_id, count):
+        """The count closest matches, keeping only the nearest visit of each saved patient"""
+        similar = []
+        seen_patient_ids = {own_patient_id}
+        for match in sorted(matches, key=lambda match: match['distance']):
+            if match['source'] == 'assessment':
+                patient_id = match['patient']['patient_id']
+                if patient_id in seen_patient_ids:
+                    continue
+                seen_patient_ids.add(patient_id)
+            similar.append(match)
+            if len(similar) == count:
+                break
+        return similar
+    
+    def start_scheduler(self):
+        """Build the index, then rebuild it every SIMILARITY_REBUILD_INTERVAL seconds on a background thread"""
+        with self._lock:
+            if self._scheduler_started:
+                return
+            self._scheduler_started = True
+        threading.Thread(target=self._run_scheduler, name="similarity-index", daemon=True).start()
+    
+    def _run_scheduler(self):
+        while True:
+            try:
+                self.rebuild()
+            except Exception as e:
+                print(f"Error rebuilding similar patient index: {e}")
+            self._rebuild_requested.wait(SIMILARITY_REBUILD_INTERVAL)
+            self._rebuild_requested.clear()
+
+
+# Create a singleton instance
+similarity_index = SimilarityIndex()
@@ -0,0 +1,187 @@
+"""
+Queued Submission Utilities
+Accepts patient assessments in batches from the browser's submission outbox.
+
+The patient form keeps every validated submission in IndexedDB (assets/submission_queue.js) until the server
+confirms it was saved. Whatever the form's own callback did not confirm - a timeout on flaky Wi-Fi, an offline
+tablet - is posted to SUBMISSION_BATCH_PATH with backoff once the connection returns, and predicted and saved
+here in one inference call and one transaction. Both paths date a submission by the time it was made in the
+browser, so a queued copy of an assessment the callback did save falls in its dedup window and is recognised as a
+repeat, and a queued assessment is dated when it was made rather than when the outbox was flushed.
+"""
+
+import os
+import time
+from datetime import datetime
+from utils.model_utils import predictor, FEATURE_ORDER
+from utils.db_utils import db_manager, make_idempotency_key
+from utils.cohort_utils import cohort_ranker
+from utils.similarity_utils import similarity_index
+
+SUBMISSION_BATCH_PATH = '/api/submissions/batch'
+
+# Most submissions processed in one request; the rest come back as failed and the browser sends them next, in
+# batches of the limit the response reports
+SUBMISSION_BATCH_LIMIT = int(os.getenv("SUBMISSION_BATCH_LIMIT", 50))
+
+# Oldest submission the outbox is expected to hold, in seconds; a browser clock further behind than this is not
+# trusted to date an assessment
+SUBMISSION_MAX_AGE = int(os.getenv("SUBMISSION_MAX_AGE", 7 * 24 * 60 * 60))
+
+# Longest patient name and ID the patients table holds
+TEXT_FIELD_LENGTHS = {'patient_name': 255, 'patient_id': 100}
+
+# Field ranges for validation
+FIELD_RANGES = {
+    'age': (1, 120),
+    'sex': (0, 1),
+    'cp': (0, 3),
+    'trestbps': (50, 250),
+    'chol': (30, 1000),
+    'fbs': (0, 1),
+    'restecg': (0, 2),
+    'thalachh': (40, 220),
+    'exang': (0, 1),
+    'oldpeak': (0, 6.2),
+    'slope': (0, 2),
+    'ca': (0, 4),
+    'thal': (0, 3)
+}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_time(value):
+    return _is_number(value) and 0 < value < float('inf')
+
+
+def submission_date(submitted_at):
+    """When a submission was made, from the browser's milliseconds since the epoch.
+    
+    A browser clock running ahead cannot date an assessment in the future, and a missing time or one more than
+    SUBMISSION_MAX_AGE in the past is replaced by the server's.
+    """
+    now = time.time()
+    if not _is_time(submitted_at) or submitted_at / 1000 < now - SUBMISSION_MAX_AGE:
+        return datetime.fromtimestamp(now)
+    return datetime.fromtimestamp(min(submitted_at / 1000, now))
+
+
+def validate_submission(submission):
+    """Errors in a queued submission by field; empty when it can be saved"""
+    if not isinstance(submission, dict):
+        return {'submission': "Not an object"}
+    
+    errors = {}
+    for field in ('client_id', 'patient_name', 'patient_id'):
+        value = submission.get(field)
+        if not isinstance(value, str) or not value.strip():
+            errors[field] = "Required field"
+        elif len(value.strip()) > TEXT_FIELD_LENGTHS.get(field, len(value)):
+            errors[field] = f"At most {TEXT_FIELD_LENGTHS[field]} characters"
+    submitted_at = submission.get('submitted_at')
+    if not _is_number(submitted_at):
+        errors['submitted_at'] = "Required field"
+    elif not _is_time(submitted_at):
+        errors['submitted_at'] = "Not a valid time"
+    
+    for field in FEATURE_ORDER:
+        value = submission.get(field)
+        min_val, max_val = FIELD_RANGES[field]
+        if value is None:
+            errors[field] = "Required field"
+        elif not _is_number(value) or not min_val <= value <= max_val:
+            errors[field] = f"Range: {min_val} - {max_val}"
+    return errors
+
+
+def _patient_record(submission):
+    """Patient data as saved to the database"""
+    record = {key: submission[key] for key in FEATURE_ORDER}
+    record['patient_name'] = submission['patient_name'].strip()
+    record['patient_id'] = submission['patient_id'].strip()
+    return record
+
+
+def process_submission_batch(submissions):
+    """Validate, predict and save queued submissions; returns one result per submission, in order.
+    
+    Each result has the submission's client_id and a status: 'saved', 'duplicate' (saved before), 'invalid'
+    (never retried) or 'failed' (worth retrying later). Duplicates are answered from the stored result without
+    being scored again, so a replayed batch is not counted twice by the drift monitor or shadow scorer.
+    """
+    results = [None] * len(submissions)
+    # (index, patient record, features, idempotency key, assessment date) of each submission to score and save
+    pending = []
+    for index, submission in enumerate(submissions):
+        errors = validate_submission(submission)
+        if errors:
+            client_id = submission.get('client_id') if isinstance(submission, dict) else None
+            results[index] = {'client_id': client_id, 'status': 'invalid', 'errors': errors}
+            continue
+        if not db_manager.is_available():
+            # Nowhere to save it, so it is not scored either
+            results[index] = {'client_id': submission['client_id'], 'status': 'failed'}
+            continue
+        
+        record = _patient_record(submission)
+        features = [record[key] for key in FEATURE_ORDER]
+        idempotency_key = make_idempotency_key(record['patient_id'], features)
+        assessment_date = submission_date(submission['submitted_at'])
+        stored_result = db_manager.get_submission(idempotency_key, assessment_date)
+        if stored_result:
+            results[index] = {
+                'client_id': submission['client_id'],
+                'status': 'duplicate',
+                'risk_level': stored_result['risk_level'],
+                'risk_probability': stored_result['risk_probability']
+            }
+        else:
+            pending.append((index, record, features, idempotency_key, assessment_date))
+    
+    if not pending:
+        return results
+    
+    predictions = predictor.predict_batch([features for _, _, features, _, _ in pending])
+    if predictions is None:
+        statuses = ['failed'] * len(pending)
+    else:
+        statuses = db_manager.save_patient_assessments([
+            (record, prediction, idempotency_key, assessment_date)
+            for (_, record, _, idempotency_key, assessment_date), prediction in zip(pending, predictions)
+        ])
+    
+    for position, ((index, record, _, _, _), status) in enumerate(zip(pending, statuses)):
+        result = {'client_id': submissions[index]['client_id'], 'status': status}
+        if predictions is not None:
+            prediction = predictions[position]
+            result.update(risk_level=prediction['risk_level'], risk_probability=prediction['risk_probability'])
+            if status == 'saved':
+                cohort_ranker.record(dict(record, risk_probability=prediction['risk_probability'] * 100))
+                similarity_index.add(record, prediction)
+        results[index] = result
+    
+    print(f"Queued submission batch: {len(submissions)} received, {statuses.count('saved')} saved")
+    return results
+
+
+def register_submission_routes(server):
+    """Register the batched submission route on the Flask server"""
+    from flask import jsonify, request
+    
+    @server.route(SUBMISSION_BATCH_PATH, methods=['POST'])
+    def submit_batch():
+        payload = request.get_json(silent=True)
+        submissions = payload.get('submissions') if isinstance(payload, dict) else None
+        if not isinstance(submissions, list):
+            return jsonify({'error': "Expected a JSON object with a submissions list"}), 400
+        
+        # Past the limit nothing is processed; the browser learns the limit and sends those again right away
+        overflow = [
+            {'client_id': submission.get('client_id') if isinstance(submission, dict) else None, 'status': 'failed'}
+            for submission in submissions[SUBMISSION_BATCH_LIMIT:]
+        ]
+        results = process_submission_batch(submissions[:SUBMISSION_BATCH_LIMIT]) + overflow
+        return jsonify({'results': results, 'batch_limit': SUBMISSION_BATCH_LIMIT})
@@ -0,0 +1,42 @@
+"""
+What-If Utilities
+Scores grids of perturbed feature vectors to show how risk responds to modifiable factors.
+"""
+
+import numpy as np
+from utils.model_utils import predictor, FEATURE_ORDER
+
+# Modifiable factors offered in the what-if panel
+WHATIF_FIELDS = ['chol', 'trestbps', 'thalachh', 'oldpeak']
+
+# Grid resolution for curves and heatmaps
+CURVE_POINTS = 200
+SURFACE_POINTS = 40
+
+
+def sensitivity_curve(features, field, value_range, points=CURVE_POINTS):
+    """Risk probability as one field sweeps its range with all other inputs held fixed, and at the current inputs"""
+    values = np.linspace(value_range[0], value_range[1], points)
+    # One extra row, left at the current inputs, so the current risk comes from the same batch
+    grid = np.tile(np.asarray(features, dtype=float), (points + 1, 1))
+    grid[:points, FEATURE_ORDER.index(field)] = values
+
+    risk = predictor.predict_proba_batch(grid)
+    if risk is None:
+        return None
+    return {'x': values.tolist(), 'risk': risk[:points].tolist(), 'current_risk': float(risk[points])}
+
+
+def sensitivity_surface(features, x_field, x_range, y_field, y_range, points=SURFACE_POINTS):
+    """Risk probability over a grid of two fields with all other inputs held fixed"""
+    x_values = np.linspace(x_range[0], x_range[1], points)
+    y_values = np.linspace(y_range[0], y_range[1], points)
+    grid = np.tile(np.asarray(features, dtype=float), (points * points, 1))
+    # Row-major grid so the scores reshape into [y][x] for a heatmap
+    grid[:, FEATURE_ORDER.index(x_field)] = np.tile(x_values, points)
+    grid[:, FEATURE_ORDER.index(y_field)] = np.repeat(y_values, points)
+
+    risk = predictor.predict_proba_batch(grid)
+    if risk is None:
+        return None
+    return {'x': x_values.tolist(), 'y': y_values.tolist(), 'risk': risk.reshape(points, points).tolist()}